@@ -1,16 +1,32 @@
 import re, collections
-from nltk.util import ngrams
-from nltk import bigrams, trigrams
-from nltk.translate import PhraseTable, StackDecoder 
+from nltk.translate import PhraseTable
 import pandas as pd
-from collections import Counter, defaultdict
-from itertools import chain
+from itertools import chain, product
 from operator import itemgetter
-from math import *
-from alignments import *
+from ViterbiDecoder import ViterbiDecoder
+from decode_budget import DecodeBudget, BudgetStackDecoder
+from model_store import hash_source, is_loadable, is_stale, save_model, load_model
+from ngram_table import Vocabulary, NgramTable, NgramCounts, CompactPhraseTable, count_shard, merge_shards
 import logging
+import metrics
+import profiling
+import diagnostics
+from diagnostics import OovStatistics
+import copy
+import multiprocessing
+import time
+import bisect
+import hashlib
+import json
+import os
 from nltk.tokenize import word_tokenize
 
+DECODE_SECONDS = metrics.histogram('decode_seconds', 'Decoding time per sentence')
+OOV_RESOLUTION_HITS = metrics.counter('oov_resolution_cache_hits_total', 'Unknown words resolved out of the OOV resolution cache')
+OOV_RESOLUTION_MISSES = metrics.counter('oov_resolution_cache_misses_total', 'Unknown words resolved via the heuristic')
+
+logger = diagnostics.get_logger(__name__)
+
 """
 This class contains the corpus with all relevant parallel sentences and methods towards creating an N-gram based machine translation 
 
@@ -21,17 +37,19 @@ class Corpora:
     Parameters
     ----------
     path : str 
-        The file location for the parallel data
+        The file location for the parallel data, None creates an untrained instance (used by load)
+    decoder : str
+        The decoder engine used for the translation: "stack" (nltk StackDecoder) or "viterbi" (monotone ViterbiDecoder)
+    learn : bool
+        "Learn during run" mode: words found only in the target language while translating are added to the model.
+        Otherwise the model is not changed after the training and one instance can serve concurrent translations.
+    training_workers : int
+        Number of processes counting the n-grams of the training data in shards, the result is the same as with one process
     """  
-    def __init__(self, path):
+    def __init__(self, path, decoder='stack', learn=False, training_workers=1):
         self.orig_orth = [] # contains the parallel data
         self.orig = [] # contains the source language data
         self.orth = [] # will be further anlayzed via language model
-        
-        # will be used in for the target language modelling 
-        self.unigrams_orth = []
-        self.bigrams_orth = []
-        self.trigrams_orth = []
 
         self.not_same_len_gram = []
         self.refactored = []
@@ -41,45 +59,149 @@ class Corpora:
         self.hashtag_list = []
         self.error_list = []
 
-        self.word_dict = [] # single word alignment based on equivalent index position of each sentence
-        self.tupel_word_dict = []
         self.lookup_dict = {} # lookup dict consists of unigrams probability per key (= orig word in the source language)
         self.lookup_bigrams = {} # lookup dict consists of bigrams probability per key (= bigram in the source language)
         self.lookup_trigrams = {} # lookup dict consists of trigrams probability per key (= trigram in the source language
+        self.target_vocabulary = set() # all orth forms that appear as a translation in the lookup_dict
+        self.target_vocabulary_lower = {} # lowered orth form -> orth form, for case insensitive lookups
 
-        self.general_bigrams = []
-        self.general_trigrams = []
-        self.slash_list = []
-
-        self.tagged_sentences = []
-
-        self.align_words_list = []
-
-        self.fixed_oov = []
-        self.oov = []
+        self.oov_statistics = OovStatistics() # gained back and remaining OOV words of the translated sentences
+        self.oov_resolutions = {} # raw unknown word -> (category, resolved form), see resolve_oov
 
+        self.decoder_name = decoder
+        self.learn_during_run = learn
+        self.decode_limits = (None, None) # seconds and hypotheses of the search per sentence, see set_decode_budget
+        self.training_workers = training_workers
+        self.orth_counts = {} # trigram counts of the orth sentences for the language model, see create_ngram_tables
         self.unknown_tag = '<UNK>'
         self.punctuation_regex = re.compile('(\.|\,|!|\?)')
         
-        # creating logger
-        root_logger = logging.getLogger()
-        root_logger.setLevel(logging.DEBUG) 
-        handler = logging.FileHandler('corpora.log', 'w', 'utf-8') 
-        formatter = logging.Formatter('%(message)s') 
-        handler.setFormatter(formatter) 
-        root_logger.addHandler(handler)
+        diagnostics.setup_logging() # only the first instance of the process installs the handler
         
+        self.vocabulary = Vocabulary() # integer ids of all words of the compact tables, see ngram_table
         self.phrase_table = PhraseTable()
+        self.language_prob = {}
+        self.source_hash = None # hash of the parallel data file, used for detecting a stale saved model
+        self.delta_hashes = [] # hashes of the parallel sentences added after the training, see add_parallel_sentences
+
+        # vowel_table for the heuristic method
+        self.vowel_table = {}
+        self.vowel_index = {} # dialect variant -> [(rank, category, resolved form)], the inverse of the vowel_table, see create_vowel_index
+
+        if path is None:
+            return
+
+        self.source_hash = hash_source(path)
+        training_start = time.time()
         self.automatize_calls(path)
         self.language_model = self.create_language_model() 
-        self.create_stack_decoder()
+        self.create_decoder()
   
         self.references_general = [item.split() for item in self.orth] # creating the references list consisting of the whole corpus for the BLEU score
 
-        # vowel_table for the heuristic method
-        self.vowel_table = {}
         self.create_vowel_table()
-            
+        self.create_vowel_index()
+        if logger.isEnabledFor(logging.DEBUG):
+            self.report_vowel_index_recall(set(chain(*[item.split() for item in self.orig])))
+        self.release_training_data()
+        logger.info('Training took %f seconds with %d worker(s)', time.time() - training_start, self.training_workers)
+        metrics.gauge('training_seconds', 'Duration of the training').set(time.time() - training_start)
+
+    """Saves the trained model (lookup dictionaries, language model, vowel_table and references) into a directory.
+    See model_store for the format.
+
+    Parameters
+    ----------
+    path : str 
+        The directory to save the model into
+    """
+    def save(self, path):
+        save_model(self, path)
+
+    """Identifies the trained model: the hash of the parallel data, combined with the hashes of the sentences added afterwards.
+
+    Returns
+    -------
+    str
+    """
+    def model_hash(self):
+        if not self.delta_hashes:
+            return self.source_hash
+        return hashlib.sha256(':'.join([str(self.source_hash)] + self.delta_hashes).encode('utf-8')).hexdigest()
+
+    """Identifies the trained model and the decoding settings, translations of the same fingerprint are interchangeable.
+
+    Returns
+    -------
+    str
+        hash of the model, the decoder engine and the learning mode
+    """
+    def fingerprint(self):
+        return str(self.model_hash()) + ':' + self.decoder_name + (':learn' if self.learn_during_run else '')
+
+    """Loads a model saved via save without retraining.
+    The phrase table, target vocabulary and decoder are rebuilt out of the loaded lookup dictionaries.
+
+    Parameters
+    ----------
+    path : str 
+        The directory of the saved model
+    decoder : str
+        The decoder engine used for the translation
+    learn : bool
+        "Learn during run" mode, see the constructor
+
+    Returns
+    -------
+    Corpora
+        the loaded corpus, ready for translation
+    """
+    @classmethod
+    def load(cls, path, decoder='stack', learn=False):
+        corpus = cls(None, decoder, learn)
+        load_model(corpus, path)
+        corpus.create_target_vocabulary()
+        corpus.create_vowel_index()
+        corpus.create_phrase_table()
+        corpus.language_model = corpus.build_language_model()
+        corpus.create_decoder()
+        corpus.references_general = [item.split() for item in corpus.orth]
+        return corpus
+
+    """Loads the saved model if it is up to date with the parallel data, otherwise trains a new one and saves it.
+    If the parallel data is missing, the saved model is loaded without the check (a warning is printed).
+
+    Parameters
+    ----------
+    model_path : str 
+        The directory of the saved model
+    source_path : str 
+        The file location for the parallel data
+    decoder : str
+        The decoder engine used for the translation
+    learn : bool
+        "Learn during run" mode, see the constructor
+    training_workers : int
+        Number of processes used if the model is trained, see the constructor
+
+    Returns
+    -------
+    Corpora
+    """
+    @classmethod
+    def load_or_train(cls, model_path, source_path, decoder='stack', learn=False, training_workers=1):
+        if not os.path.exists(source_path) and is_loadable(model_path):
+            print('Warning: parallel data', source_path, 'is missing, loading the saved model from', model_path, 'without checking whether it is up to date')
+            return cls.load(model_path, decoder, learn)
+
+        if not is_stale(model_path, source_path):
+            print('Loading the saved model from', model_path)
+            return cls.load(model_path, decoder, learn)
+
+        print('Saved model in', model_path, 'is missing or stale, training from', source_path)
+        corpus = cls(source_path, decoder, learn, training_workers)
+        corpus.save(model_path)
+        return corpus
  
 
     """This function calls all the needed functions for creating the
@@ -93,16 +215,11 @@ class Corpora:
         self.read_data_pandas(path)
         self.mainlist_statistics()
         self.handle_diff_lengths()
-        self.create_word_dict()
-        self.occurence_word_list = self.create_tupeldic()
-        self.create_lookup_dict()
         self.info_printer()
-        
-        # bigrams
-        self.create_bigrams()
 
-        # trigrams
-        self.create_trigrams()
+        # uni-, bi- and trigrams counted in bulk
+        self.create_ngram_tables(self.training_workers)
+        self.create_target_vocabulary()
 
         # create phrase table for further use in the StackDecoder
         self.create_phrase_table()
@@ -126,21 +243,31 @@ class Corpora:
         data.head() # defining the first (index 0) row as our head
 
         for first_row, second_row in zip(data.sentorig, data.sentorth):
-            row = [first_row, second_row]
-            ### filtering out the timer signs, scene descriptions - [lachen] and (?) ###
-            row = [re.sub(r"\[\d+((,|\.)\d+)?s\]|\[[a-zA-ZäöüÄÖÜß]+\]|\(\?\)", "", word) for word in row]
-            row = [re.sub(r"(  )( )*", " ", word) for word in row]
-                
-            if ((re.search(r"\\", row[0]) or not re.search(r"#", row[0])) and re.search(r"#", row[1])): 
-                self.error_list.append(row)
-            else:
-                self.orig_orth.append(row)
+            self.add_data_row(first_row, second_row)
 
-            if (re.search(r"(\d)*/", row[0]) or re.search(r"(\d)*/", row[1])):
-                self.slash_list.append(row)
-                
-            if (re.search(r"#", row[0]) or re.search(r"#", row[1])):
-                self.hashtag_list.append(row)
+    """Cleans one pair of original <-> orthographic sentence and sorts it into the lists described in read_data_pandas
+
+    Parameters
+    ----------
+    first_row : str - the original sentence
+    second_row : str - the orthographic sentence
+    """
+    def add_data_row(self, first_row, second_row):
+        row = [first_row, second_row]
+        ### filtering out the timer signs, scene descriptions - [lachen] and (?) ###
+        row = [re.sub(r"\[\d+((,|\.)\d+)?s\]|\[[a-zA-ZäöüÄÖÜß]+\]|\(\?\)", "", word) for word in row]
+        row = [re.sub(r"(  )( )*", " ", word) for word in row]
+            
+        if ((re.search(r"\\", row[0]) or not re.search(r"#", row[0])) and re.search(r"#", row[1])): 
+            self.error_list.append(row)
+        else:
+            self.orig_orth.append(row)
+
+        if (re.search(r"(\d)*/", row[0]) or re.search(r"(\d)*/", row[1])):
+            self.slash_list.append(row)
+            
+        if (re.search(r"#", row[0]) or re.search(r"#", row[1])):
+            self.hashtag_list.append(row)
 
     
     """Prints out statistical information about the data:
@@ -169,8 +296,8 @@ class Corpora:
             if (item[0] == item[1].lower()):
                 self.capital_letter_correction_gram.append(item)
                
-        logging.debug('Not of the same length: %d', len(self.not_same_len_gram))
-        logging.debug('Capital letter correction: %d', len(self.capital_letter_correction_gram))
+        logger.info('Not of the same length: %d', len(self.not_same_len_gram))
+        logger.info('Capital letter correction: %d', len(self.capital_letter_correction_gram))
 
     """With this algorithm more than 5% of the usable input data can be gained back.
     The main reason for having parallel sentences of different lengths is due to the fragments created during transcribing.
@@ -186,8 +313,8 @@ class Corpora:
     not_same_len_gram : [[str, str]] - the items of the refactored list are removed 
     """
     def handle_diff_lengths(self):
-        logging.debug('{} not same length before refactoring.'.format(len(self.not_same_len_gram)))
-        logging.debug('{} same length before refactoring.'.format(len(self.orig_orth)))
+        logger.info('%d not same length before refactoring.', len(self.not_same_len_gram))
+        logger.info('%d same length before refactoring.', len(self.orig_orth))
         print(len(self.not_same_len_gram), ' parallel sets are now in the not_same_len_gram list\n' , len(self.orig_orth) ,' parallel sets are now in the main list')
 
         for parallel_set in reversed(self.not_same_len_gram):
@@ -214,8 +341,8 @@ class Corpora:
                     if (index == 0 and len(orig) != len(orth)):
                         handled = True
    
-        logging.debug('{} not same length after refactoring.'.format(len(self.not_same_len_gram)))
-        logging.debug('{} same length after refactoring.'.format(len(self.orig_orth)))
+        logger.info('%d not same length after refactoring.', len(self.not_same_len_gram))
+        logger.info('%d same length after refactoring.', len(self.orig_orth))
 
     """Prints out additional information regarding the input data
     """
@@ -223,244 +350,604 @@ class Corpora:
         self.orig = [item[0] for item in self.orig_orth]
         self.orth = [item[1] for item in self.orig_orth]
 
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+
         dialect_words_counter = collections.Counter([word for sentence in self.orig for word in sentence.split()])
         high_german_words_counter = collections.Counter([word for sentence in self.orth for word in sentence.split()])
 
-        logging.debug('=========================\n{} Dialect words.'.format(len([word for sentence in self.orig for word in sentence.split()])))
-        logging.debug('{} unique Dialect words.'.format(len(dialect_words_counter)))
-        logging.debug('=========================')
-        logging.debug('{} High-German words.'.format(len([word for sentence in self.orth for word in sentence.split()])))
-        logging.debug('{} unique High-German words.'.format(len(high_german_words_counter)))
+        logger.debug('=========================\n%d Dialect words.', sum(dialect_words_counter.values()))
+        logger.debug('%d unique Dialect words.', len(dialect_words_counter))
+        logger.debug('=========================')
+        logger.debug('%d High-German words.', sum(high_german_words_counter.values()))
+        logger.debug('%d unique High-German words.', len(high_german_words_counter))
        
-    """Creating a global word dictionary for a quick lookup.
-    Sentences not of the same length are excluded.
-    This data structure serves as a middle step towards creating a machine translation.
-    The word alignment happens here based on the similar index in the sentence.
+    """Creates the target vocabulary index out of the lookup dictionary.
+    The index allows a constant time check whether a word appears in the target language (orth form),
+    instead of iterating over all values of the lookup_dict for each word.
 
     Data changed
     ------------
-    word_dict : [[str, str]] - holds the word in the source and target language
+    target_vocabulary : {str} - all orth forms that appear as a translation in the lookup_dict
+    target_vocabulary_lower : {str: str} - the lowered orth form pointing to the orth form, e.g. "leute": "Leute"
     """
-    def create_word_dict(self):
-        for item in self.orig_orth:
-            orig = item[0].split()
-            orth = item[1].split()
+    def create_target_vocabulary(self):
+        for item in self.lookup_dict:
+            for option in self.lookup_dict[item]:
+                self.add_target_word(option[0])
 
-            index = 0
-            for i in range(len(orig) - 1):
-                if (len(orig) == len(orth) and len(orig[i]) > 0):   
-                    self.word_dict.append([orig[i], orth[i]])
+    """Adds a single word to the target vocabulary index.
+    The first seen orth form is kept for the lowered lookup.
+
+    Parameters
+    ----------
+    word : str - the orth form to be added
+    """
+    def add_target_word(self, word):
+        self.target_vocabulary.add(word)
+        if word.lower() not in self.target_vocabulary_lower:
+            self.target_vocabulary_lower[word.lower()] = word
+
+    """Checks if a word appears in the target language.
+
+    Parameters
+    ----------
+    word : str - the word to look up in its exact form
 
-    """Creates unigrams tupels
-       
     Returns
     -------
-    Counter collection
-            { (orig, orth): number of occurences }     
-            
+    bool
+        True if the word is a known orth form
     """
-    def create_tupeldic(self):
-        for entry in self.word_dict:
-            self.tupel_word_dict.append([(entry[0], entry[1])])
-        
-        return Counter(chain(*self.tupel_word_dict))
-        
-    """Creates a dictionary that is optimal for a look up
-        
-    Data changed
+    def in_target_vocabulary(self, word):
+        return word in self.target_vocabulary
+
+    """Finds the orth form of a word regardless of its casing.
+    Input sentences are lowered, therefore nouns of the target language (e.g. "Leute") can only be found this way.
+
+    Parameters
+    ----------
+    word : str - the word to look up
+
+    Returns
     -------
-    lookup_dict : dict
-        {
-            "word1": [("translation1", occurence), ("translation2", occurence), ...]
-            .
-            .
-            .
-            "wordn": [("translation1", occurence), ("translation2", occurence), ...]
+    str or None
+        the orth form as it appears in the target language, None if the word is not known
+    """
+    def target_form(self, word):
+        if word in self.target_vocabulary:
+            return word
+        return self.target_vocabulary_lower.get(word.lower())
 
-        }
+    """Adds a word of the target language as a translation of itself.
+    Used for words that appear only in the target language, this way a redundant <UNK> tag replacement is saved.
+    The phrase table, the lookup dictionary and the target vocabulary index are kept in sync,
+    the OOV resolutions are dropped since the word can change the resolution of its variants.
+
+    Parameters
+    ----------
+    word : str - the orth form that is translated to itself
     """
-    def create_lookup_dict(self):
-        for entry in self.occurence_word_list:
-            if entry[0] in self.lookup_dict.keys():
-                self.lookup_dict[entry[0]].append((entry[1], self.occurence_word_list[entry]))
-            else:
-                self.lookup_dict[entry[0]] = [(entry[1], self.occurence_word_list[entry])]
-        
-    """Creates bigrams for the whole corpus.
-    Occurence entry in the lookup_bigram is referred to the global occurence and not the relative one per bigram.
-    Relative occurence will be later calculated, once added to the PhrasTable under the log input value.
+    def add_in_target_word(self, word):
+        self.lookup_dict[word] = [(word, 1)]
+        self.phrase_table.invalidate()
+        self.add_target_word(word)
+        self.add_vowel_variants(word, 'fixed', word)
+        self.oov_resolutions.clear()
+
+    """Records the side effects of translating one InputSentence.
+    Sentences translated in another process (main.py --workers) return their side effects, 
+    which are merged into the corpus of the main process via this function in the sentence order.
+    The in target words change the model only in the "learn during run" mode.
+
+    Parameters
+    ----------
+    fixed_oov : [[str, str]] - gained back OOV words and their changed form
+    oov : [str] - the remaining OOV words
+    in_target : [str] - words of the target language that were translated as themselves
+    """
+    def record_sentence_effects(self, fixed_oov, oov, in_target):
+        self.oov_statistics.record(fixed_oov, oov)
+        if not self.learn_during_run:
+            return
+        for word in in_target:
+            if word not in self.lookup_dict:
+                self.add_in_target_word(word)
+
+    """Resolves a word that is not in the lookup dictionary, the result is cached across all sentences.
+    The categories are:
+    'in_target' - the word appears only in the target language, resolved form is the word itself
+    'cleaned' - the word is known without underscores or slashes
+    'fixed' - the word is known after a change based on the vowel_table
+    'fixed_in_target' - the word is a word of the target language after a change based on the vowel_table
+    'compound' - a past form built with 'g', resolved form is the 'ge' form inserted after the translation
+    'oov' - the word could not be gained back, resolved form is the word itself
+
+    Parameters
+    ----------
+    word : str - the unknown word of the source language
+
+    Returns
+    -------
+    (str, str)
+        category and resolved form
+    """
+    def resolve_oov(self, word):
+        resolution = self.oov_resolutions.get(word)
+        if resolution is None:
+            OOV_RESOLUTION_MISSES.inc()
+            resolution = self.find_oov_resolution(word)
+            self.oov_resolutions[word] = resolution
+        else:
+            OOV_RESOLUTION_HITS.inc()
+        return resolution
+
+    """Applies the heuristic for gaining back an unknown word, see resolve_oov for the returned categories.
+    """
+    def find_oov_resolution(self, word):
+        if self.in_target_vocabulary(word):
+            return 'in_target', word
+
+        # rechecking if underscores or slashes prevent the system from finding the word in the dictionary
+        for sign in (r"_", r"\\"):
+            cleaned = re.sub(sign, "", word)
+            if cleaned in self.lookup_dict:
+                return 'cleaned', cleaned
+
+        # trying to regain OOV words based on the predefined vowel_table, the candidates are precomputed in the vowel_index
+        # the special case of the past form where the word construction includes the letter g for compounding
+        # is tried at the position of the first 'g' rule
+        candidates = self.vowel_candidates(word)
+        if 'g' in self.vowel_table and 'g' in word and 'ge' not in word:
+            if not candidates or self.vowel_rank('g', 0, 2) < candidates[0][0]:
+                compound = self.resolve_g_compound(word)
+                if compound:
+                    return 'compound', compound
+
+        if candidates:
+            return candidates[0][1], candidates[0][2]
+
+        return 'oov', word
+
+    """Rebuilds a past form compounded with 'g' (e.g. "gsehn") into its 'ge' form.
+    The dialect parts are rewritten with their translation based on the highest probability.
+
+    Parameters
+    ----------
+    word : str - the unknown word containing 'g' but not 'ge'
+
+    Returns
+    -------
+    str or None
+        the 'ge' form, None if the parts are not known
+    """
+    def resolve_g_compound(self, word):
+        # g at the beginning of the word
+        if word[0] == 'g':
+            rest = word[1:]
+            if rest in self.lookup_dict:
+                return ('ge' + self.translate_single_input(rest)).lower()
+            if self.in_target_vocabulary(rest):
+                return ('ge' + rest).lower()
+            return None
+
+        # the word is built out of two words together connected with 'g', split only on the first occurrence
+        parts = []
+        for part in word.split('g', 1):
+            if len(part) > 1 and part in self.lookup_dict:
+                parts.append(self.translate_single_input(part))
+            elif len(part) > 1 and self.in_target_vocabulary(part):
+                parts.append(part)
+
+        if len(parts) == 2:
+            return (parts[0] + 'ge' + parts[1]).lower()
+        return None
+
+    """Builds the vowel_index, the inverse of the vowel_table.
+    The inverse substitutions are applied to every word of the source language and of the target language (lowered),
+    thus each dialect variant is mapped directly to the known words it could be changed into. 
+    A variant is kept only if the vowel_table rule changes it back into the known word, so the index
+    returns the same candidates as applying the rules to an OOV word.
 
     Data changed
     ------------
-    general_bigrams_list : [bigrams] - includes also empty entries which are eliminated in the new general_bigrams list
-    general_bigrams : [(str, str)] 
-                [('orig1 orth1', 'orig2 orth2'), ('orig2 orth2', 'orig3 orth3')...] ... word alignment is already integrated in the tupel
-    lookup_bigrams : dict 
+    vowel_index : dict 
         {
-            "bigram1": [("translationbigram1", occurence), ("translationbigram2", occurence), ...]
-                .
-                .
-                .
-            "bigramn": [("translationbigram1", occurence), ("translationbigram2", occurence), ...]
+            "dialect variant": [(rank, category, resolved form), ...] # sorted by rank, the first entry is the one applied
         }
+    """
+    def create_vowel_index(self):
+        self.vowel_index = {}
+        for word in self.lookup_dict:
+            self.add_vowel_variants(word, 'fixed', word)
+        for word in self.target_vocabulary | set(self.target_vocabulary_lower):
+            self.add_vowel_variants(word, 'fixed_in_target', self.target_form(word))
+
+    """Adds the dialect variants of a known word to the vowel_index
 
+    Parameters
+    ----------
+    word : str - the known word, source language or target language
+    category : str - 'fixed' for a word of the source language, 'fixed_in_target' for a word of the target language
+    resolved : str - the form the variants are resolved to
     """
-    def create_bigrams(self):
-        self.tagged_sentences = add_start_end_tags(self.orig_orth, 0)
-        self.align_words_list = align_words(self.tagged_sentences)
-        self.general_bigrams_list = list(bigrams(self.align_words_list))
+    def add_vowel_variants(self, word, category, resolved):
+        for vowel_position, vowel in enumerate(self.vowel_table):
+            for replacement_position, replacement in enumerate(self.vowel_table[vowel]):
+                entry = (self.vowel_rank(vowel_position, replacement_position, 0 if category == 'fixed' else 1), category, resolved)
+                for variant in inverse_substitutions(word, vowel, replacement):
+                    if entry not in self.vowel_index.setdefault(variant, []):
+                        bisect.insort(self.vowel_index[variant], entry)
 
-        for item in self.general_bigrams_list:
-            if (item[0] != ' ' and item[1] != ' '):
-                self.general_bigrams.append(item)
+    """Orders the candidates the way the vowel_table rules are applied:
+    by the rule, by the replacement, the source language before the target language.
 
-        self.par_bigrams_list = align_bigrams(self.tagged_sentences)        
-        occurence_bigrams = Counter(chain(*self.par_bigrams_list))
-        
-        for entry in occurence_bigrams:
-            if entry[0] in self.lookup_bigrams.keys():
-                self.lookup_bigrams[entry[0]].append((entry[1], occurence_bigrams[entry]))
-            else:
-                self.lookup_bigrams[entry[0]] = [(entry[1], occurence_bigrams[entry])]
-        
-    """Creating trigrams for the whole corpus
-    Occurence entry in the lookup_trigram is referred to the global occurence and not the relative one per trigram.
-    Relative occurence will be later calculated, once added to the PhrasTable under the log input value.
-
-    general_trigrams_list : [trigrams] - includes also empty entries which are eliminated in the new general_trigrams list
-    general_trigrams : [(str, str)] 
-                    [('orig1 orth1', 'orig2 orth2', 'orig3 orig3'), ('orig2 orth2', 'orig3 orth3', 'orig4 orig4')...] ... word alignment is already integrated in the tupel
-    lookup_trigrams : dict 
-            {
-                "trigram1": [("translationtrigram1", occurence), ("translationtrigram2", occurence), ...]
-                    ...
-                "trigramn": [("translationtrigram1", occurence), ("translationtrigram2", occurence), ...]
-
-            }
-    """
-    def create_trigrams(self):
-        self.general_trigrams_list = list(trigrams(self.align_words_list))
-
-        for item in self.general_trigrams_list:
-            if (item[0] != ' ' and item[1] != ' '):
-                self.general_trigrams.append(item)
-
-        self.par_trigrams_list = align_trigrams(self.tagged_sentences)        
-        occurence_trigrams = Counter(chain(*self.par_trigrams_list))
-
-        for entry in occurence_trigrams:
-            if entry[0] in self.lookup_trigrams.keys():
-                self.lookup_trigrams[entry[0]].append((entry[1], occurence_trigrams[entry]))
-            else:
-                self.lookup_trigrams[entry[0]] = [(entry[1], occurence_trigrams[entry])]        
+    Parameters
+    ----------
+    vowel : int or str - position of the rule in the vowel_table or its key
+    replacement : int - position of the replacement within the rule
+    kind : int - 0 source language, 1 target language, 2 'g' compound
+    """
+    def vowel_rank(self, vowel, replacement, kind):
+        if isinstance(vowel, str):
+            vowel = list(self.vowel_table).index(vowel)
+        return (vowel, replacement, kind)
+
+    """Returns all known words an OOV word could be changed into via the vowel_table.
+
+    Parameters
+    ----------
+    word : str - the unknown word
+
+    Returns
+    -------
+    [((int, int, int), str, str)]
+        (rank, category, resolved form) sorted by rank, empty if no rule applies
+    """
+    def vowel_candidates(self, word):
+        return self.vowel_index.get(word, [])
+
+    """Applies the vowel_table rules to a word one by one, the way find_oov did before the vowel_index was built.
+    Kept as the reference for report_vowel_index_recall.
 
-    """Creates a PhraseTable with opening and closing tags.
-    The phrase table includes uni-, bi- and trigrams.
+    Returns
+    -------
+    ((int, int, int), str, str) or None
+        the first candidate found, see vowel_candidates
+    """
+    def scan_vowel_table(self, word):
+        for vowel_position, vowel in enumerate(self.vowel_table):
+            if not re.search(vowel, word):
+                continue
+            for replacement_position, replacement in enumerate(self.vowel_table[vowel]):
+                changed = word.replace(vowel, replacement)
+                if changed in self.lookup_dict:
+                    return self.vowel_rank(vowel_position, replacement_position, 0), 'fixed', changed
+                if self.target_form(changed):
+                    return self.vowel_rank(vowel_position, replacement_position, 1), 'fixed_in_target', self.target_form(changed)
+        return None
+
+    """Compares the vowel_index against applying the rules one by one (scan_vowel_table) and logs the recall.
+
+    Parameters
+    ----------
+    words : iterable of str - e.g. the words of the training data
+
+    Returns
+    -------
+    float
+        share of the words changed by the rules for which the vowel_index returns the same first candidate
+    """
+    def report_vowel_index_recall(self, words):
+        expected = 0
+        found = 0
+        candidates = 0
+        for word in words:
+            scanned = self.scan_vowel_table(word)
+            candidates += len(self.vowel_candidates(word))
+            if scanned is None:
+                continue
+            expected += 1
+            if self.vowel_candidates(word) and self.vowel_candidates(word)[0] == scanned:
+                found += 1
+
+        recall = found / expected if expected else 1.0
+        logger.debug('=== Vowel index ===\n* Variants: %d\n* Words changed by the rules: %d\n* Found via the index: %d (recall %f)\n* Candidates returned: %d', len(self.vowel_index), expected, found, recall, candidates)
+        return recall
+
+    """Resolves the unknown words of a vocabulary in advance, e.g. all words of the database tokens (main.py --precompute-oov).
+    This way OOV handling during the translation is a dictionary lookup.
+
+    Parameters
+    ----------
+    words : iterable of str - the words as they appear in the normalized input sentences
+
+    Returns
+    -------
+    int
+        number of unknown words resolved
+    """
+    def precompute_oov_resolutions(self, words):
+        for word in set(words):
+            if word not in self.lookup_dict:
+                self.resolve_oov(word)
+        return len(self.oov_resolutions)
+
+    """Saves the OOV resolution cache as json, tied to the hash of the model.
+
+    Parameters
+    ----------
+    path : str - the file location
+    """
+    def save_oov_resolutions(self, path):
+        with open(path, 'w', encoding='utf-8') as cache_file:
+            json.dump({'source_hash': self.model_hash(), 'resolutions': self.oov_resolutions}, cache_file, ensure_ascii=False)
+
+    """Loads an OOV resolution cache written by save_oov_resolutions.
+    A cache of another model (different parallel data) is ignored.
+
+    Parameters
+    ----------
+    path : str - the file location
+
+    Returns
+    -------
+    bool
+        True if the cache was loaded
+    """
+    def load_oov_resolutions(self, path):
+        if not os.path.exists(path):
+            return False
+        with open(path, 'r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+        if cache.get('source_hash') != self.model_hash():
+            return False
+        self.oov_resolutions.update({word: tuple(resolution) for word, resolution in cache['resolutions'].items()})
+        return True
+
+    """Counts the position aligned uni-, bi- and trigrams of the parallel sentences and creates the lookup tables.
+    The sentences are tokenized once into arrays of word ids and counted in bulk (see ngram_table).
+    Only sentences of the same length are used, the unigrams exclude the last word of each sentence.
+    The trigrams of the orth sentences are counted in the same pass for the language model.
+
+    With more than one worker, the sentences are split into consecutive shards counted in a process pool,
+    the counts of the shards are merged in the sentence order, thus the tables are identical to the ones of one process.
+
+    Parameters
+    ----------
+    workers : int - number of processes
+
+    Data changed
+    ------------
+    lookup_dict, lookup_bigrams, lookup_trigrams : NgramTable
+    orth_counts : dict - trigram counts of the orth sentences, see ngram_table.count_shard
+    vocabulary : Vocabulary
+    """
+    def create_ngram_tables(self, workers=1):
+        parallel = self.parallel_sentences()
+
+        if workers <= 1:
+            shards = [count_shard(parallel, self.orth)]
+        else:
+            context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+            # a forked worker stops the profiler it inherited (main.py --profile)
+            with context.Pool(workers, initializer=profiling.detach) as pool:
+                shards = pool.starmap(count_shard, zip(split_shards(parallel, workers), split_shards(self.orth, workers)))
+
+        counts = merge_shards(shards, self.vocabulary)
+        self.lookup_dict = NgramTable(counts['aligned'][0], 1, self.vocabulary)
+        self.lookup_bigrams = NgramTable(counts['aligned'][1], 2, self.vocabulary)
+        self.lookup_trigrams = NgramTable(counts['aligned'][2], 3, self.vocabulary)
+        self.orth_counts = counts
+
+    """Returns the parallel sentences of orig_orth that are used for the lookup tables, the ones of the same (non zero) length
+
+    Returns
+    -------
+    [[str, str]]
+    """
+    def parallel_sentences(self):
+        return [item for item in self.orig_orth if len(item[0].split()) == len(item[1].split()) and len(item[0].split()) > 0]
+
+    """Adds parallel sentences to the trained model without retraining it.
+    The sentences are cleaned the same way as the training data (see automatize_calls) and counted,
+    then only the affected entries are updated: the counts of the lookup tables (the relative occurences in the phrase table follow),
+    the trigram counts of the language model, the target vocabulary and the vowel_index.
+    The counts are the same as training on the training data together with the new sentences.
+
+    Parameters
+    ----------
+    pairs : [(str, str)] - original and orthographic sentences
+
+    Returns
+    -------
+    int
+        number of added sentences used for the lookup tables
+    """
+    def add_parallel_sentences(self, pairs):
+        pairs = [[item[0], item[1]] for item in pairs if isinstance(item[0], str) and isinstance(item[1], str)] # empty cells are skipped
+        orth = self.orth
+        for first_row, second_row in pairs:
+            self.add_data_row(first_row, second_row)
+        self.mainlist_statistics()
+        self.handle_diff_lengths()
+        self.info_printer()
+        added_orth = self.orth
+        self.orth = orth + added_orth
+
+        parallel = self.parallel_sentences()
+        counts = merge_shards([count_shard(parallel, added_orth)], self.vocabulary)
+        self.release_training_data()
+
+        strings = self.vocabulary.strings
+        unigrams = counts['aligned'][0]
+        new_words = [word for word in dict.fromkeys(strings[id] for id in unigrams[:, 0].tolist()) if word not in self.lookup_dict]
+        self.lookup_dict.add_rows(unigrams)
+        self.lookup_bigrams.add_rows(counts['aligned'][1])
+        self.lookup_trigrams.add_rows(counts['aligned'][2])
+        self.language_prob.add_counts(counts['orth_trigrams'], counts['orth_trigrams_total'])
+        self.phrase_table.invalidate()
+
+        # the indexes get the entries create_target_vocabulary and create_vowel_index would create for the new words
+        for word in new_words:
+            self.add_vowel_variants(word, 'fixed', word)
+        for word in dict.fromkeys(strings[id] for id in unigrams[:, 1].tolist()):
+            if not self.in_target_vocabulary(word):
+                self.add_target_word(word)
+                for variant in {word, word.lower()}:
+                    self.add_vowel_variants(variant, 'fixed_in_target', self.target_form(variant))
+
+        self.references_general += [item.split() for item in added_orth]
+        self.oov_resolutions = {} # words might be known now
+        self.delta_hashes.append(hashlib.sha256(json.dumps(pairs, ensure_ascii=False).encode('utf-8')).hexdigest())
+        logger.info('Added %d parallel sentences, %d used for the lookup tables', len(pairs), len(parallel))
+        return len(parallel)
+
+    """Adds the parallel sentences of a file to the trained model, see add_parallel_sentences.
+    The file has the columns sentorig and sentorth like the training data, xlsx or csv.
+
+    Parameters
+    ----------
+    path : str - the file location of the new parallel sentences
+
+    Returns
+    -------
+    int
+        number of added sentences used for the lookup tables
+    """
+    def add_parallel_data(self, path):
+        data = pd.read_csv(path) if path.endswith('.csv') else pd.read_excel(path)
+        return self.add_parallel_sentences(zip(data.sentorig, data.sentorth))
+
+    """Releases the intermediate lists of the training, they are not needed for the translation.
+    The lookup tables, the language model, the orth sentences (references) and the statistics of the OOV words are kept.
+    """
+    def release_training_data(self):
+        self.orig_orth = []
+        self.orig = []
+        self.not_same_len_gram = []
+        self.refactored = []
+        self.capital_letter_correction_gram = []
+        self.slash_list = []
+        self.hashtag_list = []
+        self.error_list = []
+        self.orth_counts = {}
+
+    """Creates the phrase table with opening and closing tags.
+    The phrase table includes uni-, bi- and trigrams, the translation options are read from the lookup tables.
 
     Parameters used for the PhraseTable
     ----------
-    log_prob : float - Log probability that given src_phrase, trg_phrase is its translation. Is calculated via conditional probability.       
+    log_prob : float - Log probability that given src_phrase, trg_phrase is its translation. Is calculated via conditional probability
+        (relative occurence per source phrase), see CompactPhraseTable.
     """
     def create_phrase_table(self):
-        tracking_dataphrase = []
+        self.phrase_table = CompactPhraseTable({1: self.lookup_dict, 2: self.lookup_bigrams, 3: self.lookup_trigrams})
 
         # adding the tags to the phrase table as unigrams
-        tags = ['<s>', '</s>', self.unknown_tag]
-        to_grams = ngrams(tags, 1)
-        tags_grams_array = [gram for gram in to_grams]
-        for tag in tags_grams_array:
-            self.phrase_table.add(tag, tag, 1)
-        
-        # adding unigrams to the PhraseTable
-        for item in self.lookup_dict:
-            overall_item = sum(n for _, n in self.lookup_dict[item]) # computing per key the total number of occurences for the relative probabilty 
-            
-            # casting the object to the right type -> a single unigram item
-            item_gram = ngrams([item], 1)
-            unigram_item_list = [gram for gram in item_gram] 
-
-            for option in self.lookup_dict[item]:
-                # casting the object to the right type -> a single unigram item
-                option_gram = ngrams([option[0]], 1)
-                option_single_list = [gram for gram in option_gram]
-                self.phrase_table.add(unigram_item_list[0], option_single_list[0], option[1] / overall_item) # Python's '/' division is a "floor/true division", therefore not casting is needed 
-                tracking_dataphrase.append((unigram_item_list[0], option_single_list[0], option[1] / overall_item)) # DataPhrase is not iterable
-                
-        # adding bigrams to the PhraseTable
-        for item in self.lookup_bigrams:
-            overall_item_bigram = sum(n for _, n in self.lookup_bigrams[item]) # computing per key the total number of occurences for the relative probabilty 
-
-            # each entry is already in the needed bigram form, therefore no extra casting as for unigram
-            for option in self.lookup_bigrams[item]:
-                self.phrase_table.add(item, option[0], option[1] / overall_item_bigram)
-                tracking_dataphrase.append((item, option[0], option[1] / overall_item_bigram))
-                
-        # adding trigrams to the PhraseTable
-        for item in self.lookup_trigrams:
-            overall_item_trigram = sum(n for _, n in self.lookup_trigrams[item]) # computing per key the total number of occurences for the relative probabilty 
-
-            # each entry is already in the needed trigram form, therefore no extra casting as for unigram
-            for option in self.lookup_trigrams[item]:
-                self.phrase_table.add(item, option[0], option[1] / overall_item_trigram)
-                tracking_dataphrase.append((item, option[0], option[1] / overall_item_trigram))
-                
+        for tag in ['<s>', '</s>', self.unknown_tag]:
+            self.phrase_table.add((tag,), (tag,), 1)
 
     """Creates a language model for the source language.
-    The probabilities inserted are extracted from orth list.
+    The probabilities inserted are extracted from orth list, the trigrams are counted by create_ngram_tables.
     Returns
     -------
     object
         language_model of the target language
     """
     def create_language_model(self):
-        
-        # handling unigrams 
-        for item in self.orth:
-            tagged_sentence = '<s> <s> ' + item + ' </s> </s>'
-            tmp_bigram = [gram for gram in bigrams(tagged_sentence.split())]            
-            for gram in tmp_bigram:
-                self.bigrams_orth.append(gram)
-
-            tmp_trigram = [gram for gram in trigrams(tagged_sentence.split())]
-            for gram in tmp_trigram:
-                self.trigrams_orth.append(gram)
-
-        language_prob = defaultdict(lambda: -50.0)
-
         # handling bigrams
-        overall_bigrams_entries = len(self.bigrams_orth) 
-        logging.debug('overall_entries_bigrams for orth: %d', overall_bigrams_entries)
+        overall_bigrams_entries = self.orth_counts['orth_bigrams_total']
+        logger.debug('overall_entries_bigrams for orth: %d', overall_bigrams_entries)
 
         # handling trigrams
-        overall_trigrams_entries = len(self.trigrams_orth)
-        logging.debug('overall_entries_trigrams for orth: %d', overall_trigrams_entries)
-        orth_occurences_trigrams = Counter(self.trigrams_orth)
+        overall_trigrams_entries = self.orth_counts['orth_trigrams_total']
+        logger.debug('overall_entries_trigrams for orth: %d', overall_trigrams_entries)
+        grams, occurences = self.orth_counts['orth_trigrams']
 
-        
-        for gram in orth_occurences_trigrams:
-            language_prob[gram] = log(orth_occurences_trigrams[gram] / overall_trigrams_entries)
+        self.language_prob = NgramCounts(grams, occurences, overall_trigrams_entries, self.vocabulary)
+        return self.build_language_model()
 
-        return type('',(object,),{'probability_change': lambda self, context, phrase: language_prob[phrase], 'probability': lambda self, phrase: language_prob[phrase]})()
+    """Wraps the trigram log probabilities (language_prob) into the object expected by the decoders.
+    Unknown phrases get a log probability of -50. The lookup does not insert missing phrases, 
+    thus the language model stays unchanged while translating.
+
+    Returns
+    -------
+    object
+        language_model of the target language
+    """
+    def build_language_model(self):
+        language_prob = self.language_prob
+        return type('',(object,),{'probability_change': lambda self, context, phrase: language_prob.get(phrase, -50.0), 'probability': lambda self, phrase: language_prob.get(phrase, -50.0)})()
 
     """Initializing the StackDecoder instance with the created phrase_table and language_model.
     Distortion factor is set on 0 since no reordering is needed.
     """
     def create_stack_decoder(self):
-        self.stack_decoder = StackDecoder(self.phrase_table, self.language_model)
+        self.stack_decoder = BudgetStackDecoder(self.phrase_table, self.language_model)
         self.stack_decoder.distortion_factor = 0.0
-        
+
+    """Initializing the decoder engine chosen via the decoder_name attribute.
+    The "viterbi" decoder finds the same (or a better scored) translation as the StackDecoder, 
+    since all phrases are position aligned and no reordering is possible, but without searching through reorderings.
+
+    Data changed
+    ------------
+    decoder : StackDecoder | ViterbiDecoder - the instance used by translate_with_decoder
+    """
+    def create_decoder(self):
+        if self.decoder_name == 'stack':
+            self.create_stack_decoder()
+            self.decoder = self.stack_decoder
+        elif self.decoder_name == 'viterbi':
+            self.decoder = ViterbiDecoder(self.phrase_table, self.language_model)
+        else:
+            raise ValueError('Unknown decoder: ' + str(self.decoder_name))
+
+    """Limits the search of the decoder per sentence, see decode_budget.
+    Only the limits are kept, every sentence gets its own DecodeBudget in translate_with_decoder,
+    a sentence whose budget is used up raises DecodeBudgetExceeded there.
+
+    Parameters
+    ----------
+    seconds : float - the time per sentence, None for no time limit
+    hypotheses : int - the number of scored hypotheses per sentence, None for no limit
+    """
+    def set_decode_budget(self, seconds=None, hypotheses=None):
+        self.decode_limits = (seconds, hypotheses)
+
     """Translates a full input sentence
     
     Parameters
     ----------
     sentence : str - input sentence to be translated  
+    overlay : PhraseTable - extra entries of the sentence, consulted next to the phrase table of the corpus (optional)
     
     Returns
     -------
-    sentence : str - the output sentence returned from the stack_decoder instance
+    sentence : str - the output sentence returned from the decoder instance
+
+    Raises
+    ------
+    DecodeBudgetExceeded
+        if a decode budget is set and the search of the sentence uses it up, see set_decode_budget
     """
-    def translate_with_decoder(self, sentence):
-        return self.stack_decoder.translate(sentence.split())
+    def translate_with_decoder(self, sentence, overlay=None):
+        with DECODE_SECONDS.time():
+            limited = any(self.decode_limits)
+            overlaid = overlay is not None and bool(overlay.src_phrases)
+            if not limited and not overlaid:
+                return self.decoder.translate(sentence.split())
+
+            # a shallow copy of the decoder shares the language model and the settings,
+            # but uses the overlay phrase table and the budget of this sentence
+            decoder = copy.copy(self.decoder)
+            if limited:
+                decoder.budget = DecodeBudget(*self.decode_limits)
+            if overlaid:
+                decoder.phrase_table = OverlayPhraseTable(self.phrase_table, overlay)
+            return decoder.translate(sentence.split())
    
     """Translates an input of one word
     
@@ -478,19 +965,46 @@ class Corpora:
             return max(self.lookup_dict[sentence.strip()], key = itemgetter(1))[0]
         return sentence
 
-    """Prints information regarding the gained back (fixed) out-of-vocabulary words (OOV).
+    """Translates a sentence word by word with the most probable unigram of each word, without language model and search.
+    Used when the decoder exceeds its budget (see InputSentence.decode).
+
+    Parameters
+    ----------
+    sentence : str - input sentence to be translated, the unknown tag and words without entry are kept as they are
+    overlay_lookup : dict - extra lookup_dict entries of the sentence (optional)
+
+    Returns
+    -------
+    [str]
+        the translated words, as returned by the decoder
+    """
+    def translate_greedy(self, sentence, overlay_lookup=None):
+        translation = []
+        for word in sentence.split():
+            if overlay_lookup and word in overlay_lookup:
+                translation.append(max(overlay_lookup[word], key = itemgetter(1))[0])
+            elif word in self.lookup_dict:
+                translation.append(self.translate_single_input(word))
+            else:
+                translation.append(word)
+        return translation
+
+    """Logs the totals of the gained back (fixed) out-of-vocabulary words (OOV).
     These words were gained back during translation by the individual InputSentence instance.
+    The words themselves are written by write_oov_statistics.
     """
     def print_fixed_oov(self):
-        logging.debug('=== OOV Statistics ===\n* Overall original OOV: %d\n* Gained back OOV: %d\n* %f percent was gained back', len(self.fixed_oov) + len(self.oov), len(self.fixed_oov), 100 * len(self.fixed_oov) / (len(self.fixed_oov) + len(self.oov)))
-        logging.debug('=== CHANGED OOV: ===')
-        for item in self.fixed_oov:
-            logging.debug('The word: %s was changed to: %s', item[0], item[1])
-        
-        logging.debug('=== OOV WORDS: ===')
-        for item in self.oov:
-            if item != ',' and item != '.' and item != '!' and item != '?':
-                logging.debug('* %s', item)
+        fixed, oov = self.oov_statistics.fixed_count(), self.oov_statistics.oov_count()
+        logger.info('=== OOV Statistics ===\n* Overall original OOV: %d\n* Gained back OOV: %d\n* %f percent was gained back', fixed + oov, fixed, 100 * fixed / (fixed + oov) if fixed + oov else 0.0)
+
+    """Writes the gained back and the remaining OOV words with their occurrences as json, see OovStatistics
+
+    Parameters
+    ----------
+    path : str - the file location
+    """
+    def write_oov_statistics(self, path):
+        self.oov_statistics.write(path)
 
     """Filter the references for computing the BLEU score.
     Based on an input sentence, all sentences in the orthographic list will be collected if there is an intersection
@@ -525,4 +1039,81 @@ class Corpora:
             'o': ('a'), 
             'g': ('ge'), # special case, will be handled more deeply
             'w': ('b'),
-        }
\ No newline at end of file
+        }
+
+
+"""Generates the words that the substitution vowel -> replacement changes into the given word.
+Every subset of the occurences of the replacement is changed back into the vowel, only the variants 
+that the substitution (str.replace) turns back into the word are returned.
+
+Parameters
+----------
+word : str - the known word
+vowel : str - the key of the vowel_table rule
+replacement : str - one of the values of the rule
+max_occurences : int - limits the number of combinations for words with many occurences of the replacement
+
+Returns
+-------
+set of str
+"""
+def inverse_substitutions(word, vowel, replacement, max_occurences=6):
+    positions = []
+    start = word.find(replacement)
+    while start != -1 and len(positions) < max_occurences:
+        positions.append(start)
+        start = word.find(replacement, start + len(replacement))
+
+    variants = set()
+    for chosen in product((False, True), repeat=len(positions)):
+        variant = word
+        # replacing from the end keeps the positions in front valid
+        for position, change in reversed(list(zip(positions, chosen))):
+            if change:
+                variant = variant[:position] + vowel + variant[position + len(replacement):]
+        if vowel in variant and variant.replace(vowel, replacement) == word:
+            variants.add(variant)
+    return variants
+
+"""Splits a list into consecutive shards of about the same size
+
+Parameters
+----------
+items : list
+shards : int - number of shards
+
+Returns
+-------
+[list]
+    exactly shards lists, some might be empty
+"""
+def split_shards(items, shards):
+    bounds = [len(items) * shard // shards for shard in range(shards + 1)]
+    return [items[bounds[shard]:bounds[shard + 1]] for shard in range(shards)]
+
+"""
+Read-only view of a phrase table combined with the extra entries of a single sentence.
+Provides the part of the nltk PhraseTable interface used by the decoders (translations_for and in).
+
+"""
+class OverlayPhraseTable:
+    """Constructor for the OverlayPhraseTable class
+
+    Parameters
+    ----------
+    phrase_table : PhraseTable - the phrase table of the corpus, is not changed
+    overlay : PhraseTable - the extra entries
+    """
+    def __init__(self, phrase_table, overlay):
+        self.phrase_table = phrase_table
+        self.overlay = overlay
+
+    def translations_for(self, src_phrase):
+        if src_phrase not in self.overlay:
+            return self.phrase_table.translations_for(src_phrase)
+        if src_phrase not in self.phrase_table:
+            return self.overlay.translations_for(src_phrase)
+        return sorted(self.overlay.translations_for(src_phrase) + self.phrase_table.translations_for(src_phrase), key=lambda e: e.log_prob, reverse=True)
+
+    def __contains__(self, src_phrase):
+        return src_phrase in self.overlay or src_phrase in self.phrase_table
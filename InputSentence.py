@@ -1,6 +1,31 @@
 from alignments import *
 import re
-from nltk.util import ngrams
+from nltk.translate import PhraseTable
+import metrics
+import diagnostics
+from decode_budget import DecodeBudgetExceeded
+
+FIND_OOV_SECONDS = metrics.histogram('find_oov_seconds', 'Time per sentence for finding and resolving the unknown words')
+WORDS = metrics.counter('words_total', 'Words of the translated sentences')
+UNKNOWN_WORDS = metrics.counter('unknown_words_total', 'Words not in the lookup dictionary')
+OOV_WORDS = metrics.counter('oov_words_total', 'Words that stayed unknown (OOV) after the heuristic')
+DECODE_FALLBACKS = metrics.counter('decode_fallbacks_total', 'Sentences translated greedily because the decoder used up its budget')
+
+logger = diagnostics.get_logger(__name__)
+
+"""Normalizes a raw input sentence the way it is translated: multiple spaces are merged, the sentence is stripped and lowered.
+Sentences with the same normalized form get the same translation (see TranslationCache).
+
+Parameters
+----------
+sentence : str - the raw input
+
+Returns
+-------
+str
+"""
+def normalize_sentence(sentence):
+    return re.sub(r"(  )( )*", " ", sentence).strip().lower()
 
 """
 This class holds all relevant attributes per each input sentence instance
@@ -18,16 +43,25 @@ class InputSentence:
     """
     def __init__(self, inputSentence, corpus):
         self.original_input = inputSentence # the original input is kept for key look up reasons
-        inputSentence = re.sub(r"(  )( )*", " ", inputSentence).strip().lower() 
+        inputSentence = normalize_sentence(inputSentence)
         self.to_translate_input = inputSentence
         self.corpus = corpus 
         self.has_oov = False # boolean flag if the sentence contains unknown words
         self.oov_tagged = "" # empty string if has_oov is false, else value is inserted during translation
+        self.decode_fallback = False # boolean flag if the decoder used up its budget and the sentence was translated greedily
             
         self.oov = []
         self.in_target = []
         self.oov_or_in_target = []    
 
+        # the corpus is not changed while translating, words found only in the target language are added to the overlay of this sentence
+        self.overlay = PhraseTable() # extra phrase table entries consulted by the decoder next to the corpus phrase table
+        self.overlay_lookup = {} # extra lookup_dict entries, same structure as corpus.lookup_dict
+
+        # side effects of the translation, recorded in the corpus via record_sentence_effects
+        self.fixed_oov = [] # [[str, str]] - the gained back OOV words and their changed form
+        self.learned_words = [] # [str] - words of the target language translated as themselves, added to the corpus only if it learns during the run
+
         self.stack_decoder_translation = self.translate_with_stack_decoder()
 
     """Translates the input sentence.
@@ -48,10 +82,11 @@ class InputSentence:
             self.to_translate_input = 'N/A'
             return 'N/A'
         
-        self.find_oov()
+        with FIND_OOV_SECONDS.time():
+            self.find_oov()
 
         if (not self.oov):
-            return " ".join(self.corpus.translate_with_decoder(self.to_translate_input))
+            return " ".join(self.decode(self.to_translate_input))
 
         # if holds OOV
         self.has_oov = True
@@ -60,7 +95,7 @@ class InputSentence:
         for entry in self.oov:
             uknown_tagged_to_translate[entry[1]] = self.corpus.unknown_tag
        
-        self.oov_tagged = self.corpus.translate_with_decoder(" ".join(uknown_tagged_to_translate).replace("  ", " ").strip())
+        self.oov_tagged = self.decode(" ".join(uknown_tagged_to_translate).replace("  ", " ").strip())
        
         joined_str = " ".join(self.oov_tagged)
 
@@ -72,145 +107,130 @@ class InputSentence:
         return joined_str
 
 
+    """Translates the prepared input with the decoder of the corpus.
+    If the decoder uses up its budget (see Corpora.set_decode_budget), each word is translated with its most probable unigram instead.
+
+    Parameters
+    ----------
+    sentence : str - the input sentence, unknown words replaced by the unknown tag
+
+    Returns
+    -------
+    [str]
+        the translated words
+
+    Data changed
+    ------------
+    decode_fallback : bool - True if the greedy translation was used
+    """
+    def decode(self, sentence):
+        try:
+            return self.corpus.translate_with_decoder(sentence, self.overlay)
+        except DecodeBudgetExceeded as budget:
+            self.decode_fallback = True
+            DECODE_FALLBACKS.inc()
+            logger.info('Decode budget exceeded (%s), greedy translation of: %s', budget, sentence)
+            return self.corpus.translate_greedy(sentence, self.overlay_lookup)
+
     """Finds all unknown words to the system.
     This algoritm performs per word in the given sentence a lookup in the dictionary.
+    Each unknown word is resolved by the corpus (see Corpora.resolve_oov), the resolutions are cached across sentences.
     It finds real OOV words and words that appear only in the target language.
-    If the words belong only to the target domain, they are dynamically added to the corpus through its PhraseTable instance.
-    Later, a vowel detector iterates over the OOV words and checks if the changed word appears in the lookup dictionary.
+    If the words belong only to the target domain, they are added to the overlay phrase table of this sentence.
+    OOV words gained back via the heuristic (signs, vowel_table, 'g' compounds) replace the word at its position in the sentence.
 
     Data changed
     ------------
     in_target : [(str , int)] - the string holds the word and integer holds the index of the word in the input sentence to ease orientation
     oov : [(str , int)] - the string holds the word and integer holds the index of the word in the input sentence to ease orientation
     oov_or_in_target : [(str , int)] - concatenated list of oov and in_target
+    overlay, overlay_lookup - entries for the in_target words
+    to_translate_input : str - the input sentence with the gained back words
     """
     def find_oov(self):
         input_list = self.to_translate_input.split()
+        unknown = 0
 
         # iteration over each word in the input sentence
-        index = 0
-        for word in input_list:
-            if word not in self.corpus.lookup_dict:
-                # if the word appears in the target values (the orth form), it is observed as if it has the same meaning 
-                # is added to the table_phrase to save a redundant <UNK> tag replacement
-                if word in [x for v in self.corpus.lookup_dict.values() for x in v]: 
-                    self.in_target.append((word, index))
-                    
-                    # casting the word into a unigram to match the search in the phrase table
-                    item_gram = ngrams([word], 1)
-                    unigram_item_list = [gram for gram in item_gram]
-                    self.corpus.phrase_table.add(unigram_item_list[0], unigram_item_list[0], 1.0)
-                    self.corpus.lookup_dict[word] = [(word, 1)]
-                
-                # if the word does not appear at all in our dictionary will be noticed
-                else:
-                    self.oov.append((word, index))
-
-            index += 1
+        for index, word in enumerate(input_list):
+            if self.in_lookup_dict(word):
+                continue
 
+            unknown += 1
+            category, resolved = self.corpus.resolve_oov(word)
+
+            # if the word appears in the target values (the orth form), it is observed as if it has the same meaning 
+            # is added to the overlay to save a redundant <UNK> tag replacement
+            if category == 'in_target':
+                self.in_target.append((word, index))
+                self.add_in_target_word(word)
+
+            # underscores or slashes prevented the system from finding the word in the dictionary
+            elif category == 'cleaned':
+                input_list[index] = resolved
+
+            # changed via the vowel_table into a word of the source language
+            elif category == 'fixed':
+                input_list[index] = resolved
+                self.fixed_oov.append([word, resolved])
+                logger.debug('The word: %s was changed to: %s', word, resolved)
+
+            # changed via the vowel_table into a word of the target language
+            elif category == 'fixed_in_target':
+                input_list[index] = resolved
+                self.in_target.append((resolved, index))
+                self.add_in_target_word(resolved)
+                self.fixed_oov.append([word, resolved])
+
+            # a 'g' compound stays tagged as OOV because it is not part of the language model, but it is inserted back in its 'ge' form
+            elif category == 'compound':
+                self.oov.append((resolved, index))
+                self.fixed_oov.append([word, resolved])
+
+            # if the word does not appear at all in our dictionary will be noticed
+            else:
+                self.oov.append((word, index))
+
+        self.to_translate_input = " ".join(input_list)
         self.oov_or_in_target = self.oov + self.in_target
+        WORDS.inc(len(input_list))
+        UNKNOWN_WORDS.inc(unknown)
+        OOV_WORDS.inc(len(self.oov))
+        
+        self.corpus.record_sentence_effects(*self.side_effects()) # Keeping track of the main OOV lists of the corpus
 
-        # if the word exists is in the dictionary without the special signs, filter out and change the original input
-        # is checked only for non-punctuation entries
-        # iterating only over self.oov because the self.in_traget list has already been handled
-        index_oov = len(self.oov) - 1
-        for item in reversed(self.oov):
-            # rechecking if underscores prevent the system from finding the word in the dictionary, if so change the to be translated sentence 
-            if re.sub(r"_", "", item[0]) in self.corpus.lookup_dict:
-                if item in self.oov_or_in_target: self.oov_or_in_target.remove(item)
-                self.oov.remove(item)
-                self.to_translate_input = re.sub(item[0], re.sub(r"_", "", item[0]), self.to_translate_input)
-                continue
+    """Checks if a word is known to the corpus or to the overlay of this sentence
 
-            # rechecking if slashes prevent the system from finding the word in the dictionary, if so change the to be translated sentence 
-            if re.sub(r"\\", "", item[0]) in self.corpus.lookup_dict:
-                if item in self.oov_or_in_target: self.oov_or_in_target.remove(item)
-                self.oov.remove(item)
-                self.to_translate_input = re.sub(item[0], re.sub(r"\\", "", item[0]), self.to_translate_input)
-                continue
+    Parameters
+    ----------
+    word : str - the word in the source language
 
-            # training to regain OOV words based on the predefined vowel_table
-            # if the changed word exists in the lookup dictionary, accept the change and rebuild with it the to be translated sentence
-            changed_vowel = False
-            for vowel in self.corpus.vowel_table:
-                if not changed_vowel and re.search(vowel, item[0]):
-                        for i in range(len(self.corpus.vowel_table[vowel])):
-                            # if the word exists in the lookup dictionary as a key, update the oov and oov_or_in_target lists and the to_translate_input 
-                            if item[0].replace(vowel, self.corpus.vowel_table[vowel][i]) in self.corpus.lookup_dict and not changed_vowel:
-                                if item in self.oov_or_in_target: self.oov_or_in_target.remove(item)
-                                if item in self.oov: self.oov.remove(item)
-                                self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][i]))
-                                print('The word: ', item[0], ' was changed, new sentence: ', self.to_translate_input)
-                                self.corpus.fixed_oov.append([item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][i])])
-                                changed_vowel = True 
-                            
-                            # if the word exists in the target language - update phrase_table, oov and in_target lists and the to_translate_input
-                            if item[0].replace(vowel, self.corpus.vowel_table[vowel][i]) in [x for v in self.corpus.lookup_dict.values() for x in v] and not changed_vowel:
-                                self.in_target.append((item[0].replace(vowel, self.corpus.vowel_table[vowel][i]) ,item[1]))
-                                
-                                item_gram = ngrams([self.in_target[len(self.in_target) - 1]], 1)
-                                unigram_item_list = [gram for gram in item_gram]
-                                self.corpus.phrase_table.add(unigram_item_list[0], unigram_item_list[0], 1.0)
-                                self.corpus.lookup_dict[self.in_target[len(self.in_target) - 1]] = [(self.in_target[len(self.in_target) - 1], 1)]
-                                
-                                if item in self.oov: self.oov.remove(item)
-                                self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][0]))
-                                self.corpus.fixed_oov.append([item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][i])])
-                                changed_vowel = True
-                            
-                            # if the word exists in its capitalized version in the target language - update phrase_table, oov and in_target lists and the to_translate_input
-                            if item[0].replace(vowel, self.corpus.vowel_table[vowel][i]).capitalize() in [x for v in self.corpus.lookup_dict.values() for x in v] and not changed_vowel:
-                                self.in_target.append((item[0].replace(vowel, self.corpus.vowel_table[vowel][i]) ,item[1]).capitalize())
-
-                                item_gram = ngrams([self.in_target[len(self.in_target) - 1]], 1)
-                                unigram_item_list = [gram for gram in item_gram]
-                                self.corpus.phrase_table.add(unigram_item_list[0], unigram_item_list[0], 1.0)
-                                self.corpus.lookup_dict[self.in_target[len(self.in_target) - 1]] = [(self.in_target[len(self.in_target) - 1], 1)]
-
-                                if item in self.oov: self.oov.remove(item)
-                                self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][i]).capitalize())
-                                self.corpus.fixed_oov.append([item[0], item[0].replace(vowel, self.corpus.vowel_table[vowel][i]).capitalize()])
-                                changed_vowel = True
-                            
-                            # handling the special case of the past form where the word construction includes the letter g for compounding
-                            # once the word is forced to replace the vowel to "ge" it stays tagged as OOV 
-                            # because it is not part of the language model, thus return value would be an empty string
-                            if vowel == "g" and not changed_vowel and not re.search("ge", item[0]):
-                                # g at the beginning of the word
-                                if item[0][0] == vowel:
-                                    # if the part - word is dialect, rewrite the part with its translation (based on highest probability)
-                                    if item[0][1:] in self.corpus.lookup_dict:
-                                        item = (item[0].replace(item[0][1:], self.corpus.translate_single_input(item[0][1:])), item[1])
-                                        self.oov[index_oov] = (item[0].replace("g", "ge").lower(), self.oov[index_oov][1])
-                                        self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace("g", "ge").lower())
-                                        self.corpus.fixed_oov.append([item[0], item[0].replace("g", "ge").lower()])
-                                        changed_vowel = True  
-                                    # if the part - word is in the target language - just commit the update to the OOV list
-                                    elif item[0][1:] in [x for v in self.corpus.lookup_dict.values() for x in v]:
-                                        self.oov[index_oov] = (item[0].replace("g", "ge").lower(), self.oov[index_oov][1])
-                                        self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace("g", "ge").lower())
-                                        self.corpus.fixed_oov.append([item[0], item[0].replace("g", "ge").lower()])
-                                        changed_vowel = True  
-                                        
-                                # the word is built out of two words together connected with 'g'
-                                else:
-                                    parts = item[0].split(vowel, 1) # splits only on the first 'g' occurrence
-                                    in_dict = []
-                                    for part in parts:
-                                        if len(part) > 1 and part in self.corpus.lookup_dict: 
-                                            item = (item[0].replace(part, self.corpus.translate_single_input(part)), item[1]) 
-                                            in_dict.append(True)
-                                        elif len(part) > 1 and part in [x for v in self.corpus.lookup_dict.values() for x in v]:
-                                            in_dict.append(True)
-
-                                    # if both words appear in the dictionary - commit the update to the OOV list
-                                    if len(in_dict) == 2:
-                                        self.oov[index_oov] = (item[0].replace("g", "ge").lower(), self.oov[index_oov][1])
-                                        self.to_translate_input = self.to_translate_input.replace(item[0], item[0].replace("g", "ge").lower())
-                                        self.corpus.fixed_oov.append([item[0], item[0].replace("g", "ge").lower()])
-                                        changed_vowel = True  
-            
-            index_oov -= 1                                
-                                    
-        
-        self.corpus.oov += [item[0] for item in self.oov] # Keeping track of the main OOV list of the corpus
\ No newline at end of file
+    Returns
+    -------
+    bool
+    """
+    def in_lookup_dict(self, word):
+        return word in self.corpus.lookup_dict or word in self.overlay_lookup
+
+    """Adds a word that appears only in the target language to the overlay of this sentence as a translation of itself.
+    The word is remembered, so the corpus can learn it afterwards if it is in the "learn during run" mode.
+
+    Parameters
+    ----------
+    word : str - the orth form
+    """
+    def add_in_target_word(self, word):
+        if word not in self.overlay_lookup:
+            self.overlay.add((word,), (word,), 1.0)
+            self.overlay_lookup[word] = [(word, 1)]
+        self.learned_words.append(word)
+
+    """Returns the changes this sentence makes to the corpus in a picklable form.
+
+    Returns
+    -------
+    ([[str, str]], [str], [str])
+        fixed_oov, the remaining OOV words and the learned in target words, as expected by Corpora.record_sentence_effects
+    """
+    def side_effects(self):
+        return self.fixed_oov, [item[0] for item in self.oov], self.learned_words
\ No newline at end of file
@@ -0,0 +1,107 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from InputSentence import normalize_sentence
+
+"""
+This class caches the translations of whole sentences.
+Spoken language repeats many short sentences (backchannels, fixed phrases), each of them needs to be decoded only once.
+The cache keeps the most recently used translations in memory (LRU) and can persist them in a SQLite file,
+thus reruns (e.g. after a partial failure) skip the already decoded sentences.
+Each entry belongs to the fingerprint of the model it was translated with (see Corpora.fingerprint).
+The side effects of the translation (see InputSentence.side_effects) are kept with it,
+thus a sentence served from the cache counts in the OOV statistics (and learns its in target words) like a translated one.
+
+"""
+class TranslationCache:
+    """Constructor for the TranslationCache class
+
+    Parameters
+    ----------
+    fingerprint : str - the fingerprint of the model, entries of other models are not used
+    max_size : int - maximum number of translations kept in memory, 0 keeps none
+    path : str - file location of the persistent SQLite store (optional)
+    commit_interval : int - number of new entries after which the persistent store is committed
+    """
+    def __init__(self, fingerprint, max_size=100000, path=None, commit_interval=1000):
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.commit_interval = commit_interval
+        self.entries = OrderedDict() # normalized sentence -> (translation, side effects), least recently used first
+
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = None
+        self.uncommitted = 0
+        if path:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS translations (fingerprint TEXT, sentence TEXT, translation TEXT, side_effects TEXT, PRIMARY KEY (fingerprint, sentence))")
+
+    """Looks up the translation of a sentence
+
+    Parameters
+    ----------
+    sentence : str - the raw input sentence
+
+    Returns
+    -------
+    (str, ([[str, str]], [str], [str])) or None
+        the cached translation and its side effects (fixed OOV, OOV, in target words), None on a miss
+    """
+    def get(self, sentence):
+        key = normalize_sentence(sentence)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.connection:
+            row = self.connection.execute("SELECT translation, side_effects FROM translations WHERE fingerprint = ? AND sentence = ?", (self.fingerprint, key)).fetchone()
+            if row:
+                entry = row[0], tuple(json.loads(row[1]))
+                self.remember(key, entry)
+                self.hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+    """Adds the translation of a sentence
+
+    Parameters
+    ----------
+    sentence : str - the raw input sentence
+    translation : str - its translation
+    side_effects : ([[str, str]], [str], [str]) - fixed OOV, OOV and in target words of the sentence, see InputSentence.side_effects
+    """
+    def put(self, sentence, translation, side_effects):
+        key = normalize_sentence(sentence)
+        self.remember(key, (translation, side_effects))
+
+        if self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                                    (self.fingerprint, key, translation, json.dumps(side_effects, ensure_ascii=False)))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_interval:
+                self.connection.commit()
+                self.uncommitted = 0
+
+    def remember(self, key, entry):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    """Commits and closes the persistent store
+    """
+    def close(self):
+        if self.connection:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
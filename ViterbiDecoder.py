@@ -0,0 +1,95 @@
+import warnings
+
+"""
+This class contains a monotone decoder that can be used instead of the nltk StackDecoder.
+The phrase table of the corpus consists only of position aligned uni-, bi- and trigrams and the distortion factor is set to 0,
+therefore every translation is monotone and the best translation can be found exactly via dynamic programming over the source positions.
+
+"""
+class ViterbiDecoder:
+    """Constructor for the ViterbiDecoder class.
+    The interface matches the one of the nltk StackDecoder (phrase_table, language_model, word_penalty and translate).
+
+    Parameters
+    ----------
+    phrase_table : PhraseTable - table of translations for the source phrases and their (log) probabilities
+    language_model : object - must define a probability_change(context, phrase) method, context is the last two target words
+    max_phrase_length : int - the longest source phrase in the phrase table, 3 for a trigram based table
+    """
+    def __init__(self, phrase_table, language_model, max_phrase_length=3):
+        self.phrase_table = phrase_table
+        self.language_model = language_model
+        self.max_phrase_length = max_phrase_length
+        self.word_penalty = 0.0
+        self.budget = None # DecodeBudget charged per scored hypothesis, see decode_budget
+
+    """Translates a sentence
+
+    Parameters
+    ----------
+    src_sentence : [str] - the words of the sentence to be translated
+
+    Returns
+    -------
+    [str]
+        the words of the best translation, empty list if the sentence can not be translated as a whole
+    """
+    def translate(self, src_sentence):
+        return self.search(src_sentence)[1]
+
+    """Finds the best monotone translation and its score.
+    chart[i] holds per trigram language model state (the last two target words) the best hypothesis covering the first i source words.
+    Each hypothesis is saved as (score, previous position, previous state, target phrase) to allow backtracking.
+
+    Parameters
+    ----------
+    src_sentence : [str] - the words of the sentence to be translated
+
+    Returns
+    -------
+    (float, [str])
+        the score of the best path and its translation, (None, []) if no translation covers the whole sentence
+    """
+    def search(self, src_sentence):
+        sentence = tuple(src_sentence)
+        sentence_length = len(sentence)
+        chart = [{} for _ in range(sentence_length + 1)]
+        chart[0][()] = (0.0, None, None, ())
+        budget = self.budget
+
+        for start in range(sentence_length):
+            if not chart[start]:
+                continue
+
+            for end in range(start + 1, min(sentence_length, start + self.max_phrase_length) + 1):
+                src_phrase = sentence[start:end]
+                if src_phrase not in self.phrase_table:
+                    continue
+
+                for option in self.phrase_table.translations_for(src_phrase):
+                    phrase_score = option.log_prob - self.word_penalty * len(option.trg_phrase)
+
+                    for state, hypothesis in chart[start].items():
+                        if budget is not None:
+                            budget.spend()
+                        score = hypothesis[0] + phrase_score + self.language_model.probability_change(state, option.trg_phrase)
+                        next_state = (state + option.trg_phrase)[-2:]
+                        best = chart[end].get(next_state)
+                        if best is None or score > best[0]:
+                            chart[end][next_state] = (score, start, state, option.trg_phrase)
+
+        if not chart[sentence_length]:
+            warnings.warn("Unable to translate all words. The source sentence contains words not in the phrase table")
+            return None, []
+
+        # backtracking from the best final state
+        state = max(chart[sentence_length], key=lambda item: chart[sentence_length][item][0])
+        best_score = chart[sentence_length][state][0]
+        phrases = []
+        position = sentence_length
+        while position > 0:
+            _, previous_position, previous_state, trg_phrase = chart[position][state]
+            phrases.append(trg_phrase)
+            position, state = previous_position, previous_state
+
+        return best_score, [word for phrase in reversed(phrases) for word in phrase]
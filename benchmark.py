@@ -0,0 +1,365 @@
+from Corpora import Corpora
+from InputSentence import InputSentence
+from process_tokens import create_sentences
+from main import process_into_queries
+import update_database
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+"""This module provides a benchmark of the translation pipeline on synthetic data, no training spreadsheet or database content is needed.
+
+A synthetic lexicon of standard German like words and their Viennese like dialect forms is generated
+(built with the inverse of the vowel_table rules, e.g. "weiß" -> "waaß", "gegangen" -> "ggongen"),
+the words are drawn from a Zipf distribution. Out of the lexicon the benchmark generates
+- a parallel corpus (sentorig, sentorth) like Training_data.xlsx, with markup ([lachen], timers, (?)) and fragments,
+- a token stream like the token table, with GAT2 markup (((lacht)), (.), :, =, hm) and unknown words at the given OOV rate.
+
+Each stage is timed on its own and the results are written as json, e.g.
+
+python benchmark.py --sentences 20000 --transcripts 20 --output bench.json
+"""
+
+# common words of the real data, they get the highest ranks of the Zipf distribution
+SEED_LEXICON = [("i", "ich"), ("des", "das"), ("is", "ist"), ("ned", "nicht"), ("a", "eine"), ("und", "und"), ("so", "so"), ("ja", "ja"),
+                ("hob", "habe"), ("mia", "wir"), ("san", "sind"), ("in", "in"), ("wos", "was"), ("do", "da"), ("woa", "war"), ("de", "die"),
+                ("oba", "aber"), ("scho", "schon"), ("no", "noch"), ("wia", "wie"), ("daun", "dann"), ("guat", "gut"), ("waß", "weiß"),
+                ("vü", "viel"), ("heit", "heute"), ("nix", "nichts"), ("hoit", "halt"), ("mei", "mein"), ("wien", "Wien"), ("jo", "ja")]
+
+ONSETS = ['b', 'd', 'f', 'g', 'h', 'k', 'l', 'm', 'n', 'p', 'r', 's', 'sch', 'st', 't', 'w', 'z', 'br', 'gr', 'kl', 'tr']
+NUCLEI = ['a', 'e', 'i', 'o', 'u', 'ei', 'au', 'ä', 'ö', 'ü']
+CODAS = ['', '', 'n', 't', 'r', 'l', 's', 'ch', 'nd', 'st', 'll']
+
+# standard form -> dialect forms, the inverse of Corpora.create_vowel_table, the longest match is applied first
+DIALECT_RULES = [('all', ('oi',)), ('ei', ('aa', 'ää')), ('ai', ('aa',)), ('au', ('oo',)), ('el', ('öö',)), ('a', ('o', 'a')), ('b', ('w', 'b'))]
+
+GAT2_MARKUP = ['((lacht))', '(.)', '(-)', ':', 'hm', 'ähm', '((räuspert sich))']
+PUNCTUATION = ['.', '.', '.', ',', '?']
+
+"""Turns a standard form into a dialect form via the inverse vowel_table rules
+
+Parameters
+----------
+word : str - the standard form
+rng : numpy.random.Generator
+
+Returns
+-------
+str
+"""
+def dialect_form(word, rng):
+    word = word.lower()
+    if word.startswith('ge') and len(word) > 4:
+        word = 'g' + word[2:]
+    form = ''
+    index = 0
+    while index < len(word):
+        for standard, variants in DIALECT_RULES:
+            if word.startswith(standard, index):
+                form += variants[rng.integers(len(variants))]
+                index += len(standard)
+                break
+        else:
+            form += word[index]
+            index += 1
+    if form.endswith('en') and len(form) > 4:
+        form = form[:-2] + 'n'
+    return form
+
+"""Generates the lexicon of (dialect form, standard form) pairs, the seed words first
+
+Parameters
+----------
+size : int - number of pairs
+rng : numpy.random.Generator
+
+Returns
+-------
+[(str, str)]
+"""
+def make_lexicon(size, rng):
+    lexicon = list(SEED_LEXICON[:size])
+    known = set(pair[1] for pair in lexicon)
+    while len(lexicon) < size:
+        word = ''.join(ONSETS[rng.integers(len(ONSETS))] + NUCLEI[rng.integers(len(NUCLEI))] + CODAS[rng.integers(len(CODAS))] for _ in range(rng.integers(1, 4)))
+        if rng.random() < 0.15:
+            word = 'ge' + word + 'en' # past participle
+        elif rng.random() < 0.25:
+            word = word.capitalize() # noun
+        if word in known:
+            continue
+        known.add(word)
+        lexicon.append((dialect_form(word, rng), word))
+    return lexicon
+
+"""Draws word positions of the lexicon following a Zipf distribution
+
+Parameters
+----------
+size : int - number of words in the lexicon
+count : int - number of draws
+rng : numpy.random.Generator
+exponent : float - the Zipf exponent, about 1 for natural language
+
+Returns
+-------
+numpy.ndarray
+"""
+def zipf_draws(size, count, rng, exponent=1.1):
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return rng.choice(size, size=count, p=weights / weights.sum())
+
+"""Draws sentence lengths, most sentences of the transcripts are short
+
+Returns
+-------
+numpy.ndarray
+"""
+def sentence_lengths(count, rng, mean_words=7.0):
+    return np.clip(np.rint(rng.lognormal(np.log(mean_words) - 0.18, 0.6, count)), 1, 40).astype(int)
+
+"""Generates the parallel training data, shaped like Training_data.xlsx
+
+Parameters
+----------
+lexicon : [(str, str)] - see make_lexicon
+count : int - number of parallel sentences
+rng : numpy.random.Generator
+
+Returns
+-------
+pandas.DataFrame
+    columns sentorig and sentorth
+"""
+def make_parallel_corpus(lexicon, count, rng):
+    lengths = sentence_lengths(count, rng)
+    draws = zipf_draws(len(lexicon), int(lengths.sum()), rng)
+    rows = []
+    offset = 0
+    for length in lengths.tolist():
+        pairs = [lexicon[index] for index in draws[offset:offset + length].tolist()]
+        offset += length
+        orig = [pair[0] for pair in pairs]
+        orth = [pair[1] for pair in pairs]
+        markup = rng.random()
+        if markup < 0.05:
+            orig.insert(rng.integers(len(orig) + 1), '[lachen]')
+        elif markup < 0.08:
+            orig.insert(rng.integers(len(orig) + 1), '[' + str(rng.integers(1, 9)) + ',' + str(rng.integers(10)) + 's]')
+        elif markup < 0.10:
+            orig.append('(?)')
+        elif markup < 0.13 and len(orig[-1]) > 2:
+            orig.append(orig[-1][-2:]) # fragment of the previous word, gained back by handle_diff_lengths
+        punctuation = PUNCTUATION[rng.integers(len(PUNCTUATION))]
+        rows.append((' '.join(orig + [punctuation]), ' '.join(orth + [punctuation])))
+    return pd.DataFrame(rows, columns=['sentorig', 'sentorth'])
+
+"""Returns a word that is not in the lexicon: a vowel_table variant, a word with signs, a 'g' compound or a new word
+
+Parameters
+----------
+lexicon : [(str, str)]
+rng : numpy.random.Generator
+
+Returns
+-------
+str
+"""
+def unknown_word(lexicon, rng):
+    dialect, standard = lexicon[rng.integers(len(lexicon))]
+    kind = rng.integers(4)
+    if kind == 0:
+        return dialect_form(standard, rng) + 'e' # no rule turns it back, stays OOV in most cases
+    if kind == 1:
+        return dialect + '_'
+    if kind == 2:
+        return 'g' + standard.lower()
+    return ''.join(ONSETS[rng.integers(len(ONSETS))] + NUCLEI[rng.integers(len(NUCLEI))] for _ in range(3))
+
+"""Generates the tokens of transcripts the way stream_tokens returns them
+
+Parameters
+----------
+lexicon : [(str, str)] - see make_lexicon
+transcripts : int - number of transcripts
+tokens_per_transcript : int
+speakers : int - speakers per transcript
+oov_rate : float - share of the words that are not in the lexicon
+rng : numpy.random.Generator
+
+Returns
+-------
+{int: {int: [dict]}}
+    transcript_id -> speaker_id -> token dicts (see process_tokens.TOKEN_FIELDS), ordered by token_reihung
+"""
+def make_transcripts(lexicon, transcripts, tokens_per_transcript, speakers, oov_rate, rng):
+    transcript_objects = {}
+    token_id = 0
+    for transcript_id in range(1, transcripts + 1):
+        speaker_tokens = {speaker_id: [] for speaker_id in range(1, speakers + 1)}
+        draws = zipf_draws(len(lexicon), tokens_per_transcript, rng).tolist()
+        lengths = iter(sentence_lengths(tokens_per_transcript, rng).tolist())
+        remaining = next(lengths)
+        speaker_id = 1
+        for reihung in range(1, tokens_per_transcript + 1):
+            token_id += 1
+            chance = rng.random()
+            if remaining == 0:
+                text = PUNCTUATION[rng.integers(len(PUNCTUATION))]
+                remaining = next(lengths)
+            elif chance < 0.06:
+                text = GAT2_MARKUP[rng.integers(len(GAT2_MARKUP))]
+            else:
+                text = unknown_word(lexicon, rng) if rng.random() < oov_rate else lexicon[draws[reihung - 1]][0]
+                if chance > 0.97:
+                    text += ':' if chance > 0.985 else '=' # lengthening or latching
+                remaining -= 1
+            speaker_tokens[speaker_id].append({"id": token_id, "text": text, "ortho": None, "ID_Inf_id": speaker_id, "token_reihung": reihung, "updated": None})
+            if text in PUNCTUATION and rng.random() < 0.4:
+                speaker_id = int(rng.integers(1, speakers + 1)) # turn taking
+        transcript_objects[transcript_id] = speaker_tokens
+    return transcript_objects
+
+"""Sums up the time spent in a method while the context is active
+
+Parameters
+----------
+owner : class - e.g. InputSentence
+name : str - the name of the method
+timing : dict - "seconds" and "calls" are increased
+"""
+@contextmanager
+def measure_method(owner, name, timing):
+    method = getattr(owner, name)
+
+    def measured(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timing["seconds"] += time.perf_counter() - start
+            timing["calls"] += 1
+
+    setattr(owner, name, measured)
+    try:
+        yield timing
+    finally:
+        setattr(owner, name, method)
+
+def stage(seconds, items, unit):
+    return {"seconds": round(seconds, 4), unit: items, unit + "_per_second": round(items / seconds, 1) if seconds else None}
+
+"""Writes the translated tokens into a temporary copy of the token table of a local PostgreSQL database (see .env).
+The TEMP table shadows the token table in this session, the data of the database is not touched.
+
+Parameters
+----------
+tokens : [dict] - all generated tokens
+updates : [(int, str)] - (token_id, ortho)
+chunk_size : int - see update_database.bulkUpdateDB
+
+Returns
+-------
+dict
+    the timing of loading the tokens and of the bulk update
+"""
+def benchmark_database(tokens, updates, chunk_size):
+    connection = update_database.connectDB()
+    cursor = connection.cursor()
+    cursor.execute("CREATE TEMP TABLE token (id integer PRIMARY KEY, text text, ortho text, updated timestamptz DEFAULT now())")
+    start = time.perf_counter()
+    cursor.executemany("INSERT INTO token (id, text) VALUES (%s, %s)", [(token["id"], token["text"]) for token in tokens])
+    connection.commit()
+    load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updated = update_database.bulkUpdateDB(iter(updates), connection, chunk_size)
+    write = time.perf_counter() - start
+    start = time.perf_counter()
+    unchanged = update_database.bulkUpdateDB(iter(updates), connection, chunk_size) # second pass, nothing changes
+    rewrite = time.perf_counter() - start
+    update_database.closeConnectionDB(connection)
+    return {"load": stage(load, len(tokens), "rows"), "bulk_update": dict(stage(write, len(updates), "rows"), updated=updated),
+            "bulk_update_unchanged": dict(stage(rewrite, len(updates), "rows"), updated=unchanged)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks training, sentence building, OOV handling, decoding and writing on synthetic data")
+    parser.add_argument("--sentences", type=int, default=5000, help="parallel sentences of the training data")
+    parser.add_argument("--vocabulary", type=int, default=3000, help="word pairs of the synthetic lexicon")
+    parser.add_argument("--transcripts", type=int, default=5, help="transcripts of the token stream")
+    parser.add_argument("--tokens", type=int, default=4000, help="tokens per transcript")
+    parser.add_argument("--speakers", type=int, default=3, help="speakers per transcript")
+    parser.add_argument("--oov-rate", type=float, default=0.05, help="share of the words of the token stream that are not in the lexicon")
+    parser.add_argument("--translate", type=int, default=500, help="number of sentences translated, 0 translates all")
+    parser.add_argument("--decoder", choices=["stack", "viterbi"], default="stack", help="decoder engine used for the translation")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generator, the same seed generates the same data")
+    parser.add_argument("--database", action="store_true", help="also benchmark the bulk update against the database of the .env file (in a temporary table)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows per transaction of the bulk update")
+    parser.add_argument("--output", default="benchmark.json", help="json file the results are written to")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = {"settings": vars(args), "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "commit": git_commit()}, "stages": {}}
+    stages = results["stages"]
+
+    start = time.perf_counter()
+    lexicon = make_lexicon(args.vocabulary, rng)
+    parallel = make_parallel_corpus(lexicon, args.sentences, rng)
+    transcripts = make_transcripts(lexicon, args.transcripts, args.tokens, args.speakers, args.oov_rate, rng)
+    stages["generate"] = stage(time.perf_counter() - start, args.sentences + args.transcripts * args.tokens, "items")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "training.xlsx")
+        parallel.to_excel(path, index=False)
+        start = time.perf_counter()
+        corpus = Corpora(path, decoder=args.decoder)
+        stages["training"] = stage(time.perf_counter() - start, args.sentences, "sentences")
+    results["model"] = {"unigrams": len(corpus.lookup_dict), "bigrams": len(corpus.lookup_bigrams), "trigrams": len(corpus.lookup_trigrams), "language_model": len(corpus.language_prob)}
+
+    start = time.perf_counter()
+    sentences = [sentence for id in transcripts for sentence in create_sentences(transcripts[id]).values()]
+    stages["create_sentences"] = stage(time.perf_counter() - start, args.transcripts * args.tokens, "tokens")
+    selected = sentences[:args.translate] if args.translate else sentences
+
+    find_oov = {"seconds": 0.0, "calls": 0}
+    decoding = {"seconds": 0.0, "calls": 0}
+    start = time.perf_counter()
+    with measure_method(InputSentence, "find_oov", find_oov), measure_method(Corpora, "translate_with_decoder", decoding):
+        for sentence in selected:
+            sentence["translation"] = InputSentence(sentence["output_sentence"], corpus).stack_decoder_translation
+    stages["translation"] = stage(time.perf_counter() - start, len(selected), "sentences")
+    stages["find_oov"] = stage(find_oov["seconds"], find_oov["calls"], "sentences")
+    stages["decoding"] = stage(decoding["seconds"], decoding["calls"], "sentences")
+    words = sum(len(sentence["output_sentence"].split()) for sentence in selected)
+    oov, fixed = corpus.oov_statistics.oov_count(), corpus.oov_statistics.fixed_count()
+    results["oov"] = {"words": words, "oov": oov, "fixed": fixed, "oov_rate": round(oov / words, 4) if words else None}
+
+    start = time.perf_counter()
+    updates = [query for sentence in selected for query in process_into_queries(sentence)]
+    stages["queries"] = stage(time.perf_counter() - start, len(updates), "tokens")
+
+    if args.database:
+        tokens = [token for id in transcripts for speaker in transcripts[id].values() for token in speaker]
+        stages["database"] = benchmark_database(tokens, updates, args.chunk_size)
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=1)
+    for name, timing in stages.items():
+        print(name, json.dumps(timing))
+    print("Results written to ", args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+from nltk.translate import StackDecoder
+
+"""This module limits the search of the decoders per sentence (main.py --decode-timeout, --decode-max-hypotheses).
+Both decoders spend the budget per scored hypothesis and raise DecodeBudgetExceeded once it is used up,
+the sentence is then translated greedily word by word (see InputSentence.decode).
+"""
+
+"""Raised by a decoder when the budget of the sentence is used up
+"""
+class DecodeBudgetExceeded(Exception):
+    pass
+
+"""Limits the time and the number of hypotheses of the search for one sentence.
+A new instance is created for every sentence and set on the copy of the decoder that translates it (see Corpora.translate_with_decoder).
+"""
+class DecodeBudget:
+    CLOCK_INTERVAL = 32 # hypotheses between two looks at the clock
+
+    """Constructor for the DecodeBudget class
+
+    Parameters
+    ----------
+    seconds : float - the time per sentence, None for no time limit
+    hypotheses : int - the number of scored hypotheses per sentence, None for no limit
+    """
+    def __init__(self, seconds=None, hypotheses=None):
+        self.seconds = seconds
+        self.hypotheses = hypotheses
+        self.spent = 0
+        self.deadline = time.perf_counter() + seconds if seconds else None
+
+    """Counts one scored hypothesis
+
+    Raises
+    ------
+    DecodeBudgetExceeded
+        if the number of hypotheses or the time of the sentence is used up
+    """
+    def spend(self):
+        self.spent += 1
+        if self.hypotheses and self.spent > self.hypotheses:
+            raise DecodeBudgetExceeded('More than ' + str(self.hypotheses) + ' hypotheses')
+        if self.spent % self.CLOCK_INTERVAL == 0:
+            self.check_time()
+
+    """Raises DecodeBudgetExceeded if the time of the sentence is used up, e.g. during a preparation step without hypotheses
+    """
+    def check_time(self):
+        if self.deadline and time.perf_counter() > self.deadline:
+            raise DecodeBudgetExceeded('More than ' + str(self.seconds) + ' seconds')
+
+"""The nltk StackDecoder, every new hypothesis is charged to the budget (if one is set)
+"""
+class BudgetStackDecoder(StackDecoder):
+    budget = None
+
+    def expansion_score(self, hypothesis, translation_option, src_phrase_span):
+        if self.budget is not None:
+            self.budget.spend()
+        return super().expansion_score(hypothesis, translation_option, src_phrase_span)
+
+    """The future scores of the nltk StackDecoder, computed before the first hypothesis in O(n^3) steps.
+    The time budget is checked before and after, a long sentence stops before its search starts.
+    """
+    def compute_future_scores(self, src_sentence):
+        if self.budget is not None:
+            self.budget.check_time()
+        scores = super().compute_future_scores(src_sentence)
+        if self.budget is not None:
+            self.budget.check_time()
+        return scores
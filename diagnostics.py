@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+from collections import Counter
+
+"""This module provides the logging of the translation and the OOV statistics.
+
+The modules log via named loggers below machine_translation (see get_logger) into corpora.log.
+The handler is installed once per process by setup_logging, by the entry points or the first Corpora instance.
+The log holds short messages only, the messages are formatted lazily and only if their level is enabled.
+
+Word lists (the gained back and the remaining OOV words) do not go through the log,
+they are counted in an OovStatistics and written as one json document (main.py --oov-report).
+"""
+
+LOGGER_NAME = 'machine_translation'
+LOG_FILE = 'corpora.log'
+
+log_handler = None # the handler installed by setup_logging, None before
+
+"""Returns the logger of a module
+
+Parameters
+----------
+name : str - the module name, e.g. __name__
+
+Returns
+-------
+logging.Logger
+    machine_translation.<name>, its messages reach the handler of setup_logging
+"""
+def get_logger(name):
+    return logging.getLogger(LOGGER_NAME + '.' + name)
+
+"""Installs the log file handler, only the first call of a process creates it, later calls can change the level
+
+Parameters
+----------
+path : str - the log file, truncated when the handler is created
+level : int or str - e.g. logging.DEBUG or 'INFO', None keeps the current level (INFO for a new handler)
+"""
+def setup_logging(path=LOG_FILE, level=None):
+    global log_handler
+    logger = logging.getLogger(LOGGER_NAME)
+    if log_handler is None:
+        log_handler = logging.FileHandler(path, 'w', 'utf-8', delay=True)
+        log_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(log_handler)
+        logger.setLevel(logging.INFO)
+    if level is not None:
+        logger.setLevel(level)
+
+"""Counts the gained back (fixed) and the remaining out-of-vocabulary words of the translated sentences.
+Only the distinct words are kept, thus the memory is bounded by the vocabulary of the input instead of its length.
+"""
+class OovStatistics:
+    def __init__(self):
+        self.fixed = Counter() # (word, changed form) -> occurrences
+        self.oov = Counter() # word -> occurrences
+
+    """Counts the OOV words of one sentence
+
+    Parameters
+    ----------
+    fixed_oov : [[str, str]] - gained back OOV words and their changed form
+    oov : [str] - the remaining OOV words
+    """
+    def record(self, fixed_oov, oov):
+        self.fixed.update((word, changed) for word, changed in fixed_oov)
+        self.oov.update(oov)
+
+    def fixed_count(self):
+        return sum(self.fixed.values())
+
+    def oov_count(self):
+        return sum(self.oov.values())
+
+    """Returns the statistics as a json compatible dict, the words ordered by their occurrences
+    """
+    def to_dict(self):
+        overall = self.fixed_count() + self.oov_count()
+        return {
+            'overall_oov': overall,
+            'fixed': self.fixed_count(),
+            'fixed_percent': 100 * self.fixed_count() / overall if overall else 0.0,
+            'changed': [{'word': word, 'changed': changed, 'count': count} for (word, changed), count in self.fixed.most_common()],
+            'oov': [{'word': word, 'count': count} for word, count in self.oov.most_common() if word not in (',', '.', '!', '?')],
+        }
+
+    """Writes the statistics as json, the file is replaced atomically
+
+    Parameters
+    ----------
+    path : str - the file location
+    """
+    def write(self, path):
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as report_file:
+            json.dump(self.to_dict(), report_file, ensure_ascii=False, indent=1)
+        os.replace(temporary, path)
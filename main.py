@@ -1,51 +1,354 @@
 from Corpora import Corpora
-from InputSentence import InputSentence
-from process_tokens import get_settings, closeConnectionDB
-import logging
+from InputSentence import InputSentence, normalize_sentence
+from process_tokens import get_settings, connectDB, closeConnectionDB, get_transcripts_IDs_ViennaNear, stream_tokens, stream_sentences, get_sentence_vocabulary, get_database_time
+from run_state import RunState
+from update_spool import SpoolWriter
+from TranslationCache import TranslationCache
+import update_database
+import metrics
+import profiling
+import diagnostics
+from collections import deque
+from itertools import islice
+import argparse
+import multiprocessing
+
+worker_corpus = None # the read-only corpus of a worker process, inherited via fork or loaded from the saved model
+
+logger = diagnostics.get_logger(__name__)
+
+QUERIES_SECONDS = metrics.histogram('queries_seconds', 'Time per sentence for turning the translation into token updates')
 
 def main():
+    parser = argparse.ArgumentParser(description="Translates the tokens of the selected transcripts into standard orthography")
+    parser.add_argument("--decoder", choices=["stack", "viterbi"], default="stack", help="decoder engine used for the translation")
+    parser.add_argument("--model", default="./trained_model", help="directory of the saved model, retrained if missing or older than the training data")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes translating the sentences in parallel")
+    parser.add_argument("--learn", action="store_true", help="add words found only in the target language to the model while translating")
+    parser.add_argument("--train-workers", type=int, default=1, help="number of processes counting the training data in shards, if the model has to be trained")
+    parser.add_argument("--spool", default="./updates.spool.jsonl", help="spool file the token updates are written to, consumed by update_database.py")
+    parser.add_argument("--stream", action="store_true", help="stream tokens, sentences and updates instead of loading all transcripts into memory first")
+    parser.add_argument("--incremental", action="store_true", help="translate only the sentences with tokens changed since the last run or without ortho, implies --stream, requires --write-db")
+    parser.add_argument("--state", default="./run_state.json", help="file keeping the watermark of each transcript for --incremental and the checkpoints of the run")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run after its last completed transcript, see --state")
+    parser.add_argument("--write-db", action="store_true", help="write the updates directly to the database (bulk update) instead of the spool")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows per transaction for --write-db")
+    parser.add_argument("--cache", help="SQLite file that keeps the sentence translations across runs")
+    parser.add_argument("--cache-size", type=int, default=100000, help="number of sentence translations kept in memory, 0 disables the in-memory cache")
+    parser.add_argument("--decode-timeout", type=float, help="seconds the decoder may search per sentence, afterwards the sentence is translated greedily word by word")
+    parser.add_argument("--decode-max-hypotheses", type=int, help="hypotheses the decoder may score per sentence, afterwards the sentence is translated greedily word by word")
+    parser.add_argument("--batch-size", type=int, default=2000, help="sentences planned together, identical sentences of a batch are translated once")
+    parser.add_argument("--add-sentences", help="xlsx or csv file with new parallel sentences (sentorig, sentorth) added to the saved model without retraining, then exit")
+    parser.add_argument("--oov-cache", help="json file with the resolved OOV words, loaded before and saved after the run")
+    parser.add_argument("--precompute-oov", action="store_true", help="resolve the OOV words of all tokens of the selected transcripts into --oov-cache and exit")
+    parser.add_argument("--metrics", help="Prometheus text file the metrics are written to at every checkpoint and at the end")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING"], default="INFO", help="level of corpora.log, DEBUG adds the training statistics and every changed OOV word")
+    parser.add_argument("--oov-report", help="json file the gained back and the remaining OOV words with their occurrences are written to at the end")
+    parser.add_argument("--profile", metavar="PREFIX", help="run under the profiler and write PREFIX.pstats, PREFIX.txt, PREFIX.collapsed (flamegraph) and PREFIX.memory.txt (tracemalloc), see profiling.py")
+    args = parser.parse_args()
+    if args.incremental and not args.write_db:
+        parser.error("--incremental requires --write-db, the watermarks are moved once the updates are committed to the database")
+    diagnostics.setup_logging(level=args.log_level)
+
+    with profiling.profile(args.profile):
+        run(parser, args)
+
+# Input: the argument parser and the parsed arguments of main
+# Output: the translated tokens are written to the spool or the database, see main
+def run(parser, args):
     print("griaß di")
-    corpus = Corpora("./Training_data.xlsx")
-
-    # creating logger
-    root_logger= logging.getLogger()
-    root_logger.setLevel(logging.DEBUG) 
-    handler = logging.FileHandler('Queries.log', 'w', 'utf-8') 
-    formatter = logging.Formatter('%(message)s') 
-    handler.setFormatter(formatter) 
-    root_logger.addHandler(handler)
- 
-    transcripts_ids ,sentence_objects, connection = get_settings()
-
-    queries = {} # per transcript, all queries are stored as an array
-
-    for id in transcripts_ids:
-        queries[id] = []
-        for key in sentence_objects[id].keys():
-            o = sentence_objects[id][key]
-            sntc = InputSentence(o["output_sentence"], corpus)
-            sentence_objects[id][key]["translation"] = sntc.stack_decoder_translation
-            queries[id].extend(process_into_queries(sentence_objects[id][key]))
-        logging.debug(queries[id])
+    corpus = Corpora.load_or_train(args.model, "./Training_data.xlsx", decoder=args.decoder, learn=args.learn, training_workers=args.train_workers)
+    profiling.snapshot("model loaded")
+    corpus.set_decode_budget(args.decode_timeout, args.decode_max_hypotheses)
+    if args.add_sentences:
+        print(corpus.add_parallel_data(args.add_sentences), " parallel sentences added to the lookup tables from ", args.add_sentences)
+        corpus.save(args.model)
+        return
+
+    if args.learn and args.workers > 1:
+        print("--learn translates the sentences in one process, --workers ", args.workers, " is not used for translating")
+
+    if args.oov_cache and args.learn:
+        print("--learn changes the OOV resolutions while translating, ", args.oov_cache, " is neither loaded nor saved")
+    elif args.oov_cache and corpus.load_oov_resolutions(args.oov_cache):
+        print("Loaded ", len(corpus.oov_resolutions), " OOV resolutions from ", args.oov_cache)
+
+    if args.precompute_oov:
+        if not args.oov_cache:
+            parser.error("--precompute-oov requires --oov-cache")
+        connection = connectDB()
+        transcripts_ids = get_transcripts_IDs_ViennaNear(connection.cursor())
+        print(corpus.precompute_oov_resolutions(get_sentence_vocabulary(connection, transcripts_ids)), " OOV resolutions computed")
+        corpus.save_oov_resolutions(args.oov_cache)
+        closeConnectionDB(connection)
+        return
+
+    # the completed transcripts of an interrupted run with the same model, settings and output are skipped
+    state = RunState(args.state)
+    output = "database" if args.write_db else args.spool
+    resumed = state.resumable_run(corpus.fingerprint(), output) if args.resume else None
+    completed = set(resumed["completed"]) if resumed else set()
+    if resumed:
+        print("Resuming the run started at ", resumed["started"], ", ", len(completed), " transcripts completed")
+    elif args.resume:
+        print("No interrupted run to resume, starting a new one")
 
+    if args.stream or args.incremental:
+        # tokens are fetched via a server-side cursor and every finished sentence goes straight to the translation
+        connection = connectDB()
+        transcripts_ids = get_transcripts_IDs_ViennaNear(connection.cursor())
+        run_start = get_database_time(connection) # taken before the tokens are read, changes during the run are picked up by the next one
+        sentences = stream_sentences(stream_tokens(connection, [id for id in transcripts_ids if id not in completed]))
+        if args.incremental:
+            selection = {"sentences": 0, "selected": 0}
+            sentences = select_changed_sentences(sentences, state.watermarks(corpus.fingerprint()), state.own_writes(corpus.fingerprint()), selection)
+    else:
+        transcripts_ids ,sentence_objects, connection = get_settings()
+        run_start = None
+        sentences = ((id, key, sentence_objects[id][key]) for id in transcripts_ids if id not in completed for key in sentence_objects[id].keys())
+
+    if resumed:
+        run_start = state.run_started() or run_start # changes during the interrupted run are picked up by the next one
+    else:
+        state.start_run(corpus.fingerprint(), output, run_start)
+
+    if args.write_db:
+        # a second connection, committing on the reading connection would close its server-side cursor
+        write_connection = update_database.connectDB()
+        writer = update_database.BulkUpdater(write_connection, args.chunk_size, record_writes=args.incremental)
+    else:
+        writer = SpoolWriter(args.spool, append=resumed is not None, offset=resumed["spool_offset"] if resumed else None)
+
+    # a transcript is checkpointed once its updates are durable (spool synced to the disk, database committed), 
+    # the flushed spool can be written to the database by update_database.py --follow while the translation is still running
+    # with --incremental, the watermark of the transcript is moved once its updates are committed
+    watermarked = set()
+    def checkpoint(id):
+        writer.flush()
+        if args.incremental:
+            state.set_watermarks(corpus.fingerprint(), [id], run_start, writer.pop_written())
+            watermarked.add(id)
+        state.complete_transcript(id, None if args.write_db else writer.tell())
+        if args.metrics:
+            record_run_metrics(corpus, cache, written, plan)
+            metrics.write_prometheus(args.metrics)
+
+    cache = TranslationCache(corpus.fingerprint(), args.cache_size, args.cache)
+    written = {"changed": 0, "unchanged": 0, "skipped": 0}
+    plan = {"sentences": 0, "distinct": 0, "translated": 0, "fallbacks": 0}
+    budget = (args.decode_timeout, args.decode_max_hypotheses)
+    for id, token_id, ortho in generate_updates(corpus, sentences, args.workers, args.model, args.decoder, args.learn, cache, args.oov_cache, written, checkpoint, plan, args.batch_size, budget):
+        if args.write_db:
+            writer.write(token_id, ortho)
+        else:
+            writer.write(id, token_id, ortho)
+    writer.close()
+
+    if args.write_db:
+        update_database.closeConnectionDB(write_connection)
+    else:
+        print(writer.count, " token updates written to ", args.spool)
+    print("Sentences: ", plan["sentences"], ", ", plan["distinct"], " distinct per batch (dedup ratio ", round(dedup_ratio(plan), 2), "), ", plan["translated"], " translated, the others from the translation cache")
+    if plan["fallbacks"]:
+        print(plan["fallbacks"], " sentences exceeded the decode budget and were translated greedily word by word")
+    print("Tokens: ", written["changed"], " changed, ", written["unchanged"], " unchanged (not written), ", written["skipped"], " skipped (translation does not match the tokens)")
+
+    if args.incremental:
+        print(selection["selected"], " of ", selection["sentences"], " sentences changed since the last run")
+        # the transcripts without a selected sentence had nothing to write
+        state.set_watermarks(corpus.fingerprint(), [id for id in transcripts_ids if id not in watermarked and id not in completed], run_start)
+    state.finish_run()
+
+    if args.oov_cache and not args.learn:
+        corpus.save_oov_resolutions(args.oov_cache)
+    corpus.print_fixed_oov()
+    if args.oov_report:
+        corpus.write_oov_statistics(args.oov_report)
+    cache.close()
+    print("Translation cache: ", cache.hits, " hits, ", cache.misses, " misses (", round(100 * cache.hit_rate(), 1), "% hit rate)")
     closeConnectionDB(connection)
 
+    record_run_metrics(corpus, cache, written, plan)
+    print(metrics.summary())
+    if args.metrics:
+        metrics.write_prometheus(args.metrics)
+
+# Input: the corpus, the TranslationCache, the dict counting the changed, unchanged and skipped tokens of the run
+# and the dict counting the planned sentences (see translate_sentences)
+# Output: the totals and rates of the run are set in the metrics (the timings are recorded where they are measured)
+def record_run_metrics(corpus, cache, written, plan):
+    for name in written:
+        metrics.gauge("tokens_" + name, "Tokens " + name + " in this run, see generate_updates").set(written[name])
+    for name in plan:
+        metrics.gauge("sentences_" + name, "Sentences " + name + " in this run, see translate_sentences").set(plan[name])
+    metrics.gauge("dedup_ratio", "Sentences per distinct sentence of a batch").set(dedup_ratio(plan))
+    metrics.gauge("translation_cache_hits", "Sentences found in the translation cache").set(cache.hits)
+    metrics.gauge("translation_cache_misses", "Sentences not found in the translation cache").set(cache.misses)
+    metrics.gauge("translation_cache_hit_rate", "Share of the sentences found in the translation cache").set(cache.hit_rate())
+    words = metrics.counter("words_total").value
+    metrics.gauge("oov_rate", "Share of the translated words that stayed unknown (OOV)").set(metrics.counter("oov_words_total").value / words if words else 0.0)
+    hits, misses = metrics.counter("oov_resolution_cache_hits_total").value, metrics.counter("oov_resolution_cache_misses_total").value
+    metrics.gauge("oov_resolution_cache_hit_rate", "Share of the unknown words resolved out of the OOV resolution cache").set(hits / (hits + misses) if hits + misses else 0.0)
+    metrics.gauge("oov_resolutions", "Resolved unknown words in the OOV resolution cache").set(len(corpus.oov_resolutions))
+
+# Input: iterable of (transcript_id, sentence_key, sentence), the watermarks of the last run per transcript (see RunState),
+# the tokens written by that run per transcript (token id -> (text, ortho)) and a dict counting the read and the selected sentences
+# Output: generator of the sentences that contain a token changed after the watermark of their transcript or a token without ortho,
+# all sentences of a transcript without watermark. A token written by the run that set the watermark does not count as changed
+# as long as it holds the text and the ortho of that write.
+def select_changed_sentences(sentences, watermarks, own_writes, counts):
+    for id, key, sentence in sentences:
+        counts["sentences"] += 1
+        watermark = watermarks.get(id)
+        own = own_writes.get(id, {})
+        changed = watermark is None or any(updated > watermark and own.get(token_id) != (text, ortho) for token_id, updated, text, ortho in sentence["updated_tokens"])
+        if changed or any(item["ortho"] is None for item in sentence["items"]):
+            counts["selected"] += 1
+            yield id, key, sentence
+
+# Input: dict counting the planned sentences, see translate_sentences
+# Output: the number of sentences per distinct sentence, 1 if no sentence repeats within a batch
+def dedup_ratio(plan):
+    return plan["sentences"] / plan["distinct"] if plan["distinct"] else 1.0
+
+# Input: the corpus, iterable of (transcript_id, sentence_key, sentence object), the translation settings,
+# a dict counting the changed, unchanged and skipped tokens, a function called with the id of each finished transcript,
+# a dict counting the planned sentences, the batch size and the decode budget, see translate_sentences
+# Output: generator of (transcript_id, token_id, ortho) for the tokens whose ortho differs from the one in the database
+# Only the sentences on their way through the translation are kept in memory (one batch)
+# A transcript is finished when the first sentence of the next one is translated or at the end, by then all its updates were consumed
+def generate_updates(corpus, sentences, workers, model_path, decoder, learn=False, cache=None, oov_cache=None, counts=None, on_transcript_done=None, plan=None, batch_size=2000, budget=(None, None)):
+    if counts is None:
+        counts = {"changed": 0, "unchanged": 0, "skipped": 0}
+    pending = deque() # sentence objects in the order of the jobs, the translations come back in the same order
+
+    def jobs():
+        for id, key, sentence in sentences:
+            pending.append(sentence)
+            yield id, key, sentence["output_sentence"]
+
+    last_id = None
+    for id, key, translation in translate_sentences(corpus, jobs(), workers, model_path, decoder, learn, batch_size, cache, oov_cache, plan, budget):
+        if last_id is not None and id != last_id and on_transcript_done:
+            on_transcript_done(last_id)
+        last_id = id
+        sentence = pending.popleft()
+        sentence["translation"] = translation
+        with QUERIES_SECONDS.time():
+            queries = process_into_queries(sentence)
+        if not queries:
+            counts["skipped"] += len(sentence["items"])
+
+        # an update that does not change the ortho would only create a new row version
+        for item, (token_id, ortho) in zip(sentence["items"], queries):
+            if ortho == item["ortho"]:
+                counts["unchanged"] += 1
+                continue
+            counts["changed"] += 1
+            yield id, token_id, ortho
+
+    if last_id is not None and on_transcript_done:
+        on_transcript_done(last_id)
+
+# Input: the corpus, iterable of jobs as (transcript_id, sentence_key, sentence) tuples, the number of worker processes,
+# an optional TranslationCache, consulted before a sentence is translated, the OOV resolution cache (loaded by spawned workers)
+# a dict counting the sentences, the distinct sentences, the translated ones and the greedy fallbacks,
+# and the decode budget (seconds, hypotheses) set in spawned workers (see Corpora.set_decode_budget)
+# Output: generator of (transcript_id, sentence_key, translation) in the order of the jobs
+# The jobs are planned in batches: identical sentences (after normalize_sentence) are looked up in the cache and translated
+# once per batch, their translation is handed to every job of the batch that contains them.
+# The greedy translations of sentences that exceeded the decode budget are not cached, the next run tries them again.
+# The side effects of a translation (fixed OOV, OOV, learned in target words) are cached with it and recorded again
+# for every job served by the cache or by an identical sentence of the batch, thus the OOV statistics count every sentence.
+# With more than one worker, the sentences are translated in a process pool. The workers share the trained corpus
+# copy-on-write (fork) or load it from the saved model (spawn). The changes a sentence makes to the corpus (fixed OOV,
+# OOV, learned in target words) are returned by the workers and merged into the main corpus in the order of the jobs.
+# In the "learn during run" mode the sentences are translated in this process one after the other, whatever the number of
+# workers: a word learned from a sentence changes the translation of the following ones.
+def translate_sentences(corpus, jobs, workers, model_path, decoder, learn=False, batch_size=2000, cache=None, oov_cache=None, plan=None, budget=(None, None)):
+    global worker_corpus
+    if plan is None:
+        plan = {"sentences": 0, "distinct": 0, "translated": 0, "fallbacks": 0}
+
+    pool = None
+    if workers > 1 and not learn:
+        if "fork" in multiprocessing.get_all_start_methods():
+            worker_corpus = corpus
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+        pool = context.Pool(workers, initializer=init_worker, initargs=(model_path, decoder, oov_cache, budget))
+
+    # the jobs are read in batches, so a job generator is not read ahead further than one batch
+    jobs = iter(jobs)
+    try:
+        while True:
+            batch = list(islice(jobs, batch_size))
+            if not batch:
+                break
+
+            # the first job of each distinct sentence stands for all of them, only the cache misses are translated
+            keys = [normalize_sentence(sentence) for _, _, sentence in batch]
+            distinct = {}
+            for key, job in zip(keys, batch):
+                distinct.setdefault(key, job)
+            translations = {key: cache.get(job[2]) if cache else None for key, job in distinct.items()} # (translation, side effects)
+            misses = [distinct[key] for key, entry in translations.items() if entry is None]
+            plan["sentences"] += len(batch)
+            plan["distinct"] += len(distinct)
+            plan["translated"] += len(misses)
+
+            # the misses come back in the order of their first job, thus they are consumed while the batch is handed out
+            if pool is not None:
+                results = pool.imap(translate_job, misses, max(1, len(misses) // (workers * 4)))
+            else:
+                results = ((sntc.stack_decoder_translation, sntc.decode_fallback, sntc.side_effects(), None) for sntc in (InputSentence(sentence, corpus) for _, _, sentence in misses))
+
+            for job, key in zip(batch, keys):
+                if translations[key] is None:
+                    translation, fallback, side_effects, worker_metrics = next(results)
+                    if pool is not None: # a sentence translated in this process recorded its side effects itself
+                        corpus.record_sentence_effects(*side_effects)
+                        metrics.merge(worker_metrics)
+                    translations[key] = translation, side_effects
+                    plan["fallbacks"] += fallback
+                    if cache and not fallback: cache.put(job[2], translation, side_effects)
+                else:
+                    corpus.record_sentence_effects(*translations[key][1])
+                yield job[0], job[1], translations[key][0]
+    finally:
+        if pool is not None:
+            pool.terminate()
+            worker_corpus = None
+
+def init_worker(model_path, decoder, oov_cache=None, budget=(None, None)):
+    global worker_corpus
+    profiling.detach()
+    if worker_corpus is None:
+        worker_corpus = Corpora.load(model_path, decoder)
+        if oov_cache:
+            worker_corpus.load_oov_resolutions(oov_cache)
+        worker_corpus.set_decode_budget(*budget)
+    metrics.reset() # a forked worker starts with the metrics of the main process, they are merged back per job
+
+def translate_job(job):
+    _, _, sentence = job
+    sntc = InputSentence(sentence, worker_corpus)
+    return sntc.stack_decoder_translation, sntc.decode_fallback, sntc.side_effects(), metrics.collect()
+
 # Input: sentence object with .items and .translation
+# Output: list of (token_id, ortho) updates, empty if the translation does not match the tokens
 def process_into_queries(obj):
     queries = []
     orthos = obj["translation"].split(" ")
     index = 0
     if len(obj["items"]) != len(orthos):
-        print("Lengths do not correspond! This sentence needs further processing")
-        print(obj)
+        logger.info("Lengths do not correspond, this sentence needs further processing (%d tokens, %d translated words): %s -> %s", len(obj["items"]), len(orthos), obj["output_sentence"], obj["translation"])
         return []
     for item in obj["items"]:
-        queries.append(createQuery(item["id"], orthos[index]))
+        queries.append((item["id"], orthos[index]))
         index += 1
     return queries
 
-def createQuery(id, ortho):
-    return "UPDATE token SET ortho = '" + ortho  + "', updated = CURRENT_TIMESTAMP WHERE id = " + str(id) + ";"
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,239 @@
+import bisect
+import os
+import time
+from contextlib import contextmanager
+
+"""This module provides the lightweight instrumentation of the translation pipeline: counters, gauges and histograms.
+The metrics are kept in one registry per process and are created where they are measured, e.g.
+
+DECODE_SECONDS = metrics.histogram('decode_seconds', 'Decoding time per sentence')
+with DECODE_SECONDS.time():
+    ...
+
+At the end of a run the registry is printed as a summary (see summary) and can be written as a
+Prometheus text file (see write_prometheus), which the node exporter textfile collector scrapes.
+Worker processes send their metrics to the main process via collect and merge.
+"""
+
+NAMESPACE = 'machine_translation' # prefix of the metric names in the Prometheus text file
+
+# upper bounds in seconds, from 0.1 ms up to one minute
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+"""A value that only increases, e.g. the number of translated sentences
+"""
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+    def state(self):
+        return self.value
+
+    def merge(self, state):
+        self.value += state
+
+    def lines(self, name):
+        return [name + ' ' + format_value(self.value)]
+
+    def describe(self):
+        return format_value(self.value)
+
+"""A value that is set, e.g. the hit rate of a cache
+"""
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+    def merge(self, state):
+        self.value = state
+
+"""Counts observed values in buckets, e.g. the decoding time per sentence.
+The buckets are cumulative in the Prometheus text file, the quantiles of the summary are estimated from them.
+"""
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1) # the last one counts the values above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    """Observes the time spent in the context in seconds
+    """
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    """Estimates a quantile as the upper bound of the bucket it falls into
+
+    Parameters
+    ----------
+    q : float - between 0 and 1
+
+    Returns
+    -------
+    float
+    """
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def state(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count, 'max': self.max}
+
+    def merge(self, state):
+        self.counts = [a + b for a, b in zip(self.counts, state['counts'])]
+        self.sum += state['sum']
+        self.count += state['count']
+        self.max = max(self.max, state['max'])
+
+    def lines(self, name):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(name + '_bucket{le="' + format_value(bound) + '"} ' + str(cumulative))
+        lines.append(name + '_bucket{le="+Inf"} ' + str(self.count))
+        lines.append(name + '_sum ' + format_value(self.sum))
+        lines.append(name + '_count ' + str(self.count))
+        return lines
+
+    def describe(self):
+        if not self.count:
+            return 'count 0'
+        return 'count {} sum {:.3f} mean {:.6f} p50 {:.6f} p95 {:.6f} p99 {:.6f} max {:.6f}'.format(
+            self.count, self.sum, self.sum / self.count, self.quantile(0.5), self.quantile(0.95), self.quantile(0.99), self.max)
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 9))
+    return str(value)
+
+"""The metrics of a process, by name in the order they were created
+"""
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def get(self, kind, name, help, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = kind(name, help, *args)
+        elif type(metric) is not kind:
+            raise ValueError('Metric ' + name + ' is already registered as a ' + metric.kind)
+        return metric
+
+REGISTRY = Registry()
+
+def counter(name, help=''):
+    return REGISTRY.get(Counter, name, help)
+
+def gauge(name, help=''):
+    return REGISTRY.get(Gauge, name, help)
+
+def histogram(name, help='', buckets=SECONDS_BUCKETS):
+    return REGISTRY.get(Histogram, name, help, buckets)
+
+"""Sets all metrics of the process to zero, e.g. in a worker process that inherited the metrics of the main process
+"""
+def reset():
+    for metric in REGISTRY.metrics.values():
+        metric.reset()
+
+"""Returns the metrics that were recorded, to be merged into the registry of another process
+
+Parameters
+----------
+reset_after : bool - the metrics are set to zero, the next call returns only the values recorded since
+
+Returns
+-------
+dict
+    name -> (kind, help, state), only the metrics with recorded values
+"""
+def collect(reset_after=True):
+    state = {}
+    for name, metric in REGISTRY.metrics.items():
+        if (metric.count if metric.kind == 'histogram' else metric.value):
+            state[name] = (metric.kind, metric.help, metric.state(), getattr(metric, 'buckets', None))
+            if reset_after:
+                metric.reset()
+    return state
+
+"""Adds the metrics returned by collect (of a worker process) to the registry of this process
+"""
+def merge(state):
+    kinds = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+    for name, (kind, help, values, buckets) in state.items():
+        metric = REGISTRY.get(kinds[kind], name, help, *([buckets] if buckets else []))
+        metric.merge(values)
+
+"""Returns a readable summary of all metrics with recorded values, one line per metric
+
+Returns
+-------
+str
+"""
+def summary():
+    lines = []
+    for name, metric in REGISTRY.metrics.items():
+        if metric.kind == 'histogram' and not metric.count:
+            continue
+        lines.append(name.ljust(36) + ' ' + metric.describe())
+    return '\n'.join(lines)
+
+"""Writes all metrics in the Prometheus text format, the file is replaced atomically
+
+Parameters
+----------
+path : str - the file location, e.g. in the directory of the node exporter textfile collector
+"""
+def write_prometheus(path):
+    lines = []
+    for name, metric in REGISTRY.metrics.items():
+        full_name = NAMESPACE + '_' + name
+        if metric.help:
+            lines.append('# HELP ' + full_name + ' ' + metric.help)
+        lines.append('# TYPE ' + full_name + ' ' + metric.kind)
+        lines.extend(metric.lines(full_name))
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as metrics_file:
+        metrics_file.write('\n'.join(lines) + '\n')
+    os.replace(temporary, path)
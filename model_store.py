@@ -0,0 +1,196 @@
+import hashlib
+import json
+import mmap
+import os
+import numpy as np
+from ngram_table import Vocabulary, NgramTable, NgramCounts
+
+"""This module provides the functions to persist a trained Corpora instance on disk and to read it back.
+A model is saved as a directory with the following files:
+
+meta.json : format version, hash of the source spreadsheet and of the added sentences, vowel_table, unknown tag
+    and the number of trigrams of the language model
+strings.bin, strings_offsets.npy : utf-8 encoded vocabulary of all words, a word is referred to by its id (index) in the vocabulary
+unigrams.npy, bigrams.npy, trigrams.npy : int32 arrays, one row per lookup entry [source ids, target ids, occurence]
+language_model.npy, language_model_count.npy : trigram ids of the target language and their occurence
+<table>_codes.npy, <table>_sorted_positions.npy, <table>_sorted_codes.npy (and <table>_starts.npy for the lookup tables) :
+    the index of each table (see NgramIndex.index_arrays), the keys are not encoded and sorted again on load
+orth.bin, orth_offsets.npy : the orthographic sentences used as BLEU references
+
+The arrays are loaded via memory mapping into the array backed tables of ngram_table, the translation options are
+read from the disk only when needed. The row order of each table follows the insertion order of the lookup tables,
+so the reloaded tables (and the translation options with the same probability) keep their order.
+The files are replaced atomically, a model can be saved into the directory it was loaded from (see Corpora.add_parallel_sentences).
+"""
+
+MODEL_FORMAT_VERSION = 3
+
+"""Computes the SHA-256 hash of the parallel data file, used for detecting stale models
+
+Parameters
+----------
+path : str - the file location of the parallel data
+
+Returns
+-------
+str
+    hex digest of the file content
+"""
+def hash_source(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+"""Reads the meta information of a saved model
+
+Parameters
+----------
+path : str - the directory of the saved model
+
+Returns
+-------
+dict or None
+    the content of meta.json, None if there is no saved model in the directory
+"""
+def read_meta(path):
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+"""Checks if a model in the current format is saved in the directory
+
+Parameters
+----------
+path : str - the directory of the saved model
+
+Returns
+-------
+bool
+"""
+def is_loadable(path):
+    meta = read_meta(path)
+    return meta is not None and meta.get('version') == MODEL_FORMAT_VERSION
+
+"""Checks if a saved model has to be retrained.
+That is the case if no model exists, if it was written in an older format or if the parallel data changed since.
+Sentences added to the saved model afterwards (see Corpora.add_parallel_sentences) do not make it stale.
+
+Parameters
+----------
+path : str - the directory of the saved model
+source_path : str - the file location of the parallel data
+
+Returns
+-------
+bool
+"""
+def is_stale(path, source_path):
+    if not is_loadable(path):
+        return True
+    return read_meta(path).get('source_hash') != hash_source(source_path)
+
+# the file is written under a temporary name and renamed, a memory mapping of the replaced file stays valid
+def write_array(path, name, array):
+    temporary = os.path.join(path, name + '.tmp')
+    with open(temporary, 'wb') as array_file:
+        np.save(array_file, array)
+    os.replace(temporary, os.path.join(path, name))
+
+def write_strings(path, name, strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded], dtype=np.int64)
+    temporary = os.path.join(path, name + '.bin.tmp')
+    with open(temporary, 'wb') as blob_file:
+        blob_file.write(b''.join(encoded))
+    os.replace(temporary, os.path.join(path, name + '.bin'))
+    write_array(path, name + '_offsets.npy', offsets)
+
+def write_index(path, name, index):
+    for key, array in index.items():
+        write_array(path, name + '_' + key + '.npy', array)
+
+def read_index(path, name, keys):
+    return {key: np.load(os.path.join(path, name + '_' + key + '.npy'), mmap_mode='r') for key in keys}
+
+def read_strings(path, name):
+    offsets = np.load(os.path.join(path, name + '_offsets.npy'), mmap_mode='r').tolist()
+    if offsets[-1] == 0:
+        return ['' for _ in range(len(offsets) - 1)]
+    with open(os.path.join(path, name + '.bin'), 'rb') as blob_file:
+        with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as blob:
+            return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+"""Writes the trained model of a Corpora instance into a directory
+
+Parameters
+----------
+corpus : Corpora - a trained corpus
+path : str - the directory, created if needed
+"""
+def save_model(corpus, path):
+    os.makedirs(path, exist_ok=True)
+    # the previous model is invalid until the new meta.json is written
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        os.remove(os.path.join(path, 'meta.json'))
+
+    # the index is computed for the written rows, they include the entries added to the tables after their creation
+    for name, order, table in (('unigrams', 1, corpus.lookup_dict), ('bigrams', 2, corpus.lookup_bigrams), ('trigrams', 3, corpus.lookup_trigrams)):
+        rows = table.to_array()
+        write_array(path, name + '.npy', rows)
+        write_index(path, name, NgramTable(rows, order, corpus.vocabulary).index_arrays())
+
+    ids, counts = corpus.language_prob.to_array()
+    write_array(path, 'language_model.npy', ids)
+    write_array(path, 'language_model_count.npy', counts)
+    write_index(path, 'language_model', NgramCounts(ids, counts, corpus.language_prob.total, corpus.vocabulary).index_arrays())
+
+    # written after the tables, to_array interns the words added after the training
+    write_strings(path, 'strings', corpus.vocabulary.strings)
+    write_strings(path, 'orth', corpus.orth)
+
+    meta = {
+        'version': MODEL_FORMAT_VERSION,
+        'source_hash': corpus.source_hash,
+        'delta_hashes': corpus.delta_hashes,
+        'language_model_total': corpus.language_prob.total,
+        'unknown_tag': corpus.unknown_tag,
+        'vowel_table': corpus.vowel_table,
+    }
+    # meta.json is written last, an interrupted save is therefore detected as a missing model
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file, ensure_ascii=False, indent=1)
+
+"""Reads a model written by save_model into an empty Corpora instance
+
+Parameters
+----------
+corpus : Corpora - an untrained corpus (created with path None)
+path : str - the directory of the saved model
+"""
+def load_model(corpus, path):
+    meta = read_meta(path)
+    if meta is None or meta.get('version') != MODEL_FORMAT_VERSION:
+        raise ValueError('No model of version ' + str(MODEL_FORMAT_VERSION) + ' found in ' + path)
+
+    corpus.vocabulary = Vocabulary(read_strings(path, 'strings'))
+    table_index = ('codes', 'starts', 'sorted_positions', 'sorted_codes')
+    corpus.lookup_dict = NgramTable(np.load(os.path.join(path, 'unigrams.npy'), mmap_mode='r'), 1, corpus.vocabulary, read_index(path, 'unigrams', table_index))
+    corpus.lookup_bigrams = NgramTable(np.load(os.path.join(path, 'bigrams.npy'), mmap_mode='r'), 2, corpus.vocabulary, read_index(path, 'bigrams', table_index))
+    corpus.lookup_trigrams = NgramTable(np.load(os.path.join(path, 'trigrams.npy'), mmap_mode='r'), 3, corpus.vocabulary, read_index(path, 'trigrams', table_index))
+
+    corpus.language_prob = NgramCounts(np.load(os.path.join(path, 'language_model.npy'), mmap_mode='r'),
+                                       np.load(os.path.join(path, 'language_model_count.npy'), mmap_mode='r'),
+                                       meta['language_model_total'], corpus.vocabulary,
+                                       read_index(path, 'language_model', ('codes', 'sorted_positions', 'sorted_codes')))
+
+    corpus.orth = read_strings(path, 'orth')
+    corpus.source_hash = meta['source_hash']
+    corpus.delta_hashes = meta['delta_hashes']
+    corpus.unknown_tag = meta['unknown_tag']
+    # json turns the tuples into lists
+    corpus.vowel_table = {key: tuple(value) if isinstance(value, list) else value for key, value in meta['vowel_table'].items()}
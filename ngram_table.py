@@ -0,0 +1,692 @@
+from functools import lru_cache
+from math import log
+import numpy as np
+import pandas as pd
+from nltk.translate import PhraseTable
+from nltk.translate.api import PhraseTableEntry
+
+"""This module provides the compact representation of a trained model.
+All words of the source and target language are interned into integer ids (Vocabulary),
+the n-gram tables are stored in numpy arrays instead of dictionaries of string tuples.
+The tables keep the dictionary interface used by Corpora, e.g. lookup_dict["word"] still returns [("translation", occurence), ...].
+
+An n-gram of up to three word ids is packed into one int64 key of KEY_BITS bits per word,
+a key is found via binary search (numpy.searchsorted) in the sorted keys.
+"""
+
+KEY_BITS = 21 # up to 2097152 words in a vocabulary, three ids fit into an int64 key
+KEY_MASK = (1 << KEY_BITS) - 1
+
+"""Interns words into integer ids, the id of a word is its index in strings
+"""
+class Vocabulary:
+    def __init__(self, strings=None):
+        self.strings = list(strings) if strings is not None else []
+        self.ids = {word: index for index, word in enumerate(self.strings)}
+
+    """Returns the id of a word, the word is added if it is new
+    """
+    def id(self, word):
+        if word not in self.ids:
+            if len(self.strings) > KEY_MASK:
+                raise ValueError('Vocabulary is limited to ' + str(KEY_MASK + 1) + ' words')
+            self.ids[word] = len(self.strings)
+            self.strings.append(word)
+        return self.ids[word]
+
+    """Returns the id of a word, -1 if the word is not known
+    """
+    def get(self, word):
+        return self.ids.get(word, -1)
+
+    def __len__(self):
+        return len(self.strings)
+
+"""Packs the word ids of n-grams into int64 keys
+
+Parameters
+----------
+ids : numpy.ndarray - shape (number of n-grams, order)
+
+Returns
+-------
+numpy.ndarray
+    int64 keys
+"""
+def encode_keys(ids):
+    keys = np.zeros(len(ids), dtype=np.int64)
+    for column in range(ids.shape[1]):
+        keys = (keys << KEY_BITS) | ids[:, column].astype(np.int64)
+    return keys
+
+"""Converts a lookup dictionary into an int32 array, one row per translation option
+
+Parameters
+----------
+table : dict - lookup_dict (str keys) or lookup_bigrams/lookup_trigrams (tuple keys)
+order : int - 1, 2 or 3
+vocabulary : Vocabulary
+
+Returns
+-------
+numpy.ndarray
+    shape (number of options, 2 * order + 1), [source ids, target ids, occurence]
+"""
+def table_to_array(table, order, vocabulary):
+    rows = []
+    for key in table:
+        source = (key,) if order == 1 else key
+        for option in table[key]:
+            target = (option[0],) if order == 1 else option[0]
+            rows.append([vocabulary.id(word) for word in source] + [vocabulary.id(word) for word in target] + [option[1]])
+    return np.array(rows, dtype=np.int32).reshape(len(rows), 2 * order + 1)
+
+"""Tokenizes sentences once into a flat array of word ids, used for counting the n-grams in bulk
+
+Parameters
+----------
+sentences : [str] - the sentences, split on whitespace
+vocabulary : Vocabulary - the words are interned into it
+start_tags, end_tags : [str] - tags added to each sentence, e.g. ['<s>'] and ['</s>']
+
+Returns
+-------
+(numpy.ndarray, numpy.ndarray)
+    the word ids of all sentences and the offset of each sentence, the last offset is the number of ids
+"""
+def tokenize(sentences, vocabulary, start_tags=(), end_tags=()):
+    tokens = []
+    starts = [0]
+    for sentence in sentences:
+        tokens.extend(start_tags)
+        tokens.extend(sentence.split())
+        tokens.extend(end_tags)
+        starts.append(len(tokens))
+
+    codes, uniques = pd.factorize(pd.Series(tokens, dtype=object))
+    ids = np.array([vocabulary.id(word) for word in uniques], dtype=np.int32)
+    return ids[codes] if len(codes) else np.zeros(0, dtype=np.int32), np.array(starts, dtype=np.int64)
+
+"""Returns the position of the first word of every n-gram within the sentences
+
+Parameters
+----------
+starts : numpy.ndarray - sentence offsets, see tokenize
+order : int - the length of the n-grams
+skip_first, skip_last : int - number of words at the beginning and at the end of each sentence that are not the start of an n-gram
+
+Returns
+-------
+numpy.ndarray
+    positions in the flat id array, sentence by sentence
+"""
+def ngram_positions(starts, order, skip_first=0, skip_last=0):
+    counts = np.maximum(np.diff(starts) - order + 1 - skip_first - skip_last, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts[:-1], counts) + skip_first + offsets
+
+"""Counts the n-grams at the given positions, the result is in the order of their first occurence (like a Counter)
+
+Parameters
+----------
+ids : numpy.ndarray - flat word ids, see tokenize
+positions : numpy.ndarray - see ngram_positions
+order : int - the length of the n-grams
+
+Returns
+-------
+(numpy.ndarray, numpy.ndarray)
+    the word ids of each distinct n-gram, shape (number of n-grams, order), and its occurence
+"""
+def count_ngrams(ids, positions, order):
+    grams = np.stack([ids[positions + shift] for shift in range(order)], axis=1).reshape(len(positions), order)
+    return merge_ngram_counts([(grams, np.ones(len(grams), dtype=np.int64))])
+
+"""Merges n-gram counts (e.g. of several shards), the n-grams keep the order of their first occurence in the given sequence
+
+Parameters
+----------
+counts : [(numpy.ndarray, numpy.ndarray)] - word ids and occurences, see count_ngrams
+
+Returns
+-------
+(numpy.ndarray, numpy.ndarray)
+    see count_ngrams
+"""
+def merge_ngram_counts(counts):
+    grams = np.concatenate([item[0] for item in counts])
+    occurences = np.concatenate([item[1] for item in counts])
+    labels, first = first_occurences(encode_keys(grams))
+    return grams[first], np.bincount(labels, weights=occurences, minlength=len(first)).astype(np.int64)
+
+"""Numbers the distinct values of an array in the order of their first occurence (hash based, no sorting)
+
+Parameters
+----------
+values : numpy.ndarray - int64 values
+
+Returns
+-------
+(numpy.ndarray, numpy.ndarray)
+    the number of the distinct value for each entry and the position of the first occurence of each distinct value
+"""
+def first_occurences(values):
+    labels = pd.factorize(values)[0]
+    return labels, np.flatnonzero(~pd.Series(labels).duplicated().to_numpy())
+
+"""Counts the position aligned n-grams of parallel sentences and returns them as rows of a NgramTable.
+The keys (source n-grams) appear in the order of their first occurence, 
+the options of a key (target n-grams) in the order of their first occurence with the key.
+This is the order of the lookup dictionaries built out of a Counter of (source, target) pairs.
+
+Parameters
+----------
+source, target : numpy.ndarray - flat word ids of the parallel sentences, both with the same sentence offsets
+positions : numpy.ndarray - see ngram_positions
+order : int - the length of the n-grams
+
+Returns
+-------
+numpy.ndarray
+    shape (number of options, 2 * order + 1), see table_to_array
+"""
+def count_aligned_ngrams(source, target, positions, order):
+    source_grams = np.stack([source[positions + shift] for shift in range(order)], axis=1).reshape(len(positions), order)
+    target_grams = np.stack([target[positions + shift] for shift in range(order)], axis=1).reshape(len(positions), order)
+    return merge_aligned_counts([np.concatenate((source_grams, target_grams, np.ones((len(positions), 1), dtype=np.int32)), axis=1)], order)
+
+"""Merges the rows of aligned n-gram counts (e.g. of several shards) into the rows of one NgramTable.
+The order is the one of count_aligned_ngrams over the concatenated sentences, if the tables are given in the sentence order.
+
+Parameters
+----------
+tables : [numpy.ndarray] - rows as returned by count_aligned_ngrams, the ids refer to the same vocabulary
+order : int - the length of the n-grams
+
+Returns
+-------
+numpy.ndarray
+    see count_aligned_ngrams
+"""
+def merge_aligned_counts(tables, order):
+    rows = np.concatenate(tables).reshape(-1, 2 * order + 1)
+
+    # the keys are numbered in the order of their first occurence, the pairs as well
+    keys, _ = first_occurences(encode_keys(rows[:, :order]))
+    targets, _ = first_occurences(encode_keys(rows[:, order:2 * order]))
+    pairs, first = first_occurences(keys.astype(np.int64) * (targets.max() + 1 if len(targets) else 1) + targets)
+    counts = np.bincount(pairs, weights=rows[:, -1], minlength=len(first)).astype(np.int64)
+    ordering = np.argsort(keys[first], kind='stable')
+
+    merged = np.concatenate((rows[first, :2 * order].astype(np.int64), counts.reshape(-1, 1)), axis=1)[ordering]
+    return merged.astype(np.int32).reshape(len(merged), 2 * order + 1)
+
+"""Computes the partial counts of the training for a shard of the sentences, can run in a worker process.
+The words are interned into a vocabulary of the shard, see remap_shard.
+
+Parameters
+----------
+parallel : [(str, str)] - parallel sentences of the same length
+orth : [str] - orth sentences for the language model
+
+Returns
+-------
+dict
+    strings : [str] - the vocabulary of the shard
+    aligned : [numpy.ndarray] - unigram, bigram and trigram rows, see count_aligned_ngrams
+    orth_trigrams : (numpy.ndarray, numpy.ndarray) - see count_ngrams
+    orth_bigrams_total, orth_trigrams_total : int - number of bi- and trigrams in the orth sentences
+"""
+def count_shard(parallel, orth):
+    vocabulary = Vocabulary()
+    source, starts = tokenize([item[0] for item in parallel], vocabulary, ['<s>'], ['</s>'])
+    target, _ = tokenize([item[1] for item in parallel], vocabulary, ['<s>'], ['</s>'])
+    aligned = [
+        count_aligned_ngrams(source, target, ngram_positions(starts, 1, 1, 2), 1), # unigrams skip the tags and the last word
+        count_aligned_ngrams(source, target, ngram_positions(starts, 2), 2),
+        count_aligned_ngrams(source, target, ngram_positions(starts, 3), 3),
+    ]
+
+    orth_ids, orth_starts = tokenize(orth, vocabulary, ['<s>', '<s>'], ['</s>', '</s>'])
+    trigram_positions = ngram_positions(orth_starts, 3)
+    return {
+        'strings': vocabulary.strings,
+        'aligned': aligned,
+        'orth_trigrams': count_ngrams(orth_ids, trigram_positions, 3),
+        'orth_bigrams_total': len(ngram_positions(orth_starts, 2)),
+        'orth_trigrams_total': len(trigram_positions),
+    }
+
+"""Translates the ids of a shard (see count_shard) into the ids of the given vocabulary
+"""
+def remap_shard(shard, vocabulary):
+    mapping = np.array([vocabulary.id(word) for word in shard['strings']], dtype=np.int32)
+    for rows in shard['aligned']:
+        rows[:, :-1] = mapping[rows[:, :-1]]
+    grams, occurences = shard['orth_trigrams']
+    shard['orth_trigrams'] = (mapping[grams], occurences)
+    return shard
+
+"""Reduces the counts of the shards into the counts of the whole training data.
+The result is identical to count_shard over all sentences, if the shards are given in the sentence order.
+
+Parameters
+----------
+shards : [dict] - see count_shard, in the order of the sentences
+vocabulary : Vocabulary - the words of the shards are interned into it
+
+Returns
+-------
+dict
+    see count_shard, the ids refer to the given vocabulary
+"""
+def merge_shards(shards, vocabulary):
+    shards = [remap_shard(shard, vocabulary) for shard in shards]
+    if len(shards) == 1:
+        return shards[0]
+    return {
+        'strings': vocabulary.strings,
+        'aligned': [merge_aligned_counts([shard['aligned'][order - 1] for shard in shards], order) for order in (1, 2, 3)],
+        'orth_trigrams': merge_ngram_counts([shard['orth_trigrams'] for shard in shards]),
+        'orth_bigrams_total': sum(shard['orth_bigrams_total'] for shard in shards),
+        'orth_trigrams_total': sum(shard['orth_trigrams_total'] for shard in shards),
+    }
+
+"""Base class of the array backed tables: the keys of one n-gram order, in the order they were inserted.
+Unigram keys are strings, bigram and trigram keys are tuples of strings, like in the lookup dictionaries.
+"""
+class NgramIndex:
+    """Constructor for the NgramIndex class
+
+    Parameters
+    ----------
+    codes : numpy.ndarray - int64 keys (see encode_keys) in insertion order, unique
+    order : int - 1, 2 or 3
+    vocabulary : Vocabulary - the vocabulary the ids refer to
+    sorted_index : (numpy.ndarray, numpy.ndarray) - the positions of the keys in sorted order and the sorted keys,
+        e.g. as saved by model_store, computed out of codes if not given
+    """
+    def __init__(self, codes, order, vocabulary, sorted_index=None):
+        self.order = order
+        self.vocabulary = vocabulary
+        self.codes = codes
+        if sorted_index is None:
+            self.sorted_positions = np.argsort(codes, kind='stable').astype(np.int32)
+            self.sorted_codes = codes[self.sorted_positions]
+        else:
+            self.sorted_positions, self.sorted_codes = sorted_index
+
+    def encode(self, key):
+        words = (key,) if self.order == 1 else key
+        if len(words) != self.order:
+            return None
+        code = 0
+        for word in words:
+            word_id = self.vocabulary.ids.get(word)
+            if word_id is None:
+                return None
+            code = (code << KEY_BITS) | word_id
+        return code
+
+    def decode(self, code):
+        words = tuple(self.vocabulary.strings[(code >> (KEY_BITS * shift)) & KEY_MASK] for shift in reversed(range(self.order)))
+        return words[0] if self.order == 1 else words
+
+    """Returns the position of a key in insertion order, -1 if the key is not in the table
+    """
+    def position(self, key):
+        code = self.encode(key)
+        if code is None:
+            return -1
+        index = np.searchsorted(self.sorted_codes, code)
+        if index < len(self.sorted_codes) and self.sorted_codes[index] == code:
+            return int(self.sorted_positions[index])
+        return -1
+
+    """Returns the arrays derived from the rows of the table, given back to the constructor they spare the sorting on load
+    """
+    def index_arrays(self):
+        return {'codes': self.codes, 'sorted_positions': self.sorted_positions, 'sorted_codes': self.sorted_codes}
+
+    def __iter__(self):
+        for code in self.codes.tolist():
+            yield self.decode(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, key):
+        return self.position(key) >= 0
+
+    def keys(self):
+        return iter(self)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+"""Array backed lookup dictionary (lookup_dict, lookup_bigrams, lookup_trigrams).
+The translation options of a key are stored in consecutive rows.
+Entries set after the creation (e.g. words learned during the run) are kept in a small dictionary next to the arrays.
+"""
+class NgramTable(NgramIndex):
+    """Constructor for the NgramTable class
+
+    Parameters
+    ----------
+    rows : numpy.ndarray - shape (number of options, 2 * order + 1), as written by table_to_array,
+        the options of a key are expected in consecutive rows
+    order : int - 1, 2 or 3
+    vocabulary : Vocabulary - the vocabulary the ids refer to
+    index : dict - the arrays of index_arrays computed for the same rows (e.g. saved by model_store), computed if not given
+    """
+    def __init__(self, rows, order, vocabulary, index=None):
+        rows = np.asarray(rows).reshape(len(rows), 2 * order + 1)
+        if index is None:
+            codes = encode_keys(rows[:, :order])
+            starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1]))) if len(codes) else np.zeros(0, dtype=np.int64)
+            if len(np.unique(codes[starts])) != len(starts):
+                # the options of a key are scattered, grouping them keeps the order of their first appearance
+                first = {}
+                for position, code in enumerate(codes.tolist()):
+                    first.setdefault(code, position)
+                permutation = np.argsort(np.array([first[code] for code in codes.tolist()], dtype=np.int64), kind='stable')
+                rows, codes = rows[permutation], codes[permutation]
+                starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+            super().__init__(codes[starts], order, vocabulary)
+            self.starts = np.append(starts, len(codes)).astype(np.int64)
+        else:
+            super().__init__(index['codes'], order, vocabulary, (index['sorted_positions'], index['sorted_codes']))
+            self.starts = index['starts']
+        self.targets = rows[:, order:2 * order]
+        self.counts = rows[:, 2 * order]
+        self.added = {} # key -> [(translation, occurence)], entries set after the creation
+
+    """Creates the table out of a lookup dictionary
+
+    Parameters
+    ----------
+    table : dict - e.g. lookup_dict
+    order : int - 1, 2 or 3
+    vocabulary : Vocabulary - the words are interned into it
+    """
+    @classmethod
+    def from_dict(cls, table, order, vocabulary):
+        return cls(table_to_array(table, order, vocabulary), order, vocabulary)
+
+    def index_arrays(self):
+        return dict(super().index_arrays(), starts=self.starts)
+
+    def options(self, position):
+        strings = self.vocabulary.strings
+        start, end = self.starts[position], self.starts[position + 1]
+        targets = self.targets[start:end].tolist()
+        counts = self.counts[start:end].tolist()
+        if self.order == 1:
+            return [(strings[target[0]], count) for target, count in zip(targets, counts)]
+        return [(tuple(strings[word] for word in target), count) for target, count in zip(targets, counts)]
+
+    def __getitem__(self, key):
+        if key in self.added:
+            return self.added[key]
+        position = self.position(key)
+        if position < 0:
+            raise KeyError(key)
+        return self.options(position)
+
+    def __setitem__(self, key, options):
+        self.added[key] = options
+
+    def __contains__(self, key):
+        return key in self.added or self.position(key) >= 0
+
+    # changed keys keep their position, new keys follow in the order they were added
+    def __iter__(self):
+        yield from super().__iter__()
+        for key in self.added:
+            if self.position(key) < 0:
+                yield key
+
+    def __len__(self):
+        return len(self.codes) + len([key for key in self.added if self.position(key) < 0])
+
+    def items(self):
+        for key in self:
+            yield key, self[key]
+
+    """Adds occurences of a translation option, as if the aligned n-gram was counted once more in the training data.
+    A new option is appended after the known options of the key.
+
+    Parameters
+    ----------
+    key : str or (str, ...) - the source n-gram
+    target : str or (str, ...) - the target n-gram
+    occurence : int
+    """
+    def add_occurence(self, key, target, occurence):
+        options = list(self[key]) if key in self else []
+        for index, option in enumerate(options):
+            if option[0] == target:
+                options[index] = (target, option[1] + occurence)
+                break
+        else:
+            options.append((target, occurence))
+        self.added[key] = options
+
+    """Adds the counted rows of new sentences to the table, see add_occurence
+
+    Parameters
+    ----------
+    rows : numpy.ndarray - see count_aligned_ngrams, the ids refer to the vocabulary of the table
+    """
+    def add_rows(self, rows):
+        strings = self.vocabulary.strings
+        for row in np.asarray(rows).tolist():
+            words = [strings[word] for word in row[:-1]]
+            if self.order == 1:
+                self.add_occurence(words[0], words[1], row[-1])
+            else:
+                self.add_occurence(tuple(words[:self.order]), tuple(words[self.order:]), row[-1])
+
+    """Returns the rows of the table including the added entries, see table_to_array.
+    Changed keys keep their position, new keys are appended.
+    """
+    def to_array(self):
+        rows = np.concatenate((encode_ids(self.codes, self.order, self.starts), self.targets, self.counts.reshape(-1, 1)), axis=1).astype(np.int32)
+        if not self.added:
+            return rows
+        changed = {}
+        new = {}
+        for key, options in self.added.items():
+            position = self.position(key)
+            if position >= 0:
+                changed[position] = {key: options}
+            else:
+                new[key] = options
+        parts = []
+        last = 0
+        for position in sorted(changed):
+            parts.append(rows[self.starts[last]:self.starts[position]])
+            parts.append(table_to_array(changed[position], self.order, self.vocabulary))
+            last = position + 1
+        parts.append(rows[self.starts[last]:])
+        parts.append(table_to_array(new, self.order, self.vocabulary))
+        return np.concatenate(parts).astype(np.int32)
+
+"""Expands the keys of a table back into one row of word ids per option
+
+Parameters
+----------
+keys : numpy.ndarray - int64 keys, one per group of options
+order : int - 1, 2 or 3
+starts : numpy.ndarray - first row of each group and the number of rows as the last entry
+
+Returns
+-------
+numpy.ndarray
+    shape (number of options, order)
+"""
+def encode_ids(keys, order, starts):
+    codes = np.repeat(keys, np.diff(starts))
+    return np.stack([(codes >> (KEY_BITS * shift)) & KEY_MASK for shift in reversed(range(order))], axis=1).astype(np.int32)
+
+"""Array backed n-gram counts of the language model (language_prob).
+The log probability of an n-gram is its relative occurence, log(occurence / total), computed on lookup,
+thus new sentences are added by changing the counts of their n-grams and the total (see add_counts).
+Supports the dictionary interface used by the decoders (get, in, iteration, values).
+"""
+class NgramCounts(NgramIndex):
+    """Constructor for the NgramCounts class
+
+    Parameters
+    ----------
+    ids : numpy.ndarray - shape (number of n-grams, order), the word ids of each n-gram
+    counts : numpy.ndarray - the occurence of each n-gram
+    total : int - the number of n-grams in the training data
+    vocabulary : Vocabulary - the vocabulary the ids refer to
+    index : dict - the arrays of index_arrays computed for the same ids (e.g. saved by model_store), computed if not given
+    """
+    def __init__(self, ids, counts, total, vocabulary, index=None):
+        ids = np.asarray(ids)
+        if index is None:
+            super().__init__(encode_keys(ids), ids.shape[1], vocabulary)
+        else:
+            super().__init__(index['codes'], ids.shape[1], vocabulary, (index['sorted_positions'], index['sorted_codes']))
+        self.counts = np.asarray(counts)
+        self.total = int(total)
+        self.added = {} # n-gram -> occurence, n-grams counted after the creation
+
+    """Returns the occurence of an n-gram, 0 if it is not known
+    """
+    def count(self, key):
+        if self.added and key in self.added:
+            return self.added[key]
+        position = self.position(key)
+        return 0 if position < 0 else int(self.counts[position])
+
+    def __getitem__(self, key):
+        occurence = self.count(key)
+        if occurence == 0:
+            raise KeyError(key)
+        return log(occurence / self.total)
+
+    def get(self, key, default=None):
+        occurence = self.count(key)
+        return default if occurence == 0 else log(occurence / self.total)
+
+    def __contains__(self, key):
+        return self.count(key) > 0
+
+    def __iter__(self):
+        yield from super().__iter__()
+        for key in self.added:
+            if self.position(key) < 0:
+                yield key
+
+    def __len__(self):
+        return len(self.codes) + len([key for key in self.added if self.position(key) < 0])
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return zip(iter(self), self.values())
+
+    """Adds the counted n-grams of new sentences
+
+    Parameters
+    ----------
+    counts : (numpy.ndarray, numpy.ndarray) - see count_ngrams, the ids refer to the vocabulary of the table
+    total : int - the number of n-grams in the new sentences
+    """
+    def add_counts(self, counts, total):
+        strings = self.vocabulary.strings
+        grams, occurences = counts
+        for gram, occurence in zip(np.asarray(grams).tolist(), np.asarray(occurences).tolist()):
+            key = tuple(strings[word] for word in gram)
+            self.added[key] = self.count(key) + occurence
+        self.total += int(total)
+
+    """Returns the word ids and the occurence of all n-grams including the added ones, new n-grams are appended
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        shape (number of n-grams, order) and one int64 per n-gram
+    """
+    def to_array(self):
+        ids = encode_ids(self.codes, self.order, np.arange(len(self.codes) + 1))
+        counts = np.array(self.counts, dtype=np.int64)
+        new = []
+        for key, occurence in self.added.items():
+            position = self.position(key)
+            if position >= 0:
+                counts[position] = occurence
+            else:
+                new.append(([self.vocabulary.id(word) for word in key], occurence))
+        if new:
+            ids = np.concatenate((ids, np.array([item[0] for item in new], dtype=np.int32).reshape(len(new), self.order)))
+            counts = np.concatenate((counts, np.array([item[1] for item in new], dtype=np.int64)))
+        return ids, counts
+
+"""Phrase table computed out of the n-gram tables instead of holding a PhraseTableEntry per translation option.
+The log_prob of an option is its relative occurence per source phrase, as in Corpora.create_phrase_table.
+Provides the part of the nltk PhraseTable interface used by the decoders (translations_for, in and add).
+The options are read from the lookup tables including their changed entries, see invalidate.
+"""
+class CompactPhraseTable:
+    """Constructor for the CompactPhraseTable class
+
+    Parameters
+    ----------
+    tables : {int: NgramTable} - the lookup table per source phrase length, e.g. {1: lookup_dict, 2: lookup_bigrams, 3: lookup_trigrams}
+    cache_size : int - number of source phrases whose translations are kept decoded
+    """
+    def __init__(self, tables, cache_size=65536):
+        self.tables = tables
+        self.extra = PhraseTable() # entries added via add, e.g. the tags
+        self.cache_size = cache_size
+        self.translations = lru_cache(maxsize=cache_size)(self.compute_translations)
+
+    def compute_translations(self, src_phrase):
+        entries = list(self.extra.src_phrases.get(src_phrase, []))
+        table = self.tables.get(len(src_phrase))
+        options = table.get(src_phrase[0] if len(src_phrase) == 1 else src_phrase) if table is not None else None
+        if options:
+            overall = sum(n for _, n in options) # the total number of occurences for the relative probabilty
+            for option in options:
+                entries.append(PhraseTableEntry(trg_phrase=(option[0],) if len(src_phrase) == 1 else option[0], log_prob=option[1] / overall))
+        if not entries:
+            raise KeyError(src_phrase)
+        # sorted the same way as by PhraseTable.add, ties keep their insertion order
+        return sorted(entries, key=lambda e: e.log_prob, reverse=True)
+
+    def translations_for(self, src_phrase):
+        return self.translations(src_phrase)
+
+    def add(self, src_phrase, trg_phrase, log_prob):
+        self.extra.add(src_phrase, trg_phrase, log_prob)
+        self.invalidate()
+
+    """Drops the decoded translations, has to be called after the lookup tables changed
+    """
+    def invalidate(self):
+        self.translations.cache_clear()
+
+    def __contains__(self, src_phrase):
+        if src_phrase in self.extra:
+            return True
+        table = self.tables.get(len(src_phrase))
+        return table is not None and (src_phrase[0] if len(src_phrase) == 1 else src_phrase) in table
+
+    # the lru_cache is not picklable, it is rebuilt after unpickling
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['translations']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.translations = lru_cache(maxsize=self.cache_size)(self.compute_translations)
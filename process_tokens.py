@@ -3,7 +3,10 @@
 from dotenv import load_dotenv
 import psycopg2
 import re
+from itertools import groupby
+from InputSentence import normalize_sentence
 from pathlib import Path
+import metrics
 env_path = Path('.') / '.env'
 load_dotenv(dotenv_path=env_path)
 import os
@@ -13,6 +16,11 @@ DATABASE_NAME = os.getenv("DATABASE_NAME")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 DATABASE_USER = os.getenv("DATABASE_USER")
 
+FETCH_SECONDS = metrics.histogram('fetch_seconds', 'Time for fetching the tokens of all transcripts (get_settings)')
+TOKENS_FETCHED = metrics.counter('tokens_fetched_total', 'Tokens read from the database')
+CREATE_SENTENCES_SECONDS = metrics.histogram('create_sentences_seconds', 'Time per transcript for building the sentences (get_settings)')
+SENTENCES_BUILT = metrics.counter('sentences_built_total', 'Sentences built out of the tokens')
+
 
 # Open connection to the database
 def connectDB():
@@ -110,6 +118,50 @@ def get_tokens_for_transcript_and_speakerID(cursor, transcript_id, speaker_id):
 
     return data    
 
+TOKEN_FIELDS = ["id", "text", "ortho", "ID_Inf_id", "token_reihung", "updated"] # the fields of a token dict, as selected by get_tokens_for_transcript_and_speakerID and the time of the last change
+
+"""""
+Fetches the tokens of all given transcripts with one ordered query through a server-side (named) cursor,
+the rows are streamed in batches of itersize as tuples and grouped in a single pass.
+:return: transcript_objects dict, the same structure as built by get_speakers_IDs and get_tokens_for_transcript_and_speakerID:
+transcript_objects = {
+    transcript_id: {
+        speaker_id: [token1, token2, ...] # ordered by token_reihung
+    },
+    ...
+}
+"""""
+def get_tokens_for_transcripts(connection, transcript_ids, itersize=20000):
+    transcript_objects = {}
+    for transcript_id in transcript_ids:
+        transcript_objects[transcript_id] = {}
+
+    for transcript_id, speaker_id, token in stream_tokens(connection, transcript_ids, itersize):
+        speakers = transcript_objects[transcript_id]
+        if speaker_id not in speakers:
+            speakers[speaker_id] = []
+        speakers[speaker_id].append(token)
+
+    return transcript_objects
+
+"""""
+Streams the tokens of all given transcripts ordered by transcript, speaker and token_reihung.
+Only itersize rows are held in memory at a time.
+:return: generator of (transcript_id, speaker_id, token dict)
+"""""
+def stream_tokens(connection, transcript_ids, itersize=20000):
+    postGreSQL_select_tokens = "SELECT t.transcript_id_id, t.id, t.text, t.ortho, t.\"ID_Inf_id\", t.token_reihung, t.updated FROM token t WHERE t.text != '⦿' AND t.\"ID_Inf_id\" IS NOT NULL AND t.transcript_id_id = ANY(%s) ORDER BY t.transcript_id_id, t.\"ID_Inf_id\", t.token_reihung ASC"
+
+    cursor = connection.cursor(name="fetch_tokens")
+    cursor.itersize = itersize
+    cursor.execute(postGreSQL_select_tokens, (list(transcript_ids),))
+
+    for row in cursor:
+        TOKENS_FETCHED.inc()
+        yield row[0], row[4], dict(zip(TOKEN_FIELDS, row[1:]))
+
+    cursor.close()
+
 """""
 :param: the relevant trancript object, a dictionary accessed by speaker's id
 :return: sentences dict:
@@ -125,26 +177,70 @@ def create_sentences(transcript):
     sentences = {} # tokenreihung is generated automatically, therefore access can be easily done without a dictionary
 
     for speaker_id in transcript:
-        sentence_item = []
-        last_token_ = 1
-        for item in transcript[speaker_id]: # go through all same speaker's items
-            if item["text"] is not None: # if it is a None, then skip
-                # if it has arrived to the point where the sentence ends, if the sentence is too long then split also on the comma
-                if item["text"].strip() == "." or item["text"].strip() == "?" or item["text"].strip() == ";" or item["text"].strip() == "," or item["text"].strip() == "-": # end the sentence
-                    if sentence_item:
-                        id = str(speaker_id) + "_" + str(last_token_)
-                        sentences[id] = {}
-                        sentences[id]["items"] = clean_fregments(sentence_item) # update global dict
-                        sentences[id]["output_sentence"] = clean_sentence(' '.join(item["text"] for item in sentences[id]["items"]))
-                        sentence_item = []
-                        last_token_ = item["token_reihung"]
-                else:
-                    if not re.findall(r"\(\([a-zäüöß]+", item["text"]) and not re.findall(r"[a-zäüöß]+\)\)", item["text"]):
-                        if text_is_word(item["text"].replace("_", "").replace(":", "")) and item["text"] != ":" and item["text"] != "_":
-                            sentence_item.append(item)
+        for id, sentence in iter_sentences(speaker_id, transcript[speaker_id]):
+            sentences[id] = sentence # update global dict
 
     return sentences 
 
+"""""
+Builds the sentences of one speaker incrementally, each sentence is yielded as soon as its closing sign is read.
+"updated_tokens" are the tokens read for the sentence with the time of their last change, including the filtered out ones and the closing sign (tokens without a known time are left out).
+:param: the speaker's id and an iterable of the speaker's tokens ordered by token_reihung
+:return: generator of ("speaker_id_token_reihung", {"items": [...], "output_sentence": str, "updated_tokens": [(id, updated, text, ortho)]}), see create_sentences
+"""""
+def iter_sentences(speaker_id, tokens):
+    sentence_item = []
+    last_token_ = 1
+    updated_tokens = []
+    for item in tokens: # go through all same speaker's items
+        if item.get("updated") is not None:
+            updated_tokens.append((item["id"], item["updated"], item["text"], item["ortho"]))
+        if item["text"] is not None: # if it is a None, then skip
+            # if it has arrived to the point where the sentence ends, if the sentence is too long then split also on the comma
+            if item["text"].strip() == "." or item["text"].strip() == "?" or item["text"].strip() == ";" or item["text"].strip() == "," or item["text"].strip() == "-": # end the sentence
+                if sentence_item:
+                    sentence = {}
+                    sentence["items"] = clean_fregments(sentence_item)
+                    sentence["output_sentence"] = clean_sentence(' '.join(item["text"] for item in sentence["items"]))
+                    sentence["updated_tokens"] = updated_tokens
+                    SENTENCES_BUILT.inc()
+                    yield str(speaker_id) + "_" + str(last_token_), sentence
+                    sentence_item = []
+                    last_token_ = item["token_reihung"]
+                    updated_tokens = []
+            else:
+                if not re.findall(r"\(\([a-zäüöß]+", item["text"]) and not re.findall(r"[a-zäüöß]+\)\)", item["text"]):
+                    if text_is_word(item["text"].replace("_", "").replace(":", "")) and item["text"] != ":" and item["text"] != "_":
+                        sentence_item.append(item)
+
+"""""
+Turns a token stream (see stream_tokens) into a sentence stream, speaker by speaker.
+:return: generator of (transcript_id, sentence_id, sentence)
+"""""
+def stream_sentences(token_stream):
+    for (transcript_id, speaker_id), tokens in groupby(token_stream, key=lambda entry: (entry[0], entry[1])):
+        for id, sentence in iter_sentences(speaker_id, (token for _, _, token in tokens)):
+            yield transcript_id, id, sentence
+
+"""""
+Returns the current time of the database, used as the watermark of a run (see run_state)
+"""""
+def get_database_time(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT CURRENT_TIMESTAMP")
+    return cursor.fetchone()[0]
+
+"""""
+Collects the vocabulary of the given transcripts, the words as they appear in the sentences that are translated.
+Used for precomputing the OOV resolutions (see Corpora.precompute_oov_resolutions).
+:return: set of words
+"""""
+def get_sentence_vocabulary(connection, transcript_ids):
+    vocabulary = set()
+    for _, _, sentence in stream_sentences(stream_tokens(connection, transcript_ids)):
+        vocabulary.update(normalize_sentence(sentence["output_sentence"]).split())
+    return vocabulary
+
 def clean_sentence(s):
     s = filter_out_signs(s)
     s = deanonymize(s)
@@ -186,17 +282,12 @@ def text_is_word(txt):
 def get_settings():
     connection = connectDB()
     transcripts_ids = get_transcripts_IDs_ViennaNear(connection.cursor()) # get_transcripts_IDs_Vienna(connection.cursor())
-    transcript_objects = {}
-
-    for transcript_id in transcripts_ids:
-        speaker_ids = get_speakers_IDs(connection.cursor(), transcript_id)
-        transcript_objects[transcript_id] = {}
-        for speaker_id in speaker_ids:
-            tokens_per_speaker = get_tokens_for_transcript_and_speakerID(connection.cursor(), transcript_id=transcript_id, speaker_id=speaker_id)
-            transcript_objects[transcript_id][speaker_id] = tokens_per_speaker
+    with FETCH_SECONDS.time():
+        transcript_objects = get_tokens_for_transcripts(connection, transcripts_ids)
 
     sentence_objects = {}
     for id in transcripts_ids:
-        sentence_objects[id] = create_sentences(transcript_objects[id]) # holds the sentence structure
+        with CREATE_SENTENCES_SECONDS.time():
+            sentence_objects[id] = create_sentences(transcript_objects[id]) # holds the sentence structure
 
     return transcripts_ids ,sentence_objects, connection
\ No newline at end of file
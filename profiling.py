@@ -0,0 +1,195 @@
+import cProfile
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+"""This module provides the profiling mode of main.py and update_database.py (--profile PREFIX).
+The whole job runs under cProfile and a sampling profiler, and the memory allocations are traced. It writes:
+
+PREFIX.pstats    - the deterministic call graph, e.g. for `python -m pstats`, snakeviz or gprof2dot
+PREFIX.txt       - the functions with the highest cumulative time, readable without further tools
+PREFIX.collapsed - the sampled call stacks, one "frame;frame;frame count" line per stack,
+                   e.g. for flamegraph.pl or speedscope
+PREFIX.memory.txt - the biggest allocations of the tracemalloc snapshot, by the line of Corpora and by the line that allocated
+
+The memory is traced until the first snapshot (main.py takes it once the model is trained or loaded, see snapshot) or the end of the job,
+tracemalloc slows every allocation down and would distort the timing of the translation.
+
+The sampler counts CPU time (SIGPROF), thus the time spent waiting for the database or the worker processes shows up only in the pstats.
+Only the main process is profiled, the decoder is profiled with --workers 1.
+"""
+
+SAMPLE_INTERVAL = 0.01 # seconds of CPU time between two samples of the call stack
+TRACEMALLOC_FRAMES = 25 # frames kept per allocation, enough to reach the Corpora method that caused it
+TOP_ALLOCATIONS = 25 # lines per section of the memory report
+
+profiler = None # the running Profiler, None if the job is not profiled
+
+"""Records the call stack of the main thread at a fixed interval of CPU time
+"""
+class StackSampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def start(self):
+        if not hasattr(signal, 'setitimer'):
+            print("The sampling profiler is not available on this platform, only the pstats are written")
+            return
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.siginterrupt(signal.SIGPROF, False) # system calls (e.g. reading from the database) are restarted instead of failing
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    # only the code objects are kept while sampling, they are turned into frame names when the stacks are written
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        self.stacks[tuple(stack)] += 1
+
+    """Writes the stacks in the collapsed format of flamegraph.pl, the root frame first
+    """
+    def write_collapsed(self, path):
+        collapsed = Counter()
+        for stack, count in self.stacks.items():
+            collapsed[';'.join(code.co_name + ' (' + os.path.basename(code.co_filename) + ':' + str(code.co_firstlineno) + ')' for code in reversed(stack))] += count
+        with open(path, 'w', encoding='utf-8') as collapsed_file:
+            for stack, count in sorted(collapsed.items()):
+                collapsed_file.write(stack + ' ' + str(count) + '\n')
+
+"""Runs cProfile, the stack sampler and tracemalloc and writes their results, see the module description
+"""
+class Profiler:
+    """Constructor for the Profiler class
+
+    Parameters
+    ----------
+    prefix : str - path and file name prefix of the written files
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler()
+        self.snapshots = [] # [(label, tracemalloc.Snapshot)]
+
+    def start(self):
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+        self.profile.enable()
+
+    """Takes a tracemalloc snapshot of the memory allocated so far and stops tracing
+
+    Parameters
+    ----------
+    label : str - names the snapshot in the memory report, e.g. "model loaded"
+    """
+    def snapshot(self, label):
+        if tracemalloc.is_tracing():
+            self.snapshots.append((label, tracemalloc.take_snapshot()))
+            tracemalloc.stop()
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+        elapsed = time.perf_counter() - self.start_time
+        self.snapshot('end of the run')
+
+        self.profile.dump_stats(self.prefix + '.pstats')
+        with open(self.prefix + '.txt', 'w', encoding='utf-8') as report_file:
+            report_file.write('Wall time: {:.3f} s\n\n'.format(elapsed))
+            stats = pstats.Stats(self.profile, stream=report_file)
+            stats.sort_stats('cumulative').print_stats(60)
+            stats.sort_stats('tottime').print_stats(30)
+        self.sampler.write_collapsed(self.prefix + '.collapsed')
+        with open(self.prefix + '.memory.txt', 'w', encoding='utf-8') as memory_file:
+            for label, snapshot in self.snapshots:
+                memory_file.write(memory_report(label, snapshot) + '\n')
+
+        print("Profile written to ", self.prefix + '.pstats', ", ", self.prefix + '.txt', ", ", self.prefix + '.collapsed', " (", sum(self.sampler.stacks.values()), " samples) and ", self.prefix + '.memory.txt')
+
+"""Summarizes a tracemalloc snapshot
+
+Parameters
+----------
+label : str - the name of the snapshot
+snapshot : tracemalloc.Snapshot
+
+Returns
+-------
+str
+    the total traced memory, the lines of Corpora.py (and ngram_table.py, model_store.py) holding the most memory
+    including everything allocated in the functions they called, and the lines that allocated the most memory themselves
+"""
+def memory_report(label, snapshot):
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    total = sum(trace.size for trace in snapshot.traces)
+    lines = ['=== ' + label + ': ' + format_size(total) + ' traced ===', '', 'Biggest allocations by the line of the corpus that caused them:']
+
+    # an allocation is attributed to the most recent frame of the corpus modules on its call stack
+    by_corpus_line = Counter()
+    for trace in snapshot.traces:
+        for frame in reversed(trace.traceback):
+            if os.path.basename(frame.filename) in ('Corpora.py', 'ngram_table.py', 'model_store.py'):
+                by_corpus_line[os.path.basename(frame.filename) + ':' + str(frame.lineno)] += trace.size
+                break
+    for location, size in by_corpus_line.most_common(TOP_ALLOCATIONS):
+        lines.append(format_size(size).rjust(12) + '  ' + location)
+
+    lines.extend(['', 'Biggest allocations by the line that allocated:'])
+    for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        frame = statistic.traceback[0]
+        lines.append(format_size(statistic.size).rjust(12) + '  ' + frame.filename + ':' + str(frame.lineno) + ' (' + str(statistic.count) + ' blocks)')
+    return '\n'.join(lines) + '\n'
+
+def format_size(size):
+    return '{:.1f} MiB'.format(size / 1024 / 1024)
+
+"""Profiles the job in the context if a prefix is given, otherwise does nothing
+
+Parameters
+----------
+prefix : str or None - see Profiler
+"""
+@contextmanager
+def profile(prefix):
+    global profiler
+    if not prefix:
+        yield
+        return
+    profiler = Profiler(prefix)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        profiler = None
+
+"""Takes the tracemalloc snapshot if the job is profiled and the memory is still traced, e.g. after the model is loaded
+
+Parameters
+----------
+label : str - names the snapshot in the memory report
+"""
+def snapshot(label):
+    if profiler is not None:
+        profiler.snapshot(label)
+
+"""Stops profiling in a forked worker process, which inherited the running profiler of the main process
+"""
+def detach():
+    global profiler
+    if profiler is not None:
+        profiler.profile.disable()
+        tracemalloc.stop()
+        profiler = None
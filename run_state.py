@@ -0,0 +1,174 @@
+import json
+import os
+from datetime import datetime
+
+"""This module keeps the state of the translation runs (main.py --incremental, --resume) in a small json file:
+
+{
+    "fingerprint": "...", # the model and decoding settings the watermarks are valid for, see Corpora.fingerprint
+    "watermarks": {"transcript_id": "2021-05-03T02:00:00+00:00", ...},
+    "own_writes": {"transcript_id": {"token_id": [text, ortho], ...}, ...}, # the tokens written by the run that set the watermark
+    "run": { # the checkpoint of the current run, null after it finished
+        "fingerprint": "...",
+        "output": "./updates.spool.jsonl", # the spool or "database"
+        "started": "2021-05-04T02:00:00+00:00", # the database time at the start of the run, null if unknown
+        "completed": [transcript_id, ...], # transcripts whose updates are translated and durably written
+        "spool_offset": 1234 # size of the spool after the last completed transcript
+    }
+}
+
+The watermark of a transcript is the database time at the start of the last successful run that translated it,
+it is set once the updates of the transcript are committed to the database.
+Tokens changed after the watermark are translated again by the next incremental run,
+except the tokens written by that run itself: they still hold the text and the ortho kept in own_writes.
+"""
+
+"""Watermarks of the incremental translation runs per transcript and the checkpoint of the current run
+"""
+class RunState:
+    """Constructor for the RunState class, the state is read if the file exists
+
+    Parameters
+    ----------
+    path : str - the file location of the state
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fingerprint = None
+        self.transcript_watermarks = {}
+        self.transcript_own_writes = {}
+        self.run = None
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as state_file:
+                state = json.load(state_file)
+            self.fingerprint = state.get('fingerprint')
+            self.transcript_watermarks = {int(id): datetime.fromisoformat(watermark) for id, watermark in state.get('watermarks', {}).items()}
+            self.transcript_own_writes = {int(id): {int(token_id): tuple(value) for token_id, value in writes.items()} for id, writes in state.get('own_writes', {}).items()}
+            self.run = state.get('run')
+
+    """Returns the watermarks of the transcripts, empty if they were written for another model or other settings
+
+    Parameters
+    ----------
+    fingerprint : str - see Corpora.fingerprint
+
+    Returns
+    -------
+    {int: datetime}
+    """
+    def watermarks(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            return {}
+        return dict(self.transcript_watermarks)
+
+    """Returns the tokens written by the runs that set the watermarks, empty if they were written for another model or other settings
+
+    Parameters
+    ----------
+    fingerprint : str - see Corpora.fingerprint
+
+    Returns
+    -------
+    {int: {int: (str, str)}}
+        transcript id -> token id -> (text, ortho) after the write
+    """
+    def own_writes(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            return {}
+        return {id: dict(writes) for id, writes in self.transcript_own_writes.items()}
+
+    """Sets the watermark of the given transcripts once their updates are committed and saves the state.
+    The watermarks of another fingerprint are dropped.
+
+    Parameters
+    ----------
+    fingerprint : str - see Corpora.fingerprint
+    transcript_ids : [int]
+    timestamp : datetime - the database time at the start of the run
+    own_writes : {int: (str, str)} - the tokens the run changed in the transcripts, see BulkUpdater.pop_written
+    """
+    def set_watermarks(self, fingerprint, transcript_ids, timestamp, own_writes=None):
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.transcript_watermarks = {}
+            self.transcript_own_writes = {}
+        for id in transcript_ids:
+            self.transcript_watermarks[id] = timestamp
+            if own_writes:
+                self.transcript_own_writes[id] = dict(own_writes)
+            else:
+                self.transcript_own_writes.pop(id, None)
+        self.save()
+
+    """Returns the checkpoint of an unfinished run that can be resumed
+
+    Parameters
+    ----------
+    fingerprint : str - see Corpora.fingerprint, a run of another model or other settings is not resumed
+    output : str - the spool or "database", a run writing somewhere else is not resumed
+
+    Returns
+    -------
+    dict or None
+        see the module description
+    """
+    def resumable_run(self, fingerprint, output):
+        if self.run is None or self.run['fingerprint'] != fingerprint or self.run['output'] != output:
+            return None
+        return self.run
+
+    """Returns the database time at the start of the current run, None if unknown
+    """
+    def run_started(self):
+        return datetime.fromisoformat(self.run['started']) if self.run and self.run['started'] else None
+
+    """Starts the checkpoint of a new run, replacing the one of an unfinished run
+
+    Parameters
+    ----------
+    fingerprint : str - see Corpora.fingerprint
+    output : str - the spool or "database"
+    started : datetime - the database time at the start of the run, None if unknown
+    """
+    def start_run(self, fingerprint, output, started):
+        self.run = {
+            'fingerprint': fingerprint,
+            'output': output,
+            'started': started.isoformat() if started else None,
+            'completed': [],
+            'spool_offset': 0,
+        }
+        self.save()
+
+    """Records a transcript as completed, called after its updates were durably written
+
+    Parameters
+    ----------
+    transcript_id : int
+    spool_offset : int - size of the spool after the transcript, None if the updates are written to the database
+    """
+    def complete_transcript(self, transcript_id, spool_offset=None):
+        self.run['completed'].append(transcript_id)
+        if spool_offset is not None:
+            self.run['spool_offset'] = spool_offset
+        self.save()
+
+    """Removes the checkpoint after the run finished
+    """
+    def finish_run(self):
+        self.run = None
+        self.save()
+
+    """Writes the state, the file is replaced atomically
+    """
+    def save(self):
+        state = {
+            'fingerprint': self.fingerprint,
+            'watermarks': {str(id): watermark.isoformat() for id, watermark in sorted(self.transcript_watermarks.items())},
+            'own_writes': {str(id): {str(token_id): list(value) for token_id, value in writes.items()} for id, writes in sorted(self.transcript_own_writes.items())},
+            'run': self.run,
+        }
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file, indent=1)
+        os.replace(temporary, self.path)
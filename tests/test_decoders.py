@@ -0,0 +1,70 @@
+import unittest
+from nltk.translate import PhraseTable, StackDecoder
+from ViterbiDecoder import ViterbiDecoder
+
+"""The ViterbiDecoder has to find the translation of the monotone StackDecoder (distortion factor 0, see Corpora.create_stack_decoder)
+"""
+
+# source phrase -> [(target phrase, log probability)], ambiguous words and phrases that compete with their words
+TOY_PHRASES = {
+    ('<s>',): [(('<s>',), 0.0)],
+    ('</s>',): [(('</s>',), 0.0)],
+    ('i',): [(('ich',), -0.1)],
+    ('hob',): [(('habe',), -0.2), (('hab',), -0.9)],
+    ('des',): [(('das',), -0.1), (('des',), -1.5)],
+    ('ned',): [(('nicht',), -0.1)],
+    ('gwusst',): [(('gewusst',), -0.3)],
+    ('waaß',): [(('weiß',), -0.2), (('waaß',), -2.0)],
+    ('hob', 'des'): [(('habe', 'das'), -0.1)],
+    ('des', 'ned'): [(('das', 'nicht'), -0.4), (('des', 'nicht'), -0.6)],
+    ('i', 'waaß', 'ned'): [(('ich', 'weiß', 'nicht'), -0.05)],
+}
+
+# target phrases and their log probabilities, everything else is -50, like Corpora.build_language_model the context is not used
+TOY_LANGUAGE_MODEL = {
+    ('ich',): -1.0,
+    ('habe',): -1.2,
+    ('hab',): -2.5,
+    ('das',): -0.8,
+    ('des',): -3.0,
+    ('nicht',): -0.9,
+    ('weiß',): -1.1,
+    ('gewusst',): -2.0,
+    ('habe', 'das'): -1.5,
+    ('das', 'nicht'): -1.4,
+    ('des', 'nicht'): -4.0,
+    ('ich', 'weiß', 'nicht'): -2.1,
+}
+
+class ToyLanguageModel:
+    def probability_change(self, context, phrase):
+        return TOY_LANGUAGE_MODEL.get(tuple(phrase), -50.0)
+
+    def probability(self, phrase):
+        return TOY_LANGUAGE_MODEL.get(tuple(phrase), -50.0)
+
+def toy_phrase_table():
+    phrase_table = PhraseTable()
+    for src_phrase, options in TOY_PHRASES.items():
+        for trg_phrase, log_prob in options:
+            phrase_table.add(src_phrase, trg_phrase, log_prob)
+    return phrase_table
+
+class DecoderTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = StackDecoder(toy_phrase_table(), ToyLanguageModel())
+        self.stack.distortion_factor = 0.0
+        self.viterbi = ViterbiDecoder(toy_phrase_table(), ToyLanguageModel())
+
+    def test_same_translation_as_the_stack_decoder(self):
+        for sentence in ['<s> i hob des ned gwusst </s>', '<s> i waaß ned </s>', '<s> hob des </s>', '<s> des ned </s>', '<s> waaß </s>']:
+            with self.subTest(sentence=sentence):
+                self.assertEqual(self.viterbi.translate(sentence.split()), self.stack.translate(sentence.split()))
+
+    def test_unknown_word_is_not_translated(self):
+        for decoder in (self.viterbi, self.stack):
+            with self.assertWarns(UserWarning):
+                self.assertEqual(decoder.translate('<s> i hob wos </s>'.split()), [])
+
+if __name__ == '__main__':
+    unittest.main()
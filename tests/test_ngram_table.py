@@ -0,0 +1,79 @@
+import random
+import unittest
+import numpy as np
+from Corpora import split_shards
+from ngram_table import Vocabulary, NgramTable, NgramCounts, count_shard, merge_shards
+
+"""Counting the training data in shards (Corpora.create_ngram_tables with workers) has to give the tables of the serial count.
+The ids of the vocabularies differ (the words are interned shard by shard), thus the rows are compared as words.
+"""
+
+# (dialect form, standard form)
+LEXICON = [("i", "ich"), ("des", "das"), ("is", "ist"), ("ned", "nicht"), ("a", "eine"), ("und", "und"), ("so", "so"), ("ja", "ja"),
+           ("hob", "habe"), ("mia", "wir"), ("san", "sind"), ("wos", "was"), ("do", "da"), ("oba", "aber"), ("guat", "gut"), ("waß", "weiß")]
+
+def decode_rows(rows, strings):
+    return [tuple(strings[id] for id in row[:-1]) + (row[-1],) for row in rows.tolist()]
+class MergeShardsTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.parallel = []
+        for _ in range(400):
+            pairs = [rng.choice(LEXICON) for _ in range(rng.randint(1, 9))]
+            self.parallel.append((' '.join(pair[0] for pair in pairs), ' '.join(pair[1] for pair in pairs)))
+        self.orth = [orth for _, orth in self.parallel]
+
+    def assertSameCounts(self, merged, serial):
+        self.assertEqual(set(merged['strings']), set(serial['strings']))
+        for order in range(3):
+            self.assertEqual(decode_rows(merged['aligned'][order], merged['strings']), decode_rows(serial['aligned'][order], serial['strings']))
+        merged_grams, merged_occurences = merged['orth_trigrams']
+        serial_grams, serial_occurences = serial['orth_trigrams']
+        self.assertEqual(decode_rows(np.column_stack((merged_grams, merged_occurences)), merged['strings']),
+                         decode_rows(np.column_stack((serial_grams, serial_occurences)), serial['strings']))
+        self.assertEqual(merged['orth_bigrams_total'], serial['orth_bigrams_total'])
+        self.assertEqual(merged['orth_trigrams_total'], serial['orth_trigrams_total'])
+
+    def test_shards_give_the_serial_counts(self):
+        serial = merge_shards([count_shard(self.parallel, self.orth)], Vocabulary())
+        for workers in (2, 3, 7):
+            with self.subTest(workers=workers):
+                shards = [count_shard(parallel, orth) for parallel, orth in zip(split_shards(self.parallel, workers), split_shards(self.orth, workers))]
+                self.assertSameCounts(merge_shards(shards, Vocabulary()), serial)
+
+    def test_empty_shard(self):
+        serial = merge_shards([count_shard(self.parallel[:5], self.orth[:5])], Vocabulary())
+        shards = [count_shard(parallel, orth) for parallel, orth in zip(split_shards(self.parallel[:5], 8), split_shards(self.orth[:5], 8))]
+        self.assertSameCounts(merge_shards(shards, Vocabulary()), serial)
+
+"""A table created from saved index arrays (model_store) has to answer as the table that sorted its keys itself
+"""
+class IndexArraysTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        parallel = []
+        for _ in range(200):
+            pairs = [rng.choice(LEXICON) for _ in range(rng.randint(1, 9))]
+            parallel.append((' '.join(pair[0] for pair in pairs), ' '.join(pair[1] for pair in pairs)))
+        self.vocabulary = Vocabulary()
+        self.counts = merge_shards([count_shard(parallel, [orth for _, orth in parallel])], self.vocabulary)
+
+    def test_lookup_tables(self):
+        for order in (1, 2, 3):
+            table = NgramTable(self.counts['aligned'][order - 1], order, self.vocabulary)
+            table.add_occurence(*(('ned', 'nicht') if order == 1 else (('ned',) * order, ('nicht',) * order)), 2)
+            rows = table.to_array()
+            expected = NgramTable(rows, order, self.vocabulary)
+            loaded = NgramTable(rows, order, self.vocabulary, expected.index_arrays())
+            self.assertEqual(list(loaded.items()), list(expected.items()))
+            self.assertNotIn('xyz' if order == 1 else ('xyz',) * order, loaded)
+
+    def test_language_model(self):
+        grams, occurences = self.counts['orth_trigrams']
+        expected = NgramCounts(grams, occurences, self.counts['orth_trigrams_total'], self.vocabulary)
+        loaded = NgramCounts(grams, occurences, self.counts['orth_trigrams_total'], self.vocabulary, expected.index_arrays())
+        self.assertEqual(list(loaded.items()), list(expected.items()))
+        self.assertEqual(loaded.get(('xyz', 'ist', 'das'), 0), 0)
+
+if __name__ == '__main__':
+    unittest.main()
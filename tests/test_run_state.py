@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from run_state import RunState
+from main import select_changed_sentences
+
+"""A token written by the run that set the watermark is not a change for the next incremental run,
+unless its text or ortho were changed afterwards (main.select_changed_sentences with the own_writes of RunState)
+"""
+
+WATERMARK = datetime(2021, 5, 3, 2, 0, tzinfo=timezone.utc)
+LATER = WATERMARK + timedelta(minutes=10)
+
+def sentence(*tokens):
+    return {"items": [{"id": token[0], "ortho": token[3]} for token in tokens], "updated_tokens": list(tokens)}
+
+class OwnWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'run_state.json')
+        RunState(self.path).set_watermarks('model', [1], WATERMARK, {10: ('i', 'ich'), 11: ('hob', 'habe')})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def select(self, *sentences):
+        state = RunState(self.path) # read back from the file
+        counts = {"sentences": 0, "selected": 0}
+        return [key for _, key, _ in select_changed_sentences(((1, key, value) for key, value in enumerate(sentences)), state.watermarks('model'), state.own_writes('model'), counts)]
+
+    def test_own_writes_are_no_changes(self):
+        self.assertEqual(self.select(sentence((10, LATER, 'i', 'ich'), (11, LATER, 'hob', 'habe'), (12, WATERMARK, 'des', 'das'))), [])
+
+    def test_changes_after_the_own_write(self):
+        self.assertEqual(self.select(sentence((10, LATER, 'i', 'ich')),
+                                     sentence((10, LATER, 'I', 'ich')), # text edited
+                                     sentence((11, LATER, 'hob', 'hab')), # ortho edited
+                                     sentence((12, LATER, 'des', 'das'))), # not written by the run
+                         [1, 2, 3])
+
+    def test_other_fingerprint(self):
+        state = RunState(self.path)
+        self.assertEqual(state.own_writes('other model'), {})
+        state.set_watermarks('other model', [1], LATER)
+        self.assertEqual(RunState(self.path).own_writes('model'), {})
+
+if __name__ == '__main__':
+    unittest.main()
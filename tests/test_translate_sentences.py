@@ -0,0 +1,65 @@
+import os
+import random
+import tempfile
+import unittest
+import pandas as pd
+from Corpora import Corpora
+from main import translate_sentences
+
+"""In the "learn during run" mode (main.py --learn) the translations and the learned words must not depend on the number of workers,
+and the cached OOV resolutions have to follow the learned words
+"""
+
+# (dialect form, standard form)
+LEXICON = [("i", "ich"), ("des", "das"), ("is", "ist"), ("ned", "nicht"), ("waaß", "weiß"), ("hob", "habe"), ("mia", "wir"),
+           ("san", "sind"), ("wos", "was"), ("do", "da"), ("oba", "aber"), ("guat", "gut"), ("heit", "heute"), ("Leit", "Leute")]
+
+# words of the target language only and vowel_table variants of them, they are learned while translating
+TARGET_WORDS = ["nicht", "weiß", "heute", "gut", "ist", "was", "Leute", "aber"]
+
+class LearnWorkersTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        rows = []
+        for _ in range(200):
+            pairs = [rng.choice(LEXICON) for _ in range(rng.randint(2, 7))]
+            rows.append((' '.join(pair[0] for pair in pairs), ' '.join(pair[1] for pair in pairs)))
+        words = [pair[0] for pair in LEXICON] + TARGET_WORDS + ["heite", "goot", "woas"]
+        cls.sentences = [' '.join(rng.choice(words) for _ in range(rng.randint(2, 8))) for _ in range(120)]
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, 'training.xlsx')
+        pd.DataFrame(rows, columns=['sentorig', 'sentorth']).to_excel(path, index=False)
+        cls.model_path = os.path.join(cls.directory.name, 'model')
+        Corpora(path, decoder='viterbi').save(cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def translate(self, workers):
+        corpus = Corpora.load(self.model_path, 'viterbi', learn=True)
+        jobs = [(1, index, sentence) for index, sentence in enumerate(self.sentences)]
+        translations = list(translate_sentences(corpus, jobs, workers, self.model_path, 'viterbi', learn=True, batch_size=50))
+        learned = sorted(word for word in TARGET_WORDS if word in corpus.lookup_dict)
+        return translations, learned, corpus.oov_statistics.to_dict()
+
+    def test_same_as_one_worker(self):
+        serial = self.translate(1)
+        self.assertGreater(len(serial[1]), 0)
+        self.assertEqual(self.translate(4), serial)
+
+    def test_resolutions_follow_the_learned_words(self):
+        corpus = Corpora.load(self.model_path, 'viterbi', learn=True)
+        jobs = [(1, index, sentence) for index, sentence in enumerate(self.sentences)]
+        # resolved before the words are learned, e.g. precomputed
+        for sentence in self.sentences:
+            for word in sentence.split():
+                if word not in corpus.lookup_dict:
+                    corpus.resolve_oov(word)
+        list(translate_sentences(corpus, jobs, 1, self.model_path, 'viterbi', learn=True))
+        for word in set(' '.join(self.sentences).split()) - set(corpus.lookup_dict):
+            self.assertEqual(corpus.resolve_oov(word), corpus.find_oov_resolution(word), word)
+
+if __name__ == '__main__':
+    unittest.main()
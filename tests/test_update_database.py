@@ -0,0 +1,149 @@
+import os
+import unittest
+import psycopg2
+from update_database import BulkUpdater, copyEscape
+
+"""The rows of BulkUpdater are streamed in the text format of COPY, the orthos have to arrive unchanged
+"""
+
+# the inverse of copyEscape, the way PostgreSQL reads a column of the text format
+def copy_unescape(value):
+    escapes = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r'}
+    result = []
+    characters = iter(value)
+    for character in characters:
+        result.append(escapes[next(characters)] if character == '\\' else character)
+    return ''.join(result)
+
+class RecordingCursor:
+    def __init__(self):
+        self.copied = []
+        self.rowcount = 0
+
+    # every copied row changes its token, RETURNING gives the id, a text and the ortho
+    def execute(self, statement, parameters=None):
+        if statement.startswith("UPDATE"):
+            rows = [line.split('\t') for line in self.copied[-1].rstrip('\n').split('\n')]
+            self.returned = [(int(token_id), 'text', copy_unescape(ortho)) for token_id, ortho in rows]
+            self.rowcount = len(rows)
+
+    def fetchall(self):
+        return self.returned
+
+    def copy_expert(self, statement, buffer):
+        self.copied.append(buffer.read())
+
+class RecordingConnection:
+    def __init__(self):
+        self.recording_cursor = RecordingCursor()
+        self.commits = 0
+
+    def cursor(self):
+        return self.recording_cursor
+
+    def commit(self):
+        self.commits += 1
+
+ORTHOS = ['tab\there', 'back\\slash', '"double" and \'single\' quotes', 'line\nbreak\r', '\\t is no tab', 'trailing\\']
+
+class CopyEscapeTest(unittest.TestCase):
+    def test_escaped_value_has_no_separators(self):
+        for ortho in ORTHOS:
+            with self.subTest(ortho=ortho):
+                escaped = copyEscape(ortho)
+                self.assertNotIn('\t', escaped)
+                self.assertNotIn('\n', escaped)
+                self.assertEqual(copy_unescape(escaped), ortho)
+
+    def test_quotes_are_not_escaped(self):
+        self.assertEqual(copyEscape('"a" \'b\''), '"a" \'b\'')
+
+    def test_bulk_updater_rows(self):
+        connection = RecordingConnection()
+        updater = BulkUpdater(connection, chunk_size=4, record_writes=True)
+        for token_id, ortho in enumerate(ORTHOS):
+            updater.write(token_id, ortho)
+        updater.close()
+
+        rows = [line.split('\t') for chunk in connection.recording_cursor.copied for line in chunk.rstrip('\n').split('\n')]
+        self.assertEqual([(int(token_id), copy_unescape(ortho)) for token_id, ortho in rows], list(enumerate(ORTHOS)))
+        self.assertEqual(connection.commits, 2)
+        self.assertEqual(updater.pop_written(), {token_id: ('text', ortho) for token_id, ortho in enumerate(ORTHOS)})
+        self.assertEqual(updater.pop_written(), {})
+
+"""Runs BulkUpdater against a PostgreSQL server, the connection is taken from DATABASE_URL or the libpq variables (PGHOST, PGDATABASE, ...).
+The updates go to a temporary table "token" of the session, it hides a real token table of the database.
+"""
+@unittest.skipUnless(os.environ.get('DATABASE_URL') or any(name.startswith('PG') for name in os.environ), 'no PostgreSQL server configured (DATABASE_URL or PG* variables)')
+class PostgresBulkUpdaterTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = psycopg2.connect(os.environ.get('DATABASE_URL', ''))
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("CREATE TEMP TABLE token (id integer PRIMARY KEY, text text, ortho text, updated timestamptz)")
+        self.cursor.executemany("INSERT INTO token VALUES (%s, %s, NULL, '2020-01-01')", [(token_id, 'word' + str(token_id)) for token_id in range(len(ORTHOS))])
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def table(self):
+        self.cursor.execute("SELECT id, ortho, updated FROM token ORDER BY id")
+        return self.cursor.fetchall()
+
+    def test_orthos_arrive_unchanged(self):
+        updater = BulkUpdater(self.connection, chunk_size=4)
+        for token_id, ortho in enumerate(ORTHOS):
+            updater.write(token_id, ortho)
+        updater.close()
+        self.assertEqual([row[1] for row in self.table()], ORTHOS)
+        self.assertEqual(updater.count, len(ORTHOS))
+
+    def test_unchanged_rows_are_not_written(self):
+        self.cursor.execute("UPDATE token SET ortho = %s WHERE id = 0", (ORTHOS[0],))
+        self.connection.commit()
+        before = self.table()
+
+        updater = BulkUpdater(self.connection, chunk_size=None)
+        updater.write(0, ORTHOS[0]) # same value
+        updater.write(1, ORTHOS[1]) # NULL before
+        updater.close()
+        after = self.table()
+        self.assertEqual(updater.count, 1)
+        self.assertEqual(after[0], before[0])
+        self.assertNotEqual(after[1][2], before[1][2])
+
+        updater = BulkUpdater(self.connection, chunk_size=None, record_writes=True)
+        updater.write(1, ORTHOS[1])
+        updater.close()
+        self.assertEqual(updater.count, 0)
+        self.assertEqual(updater.pop_written(), {})
+        self.assertEqual(self.table(), after)
+
+    def test_temporary_rows_are_deleted_on_commit(self):
+        updater = BulkUpdater(self.connection, chunk_size=2)
+        updater.write(0, ORTHOS[0])
+        updater.write(1, ORTHOS[1])
+        self.cursor.execute("SELECT count(*) FROM token_ortho_update")
+        self.assertEqual(self.cursor.fetchone()[0], 0)
+
+        # a value changed by someone else after the first chunk is not written back by the next chunk
+        self.cursor.execute("UPDATE token SET ortho = 'other' WHERE id = 0")
+        self.connection.commit()
+        updater.write(2, ORTHOS[2])
+        updater.close()
+        self.assertEqual([row[1] for row in self.table()[:3]], ['other', ORTHOS[1], ORTHOS[2]])
+        self.assertEqual(updater.count, 3)
+
+    def test_written_rows(self):
+        self.cursor.execute("UPDATE token SET ortho = %s WHERE id = 0", (ORTHOS[0],))
+        self.connection.commit()
+        updater = BulkUpdater(self.connection, chunk_size=3, record_writes=True)
+        for token_id, ortho in enumerate(ORTHOS):
+            updater.write(token_id, ortho)
+        updater.flush()
+        self.assertEqual(updater.pop_written(), {token_id: ('word' + str(token_id), ORTHOS[token_id]) for token_id in range(1, len(ORTHOS))})
+        updater.close()
+        self.assertEqual(updater.pop_written(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+from update_spool import END_MARKER, SpoolWriter, SpoolReplaced, read_spool, check_spool
+
+"""The spool between main.py and update_database.py: torn records of a crashed writer, the end marker and a replaced spool
+"""
+class ReadSpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'updates.spool.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w', encoding='utf-8') as spool_file:
+            spool_file.write(text)
+
+    def test_torn_last_line_is_not_read(self):
+        self.write('[1, 10, "ich"]\n[1, 11, "weiß"]\n[1, 12, "ni')
+        self.assertEqual(list(read_spool(self.path)), [(1, 10, 'ich'), (1, 11, 'weiß')])
+
+    def test_reading_stops_at_the_end_marker(self):
+        self.write('[1, 10, "ich"]\n' + json.dumps(END_MARKER) + '\n[1, 11, "weiß"]\n')
+        self.assertEqual(list(read_spool(self.path)), [(1, 10, 'ich')])
+        # a following reader returns at the end marker instead of waiting for more records
+        self.assertEqual(list(read_spool(self.path, follow=True, poll_interval=0.01)), [(1, 10, 'ich')])
+
+    def test_writer_round_trip(self):
+        writer = SpoolWriter(self.path)
+        writer.write(1, 10, 'ich')
+        writer.write(2, 20, 'tab\there "quoted" back\\slash')
+        writer.close()
+        self.assertEqual(list(read_spool(self.path, follow=True)), [(1, 10, 'ich'), (2, 20, 'tab\there "quoted" back\\slash')])
+
+    def test_resumed_writer_cuts_the_spool_at_the_checkpoint(self):
+        writer = SpoolWriter(self.path)
+        writer.write(1, 10, 'ich')
+        writer.flush()
+        offset = writer.tell()
+        writer.write(2, 20, 'wei')
+        writer.close(finished=False)
+
+        writer = SpoolWriter(self.path, append=True, offset=offset)
+        writer.write(2, 20, 'weiß')
+        writer.close()
+        self.assertEqual(list(read_spool(self.path)), [(1, 10, 'ich'), (2, 20, 'weiß')])
+
+    def test_replaced_spool_is_detected(self):
+        writer = SpoolWriter(self.path)
+        writer.write(1, 10, 'ich')
+        writer.flush()
+        with open(self.path, 'rb') as spool_file:
+            spool_file.read()
+            check_spool(self.path, spool_file)
+            SpoolWriter(self.path, append=True, offset=0).close(finished=False)
+            with self.assertRaises(SpoolReplaced):
+                check_spool(self.path, spool_file)
+        writer.close()
+
+    def test_new_run_replaces_the_spool(self):
+        writer = SpoolWriter(self.path)
+        writer.write(1, 10, 'ich')
+        writer.close()
+        with open(self.path, 'rb') as spool_file:
+            spool_file.readline()
+            SpoolWriter(self.path).close(finished=False)
+            with self.assertRaises(SpoolReplaced):
+                check_spool(self.path, spool_file)
+            # the old spool is not truncated under the reader
+            self.assertEqual(os.fstat(spool_file.fileno()).st_size, len(b'[1, 10, "ich"]\n{"end": true}\n'))
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import random
+import tempfile
+import unittest
+import pandas as pd
+from Corpora import Corpora, inverse_substitutions
+
+"""The vowel_index (Corpora.create_vowel_index) has to return the candidate of applying the vowel_table rules one by one (scan_vowel_table)
+"""
+
+# (dialect form, standard form), the dialect forms follow the vowel_table rules
+LEXICON = [("i", "ich"), ("des", "das"), ("is", "ist"), ("ned", "nicht"), ("waaß", "weiß"), ("ääns", "eins"), ("hoom", "haum"),
+           ("ggongen", "gegangen"), ("gmocht", "gemacht"), ("Wöödn", "Welden"), ("oisa", "allsa"), ("hoit", "halt"), ("guat", "gut"),
+           ("wos", "was"), ("do", "da"), ("oba", "aber"), ("wia", "wie"), ("heit", "heute"), ("Leit", "Leute"), ("woa", "war"),
+           ("schään", "schein"), ("klaa", "klein"), ("hooch", "hauch"), ("Öönd", "Elend"), ("ggessen", "gegessen"), ("wissn", "bissn")]
+
+# forms that are not in the lexicon, some of them are changed into a known word by the vowel_table rules
+UNKNOWN = ["waaßt", "ääner", "gmoocht", "hoit's", "Wööd", "gsogt", "woas", "ggongan", "kloo", "schaa", "Oida", "wööd", "bissl", "xyz"]
+
+class VowelIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(5)
+        rows = []
+        for _ in range(300):
+            pairs = [rng.choice(LEXICON) for _ in range(rng.randint(3, 8))]
+            rows.append((' '.join(pair[0] for pair in pairs), ' '.join(pair[1] for pair in pairs)))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'training.xlsx')
+            pd.DataFrame(rows, columns=['sentorig', 'sentorth']).to_excel(path, index=False)
+            cls.corpus = Corpora(path, decoder='viterbi')
+
+    def test_inverse_substitutions_are_changed_back(self):
+        for vowel, replacements in self.corpus.vowel_table.items():
+            for replacement in replacements:
+                for word in ['weißheit', 'aussage', 'gegangen', 'Leute', 'halle', 'abend']:
+                    for variant in inverse_substitutions(word, vowel, replacement):
+                        self.assertIn(vowel, variant)
+                        self.assertEqual(variant.replace(vowel, replacement), word)
+
+    def test_inverse_substitutions_of_every_occurence(self):
+        self.assertEqual(inverse_substitutions('eineinhalb', 'ää', 'ei'), {'äänäänhalb', 'ääneinhalb', 'einäänhalb'})
+        self.assertEqual(inverse_substitutions('halb', 'ää', 'ei'), set())
+
+    def test_same_candidate_as_the_rules(self):
+        words = set(self.corpus.vowel_index) | set(UNKNOWN) | set(word for pair in LEXICON for word in pair)
+        changed = 0
+        for word in sorted(words):
+            scanned = self.corpus.scan_vowel_table(word)
+            candidates = self.corpus.vowel_candidates(word)
+            if scanned is None:
+                self.assertEqual(candidates, [], word)
+            else:
+                changed += 1
+                self.assertEqual(candidates[0], scanned, word)
+        self.assertGreater(changed, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
 from dotenv import load_dotenv
 import psycopg2
+import argparse
+import io
+import time
 from pathlib import Path
+from update_spool import read_spool, SpoolReplaced
+import metrics
+import profiling
 env_path = Path('.') / '.env'
 load_dotenv(dotenv_path=env_path)
 import os
@@ -11,14 +17,19 @@ DATABASE_NAME = os.getenv("DATABASE_NAME")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 DATABASE_USER = os.getenv("DATABASE_USER")
 
+DB_WRITE_SECONDS = metrics.histogram('db_write_seconds', 'Time per committed chunk of updates')
+DB_ROWS_SUBMITTED = metrics.counter('db_rows_submitted_total', 'Token updates sent to the database')
+DB_ROWS_UPDATED = metrics.counter('db_rows_updated_total', 'Token rows changed in the database')
+DB_ROWS_PER_SECOND = metrics.gauge('db_rows_per_second', 'Token updates sent per second of database writing')
+
 # Open connection to the database
 def connectDB():
     print("Initializing connection to the database")
     try: 
-        conn = psycopg2.connect(host="dioedb.dioe.at",
-                            database="dioedb",
-                            port="54323",
-                            user="dioeuser",
+        conn = psycopg2.connect(host=DATABASE_HOST or "dioedb.dioe.at",
+                            database=DATABASE_NAME or "dioedb",
+                            port=DATABASE_PORT or "54323",
+                            user=DATABASE_USER or "dioeuser",
                             password=DATABASE_PASSWORD)
         print("Connecting to the PostgreSQL database...")
         return conn
@@ -32,40 +43,129 @@ def closeConnectionDB(conn):
         conn.close()
         print("PostgreSQL connection is closed")
 
-def readQueriesFromLog():
-    queries_file = open(".\Queries.log", "r", encoding="utf-8")
-    lines = queries_file.readlines()
-    queries = []
-    count = 1
-    for line in lines:
-        single_queries = line.replace('[\"', "").replace('\"]', "")
-        single_queries = single_queries.split('\", \"')
-        queries.extend(single_queries)
-        count += 1
+# Counts the rows of a committed write in the metrics
+def recordWrite(submitted, updated):
+    DB_ROWS_SUBMITTED.inc(submitted)
+    DB_ROWS_UPDATED.inc(updated)
+    DB_ROWS_PER_SECOND.set(DB_ROWS_SUBMITTED.value / DB_WRITE_SECONDS.sum if DB_WRITE_SECONDS.sum else 0)
+
+# Escapes a value for the text format of COPY
+def copyEscape(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+# Writes (token_id, ortho) pairs in bulk: each chunk is streamed via COPY into a temporary table
+# and applied with a single UPDATE ... FROM, one transaction (and one commit) per chunk.
+# Rows that already hold the ortho are not touched (no new row version, updated is kept).
+# flush writes and commits the buffered rows before the chunk is full, e.g. at a checkpoint of main.py.
+# chunk_size None or 0 buffers all updates until flush or close.
+# With record_writes, the text and the new ortho of each changed row are kept until pop_written,
+# main.py --incremental uses them to tell its own writes from the changes of others.
+class BulkUpdater:
+    def __init__(self, connection, chunk_size=50000, record_writes=False):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.record_writes = record_writes
+        self.cursor = connection.cursor()
+        self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS token_ortho_update (id integer, ortho text) ON COMMIT DELETE ROWS")
+        self.chunk = []
+        self.start = time.time()
+        self.count = 0 # updated rows
+        self.submitted = 0
+        self.written = {} # token id -> (text, ortho) of the rows changed by the committed chunks, with record_writes
+
+    def write(self, token_id, ortho):
+        self.chunk.append((token_id, ortho))
+        if self.chunk_size and len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk:
+            return
+
+        with DB_WRITE_SECONDS.time():
+            buffer = io.StringIO()
+            for token_id, ortho in self.chunk:
+                buffer.write(str(token_id) + "\t" + copyEscape(ortho) + "\n")
+            buffer.seek(0)
 
-    print("Number of tokens updated: ", len(queries))
-    return queries
+            self.cursor.copy_expert("COPY token_ortho_update (id, ortho) FROM STDIN", buffer)
+            update = "UPDATE token t SET ortho = u.ortho, updated = CURRENT_TIMESTAMP FROM token_ortho_update u WHERE t.id = u.id AND t.ortho IS DISTINCT FROM u.ortho"
+            self.cursor.execute(update + " RETURNING t.id, t.text, t.ortho" if self.record_writes else update)
+            updated = self.cursor.rowcount
+            changed = self.cursor.fetchall() if self.record_writes else []
+            self.count += updated
+            self.submitted += len(self.chunk)
+            self.connection.commit() # also empties the temporary table
+        self.written.update((token_id, (text, ortho)) for token_id, text, ortho in changed)
+        recordWrite(len(self.chunk), updated)
+        self.chunk = []
 
-def commitSingleQuery(query, connection):
-    cursor = connection.cursor()
-    cursor.execute(query)
-    connection.commit()
+        elapsed = time.time() - self.start
+        print(self.count, " tokens got updated so far (", round(self.submitted / elapsed if elapsed else 0), " rows/s)")
 
-def updateDB(queries, connection):
+    # Returns the rows changed since the last call, see written
+    def pop_written(self):
+        written, self.written = self.written, {}
+        return written
+
+    def close(self):
+        self.flush()
+        elapsed = time.time() - self.start
+        print("Number of tokens updated: ", self.count, " of ", self.submitted, " (", self.submitted - self.count, " unchanged) in ", round(elapsed, 2), "s (", round(self.submitted / elapsed if elapsed else 0), " rows/s)")
+
+# Writes (token_id, ortho) pairs in bulk, see BulkUpdater
+# Returns the number of updated rows.
+def bulkUpdateDB(updates, connection, chunk_size=50000):
+    updater = BulkUpdater(connection, chunk_size)
+    for token_id, ortho in updates:
+        updater.write(token_id, ortho)
+    updater.close()
+    return updater.count
+
+def commitSingleUpdate(token_id, ortho, connection):
+    with DB_WRITE_SECONDS.time():
+        cursor = connection.cursor()
+        cursor.execute("UPDATE token SET ortho = %s, updated = CURRENT_TIMESTAMP WHERE id = %s AND ortho IS DISTINCT FROM %s", (ortho, token_id, ortho))
+        connection.commit()
+    recordWrite(1, cursor.rowcount)
+
+def updateDB(updates, connection):
     count = 1
-    for query in queries:
-        commitSingleQuery(query, connection)
+    start = time.time()
+    for token_id, ortho in updates:
+        commitSingleUpdate(token_id, ortho, connection)
         count = count + 1
         if count % 10000 == 0:
-            print(count, " tokens got updated so far")
+            print(count, " tokens got updated so far (", round(count / (time.time() - start)), " rows/s)")
 
 def main():
+    parser = argparse.ArgumentParser(description="Writes the translated orthography into the token table")
+    parser.add_argument("--spool", default="./updates.spool.jsonl", help="spool file written by main.py")
+    parser.add_argument("--follow", action="store_true", help="wait for new records until main.py finished the spool, allows running both at the same time")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows per transaction of the bulk update, 0 writes everything in one transaction")
+    parser.add_argument("--per-statement", action="store_true", help="run and commit every UPDATE on its own instead of the bulk update")
+    parser.add_argument("--metrics", help="Prometheus text file the metrics are written to at the end")
+    parser.add_argument("--profile", metavar="PREFIX", help="run under the profiler and write PREFIX.pstats, PREFIX.txt, PREFIX.collapsed (flamegraph) and PREFIX.memory.txt (tracemalloc), see profiling.py")
+    args = parser.parse_args()
+
     print("seas")
 
-    connection = connectDB()
-    queries = readQueriesFromLog()
-    updateDB(queries, connection)
-    closeConnectionDB(connection)
+    with profiling.profile(args.profile):
+        connection = connectDB()
+        updates = ((token_id, ortho) for _, token_id, ortho in read_spool(args.spool, follow=args.follow))
+        try:
+            if args.per_statement:
+                updateDB(updates, connection)
+            else:
+                bulkUpdateDB(updates, connection, args.chunk_size)
+        except SpoolReplaced as error:
+            closeConnectionDB(connection)
+            parser.exit(1, str(error) + "\n")
+        closeConnectionDB(connection)
+
+    print(metrics.summary())
+    if args.metrics:
+        metrics.write_prometheus(args.metrics)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+import metrics
+
+"""This module provides the spool that transports the translated tokens from main.py to update_database.py.
+The spool is an append-only JSONL file, one record per token:
+
+[transcript_id, token_id, "ortho"]
+
+After the last record, the writer appends the end marker {"end": true}.
+The reader consumes the file as a stream in constant memory and can follow a spool that is still being written,
+thus the translation and the database update can run at the same time.
+
+A resumed run (main.py --resume) replaces the spool by a copy cut back to the last checkpoint, a new run replaces it by an empty file.
+A reader following the old spool stops with SpoolReplaced and has to be started again, it then reads the new spool from the beginning
+(the updates are idempotent, records applied twice do not change the database).
+"""
+
+END_MARKER = {"end": True}
+COPY_BLOCK_SIZE = 1 << 20 # bytes copied at once when a spool is cut back
+
+SPOOL_RECORDS = metrics.counter('spool_records_total', 'Token updates written to the spool')
+
+"""Appends update records to a spool file
+"""
+class SpoolWriter:
+    """Constructor for the SpoolWriter class
+
+    Parameters
+    ----------
+    path : str - the file location of the spool
+    append : bool - continue an existing spool instead of starting a new one
+    offset : int - with append, the spool is cut to this size first, e.g. to the last checkpoint of an interrupted run
+    """
+    def __init__(self, path, append=False, offset=None):
+        self.path = path
+        if not append:
+            self.cut(0)
+        elif offset is not None and os.path.exists(path):
+            self.cut(offset)
+        self.spool_file = open(path, 'a', encoding='utf-8')
+        self.count = 0
+
+    """Replaces the spool by a copy of its first offset bytes, an empty spool for offset 0.
+    The spool is not truncated in place, a following reader would go on reading at its old position in the continued spool.
+    The copy is a new file, the reader notices it (see read_spool).
+
+    Parameters
+    ----------
+    offset : int - the size of the cut spool
+    """
+    def cut(self, offset):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as copy_file:
+            if offset > 0:
+                with open(self.path, 'rb') as spool_file:
+                    remaining = offset
+                    while remaining > 0:
+                        block = spool_file.read(min(remaining, COPY_BLOCK_SIZE))
+                        if not block:
+                            break
+                        copy_file.write(block)
+                        remaining -= len(block)
+            copy_file.flush()
+            os.fsync(copy_file.fileno())
+        os.replace(temporary, self.path)
+
+    def write(self, transcript_id, token_id, ortho):
+        self.spool_file.write(json.dumps([transcript_id, token_id, ortho], ensure_ascii=False) + '\n')
+        self.count += 1
+        SPOOL_RECORDS.inc()
+
+    """Makes the written records durable and visible to a following reader, called e.g. after each transcript
+    """
+    def flush(self):
+        self.spool_file.flush()
+        os.fsync(self.spool_file.fileno())
+
+    """Returns the size of the spool in bytes, the offset of the next record
+    """
+    def tell(self):
+        return self.spool_file.tell()
+
+    """Closes the spool
+
+    Parameters
+    ----------
+    finished : bool - if True, the end marker is written and a following reader stops after the last record
+    """
+    def close(self, finished=True):
+        if finished:
+            self.spool_file.write(json.dumps(END_MARKER) + '\n')
+        self.flush()
+        self.spool_file.close()
+
+"""Raised by a reader following a spool that was replaced (a resumed or a new run) or truncated while it was read
+"""
+class SpoolReplaced(Exception):
+    pass
+
+"""Reads the records of a spool file one by one
+
+Parameters
+----------
+path : str - the file location of the spool
+follow : bool - wait for new records until the end marker is read (the spool is still being written)
+poll_interval : float - seconds to wait for new records in the follow mode
+
+Returns
+-------
+generator of (int, int, str)
+    (transcript_id, token_id, ortho) in the order they were written
+
+Raises
+------
+SpoolReplaced
+    in the follow mode, if the spool is replaced or truncated by another run of main.py, the reader has to be started again
+"""
+def read_spool(path, follow=False, poll_interval=1.0):
+    while follow and not os.path.exists(path):
+        time.sleep(poll_interval)
+
+    with open(path, 'rb') as spool_file:
+        pending = b''
+        while True:
+            line = spool_file.readline()
+            if not line or not line.endswith(b'\n'):
+                # end of the file or a record that is not completely written yet
+                pending += line
+                if not follow:
+                    break
+                check_spool(path, spool_file)
+                time.sleep(poll_interval)
+                continue
+
+            record = json.loads(pending + line)
+            pending = b''
+            if record == END_MARKER:
+                break
+            yield record[0], record[1], record[2]
+
+# raises SpoolReplaced if the path names another file than the one that is read, or if the file got shorter than the read position
+def check_spool(path, spool_file):
+    try:
+        replaced = os.stat(path).st_ino != os.fstat(spool_file.fileno()).st_ino
+    except FileNotFoundError:
+        replaced = True
+    if replaced or os.fstat(spool_file.fileno()).st_size < spool_file.tell():
+        raise SpoolReplaced('The spool ' + path + ' was replaced or truncated by another run of main.py (e.g. --resume), '
+                            'start update_database.py again to read it from the beginning')